@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from fastapi import HTTPException
+from loguru import logger
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+
+# Number of most recent queue waits used for percentiles
+WAIT_SAMPLES = 1000
+
+# Smoothing factor of the average calculation duration
+SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionController:
+    """Bounded admission of heavy calculations.
+
+    At most `max_active` calculations run at once and at most `max_per_client`
+    are in flight (running or queued) for one client. Further calculations wait
+    in a FIFO queue of `queue_size` for up to `queue_timeout` seconds. Requests
+    which cannot be admitted fail fast with 429 (client over its limit) or 503
+    (worker saturated) and a Retry-After estimated from the current backlog.
+    """
+
+    def __init__(
+        self,
+        max_active: int = 4,
+        max_per_client: int = 2,
+        queue_size: int = 8,
+        queue_timeout: float = 5.0,
+    ) -> None:
+        """Initialisation function
+
+        Args:
+            max_active (int): Maximum number of running calculations
+            max_per_client (int): Maximum number of running and queued calculations per client
+            queue_size (int): Maximum number of waiting calculations
+            queue_timeout (float): Maximum wait for a slot in seconds
+        Returns:
+            None
+        """
+
+        self.max_active = max_active
+        self.max_per_client = max_per_client
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._clients: dict[str, int] = {}
+        self._waiters: deque[asyncio.Future] = deque()
+        self._waits: deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._service_time: float | None = None
+        self.counters = {
+            "admitted": 0,
+            "queued_total": 0,
+            "rejected_client": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+        }
+
+    @staticmethod
+    def _client_key(client: str | None) -> str:
+        # raw tokens are never kept in memory or exposed in metrics
+        return hashlib.sha256(str(client).encode("utf-8")).hexdigest()[:16]
+
+    def _retry_after(self) -> int:
+        service_time = self._service_time or 1.0
+        backlog = self.active + len(self._waiters)
+        return max(1, math.ceil(service_time * backlog / self.max_active))
+
+    def _reject(self, status_code: int, msg: str, counter: str) -> HTTPException:
+        self.counters[counter] += 1
+        retry_after = self._retry_after()
+        logger.warning(
+            f"Calculation rejected with {status_code}: {msg}, "
+            f"active={self.active}, queued={len(self._waiters)}"
+        )
+        return http_exception(
+            status_code,
+            msg,
+            _detail={"retry_after": retry_after},
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # the slot is handed over, so the active count does not change
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _release_client(self, client: str) -> None:
+        count = self._clients[client] - 1
+        if count:
+            self._clients[client] = count
+        else:
+            del self._clients[client]
+
+    async def _acquire_slot(self) -> None:
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            self._waits.append(0.0)
+            return
+        if len(self._waiters) >= self.queue_size:
+            raise self._reject(503, "Calculation queue is full", "rejected_queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.counters["queued_total"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # slot was granted while the wait was being interrupted
+                self._release_slot()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(
+                    503, "Timed out waiting for a calculation slot", "rejected_timeout"
+                )
+            raise
+        finally:
+            self._waits.append(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def admit(self, client: str | None) -> AsyncIterator[None]:
+        """Function holds a calculation slot for the duration of the context
+
+        Args:
+            client (str | None): Client identity, e.g. bearer token
+        Raises:
+            HTTPException: 429 or 503 with Retry-After if calculation is not admitted
+        """
+
+        client = self._client_key(client)
+        if self._clients.get(client, 0) >= self.max_per_client:
+            raise self._reject(
+                429,
+                "Too many concurrent calculations for this client",
+                "rejected_client",
+            )
+        self._clients[client] = self._clients.get(client, 0) + 1
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            self._release_client(client)
+            raise
+
+        self.counters["admitted"] += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - started
+            self._service_time = (
+                duration
+                if self._service_time is None
+                else SERVICE_TIME_ALPHA * duration
+                + (1 - SERVICE_TIME_ALPHA) * self._service_time
+            )
+            self._release_slot()
+            self._release_client(client)
+
+    async def run(self, client: str | None, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Function runs calculation once it is admitted
+
+        Args:
+            client (str | None): Client identity, e.g. bearer token
+            func (Callable[[], Awaitable[Any]]): Calculation
+        Returns:
+            Any: Calculation result
+        Raises:
+            HTTPException: 429 or 503 with Retry-After if calculation is not admitted
+        """
+
+        async with self.admit(client):
+            return await func()
+
+    def saturated(self) -> bool:
+        """Function checks if new calculations would be rejected with 503
+
+        Returns:
+            bool: True if the wait queue is full
+        """
+
+        return len(self._waiters) >= self.queue_size
+
+    def metrics(self) -> dict:
+        """Function returns admission limits, current load and queue statistics
+
+        Returns:
+            dict: Admission metrics
+        """
+
+        waits = sorted(self._waits)
+
+        def percentile(q: float) -> float | None:
+            if not waits:
+                return None
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 4)
+
+        return {
+            "limits": {
+                "max_active": self.max_active,
+                "max_per_client": self.max_per_client,
+                "queue_size": self.queue_size,
+                "queue_timeout": self.queue_timeout,
+            },
+            "active": self.active,
+            "queued": len(self._waiters),
+            "clients": len(self._clients),
+            "service_time_avg": (
+                round(self._service_time, 4) if self._service_time is not None else None
+            ),
+            "queue_wait_p50": percentile(0.5),
+            "queue_wait_p99": percentile(0.99),
+            "queue_wait_max": round(waits[-1], 4) if waits else None,
+            **self.counters,
+        }
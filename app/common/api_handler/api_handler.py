@@ -1,6 +1,14 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator
+
 import aiohttp
+import ijson
 
+from app.common.deadline.deadline import check_deadline, remaining
 from app.common.exceptions.http_exception_wrapper import http_exception
+from app.common.tracing.tracing import Span, Tracer
 
 
 class APIHandler:
@@ -8,16 +16,59 @@ class APIHandler:
     def __init__(
         self,
         base_url: str,
+        tracer: Tracer | None = None,
+        timeout: float | None = None,
     ) -> None:
         """Initialisation function
 
         Args:
             base_url (str): Base api url
+            tracer (Tracer | None): Tracer recording a span of every call
+            timeout (float | None): Maximum duration of a call in seconds, further
+                limited by the deadline of the current request
         Returns:
             None
         """
 
         self.base_url = base_url
+        self.tracer = tracer or Tracer(enabled=False)
+        self.timeout = timeout
+        self.timeouts = 0
+
+    @contextmanager
+    def _call(
+        self, method: str, endpoint_url: str, detached: bool = False
+    ) -> Iterator[Span]:
+        """Function wraps a call into a span and reports timeouts as 504
+
+        Args:
+            method (str): HTTP method
+            endpoint_url (str): Endpoint url
+            detached (bool): Span of a streamed call, see Tracer.span
+        Returns:
+            Iterator[Span]: span of the call
+        Raises:
+            http_exception 504 when the call or the request deadline timed out
+        """
+
+        check_deadline("urban_api")
+        with self.tracer.span(
+            "urban_api", detached=detached, method=method, endpoint=endpoint_url
+        ) as span:
+            try:
+                yield span
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                check_deadline()
+                raise http_exception(
+                    504,
+                    "Urban API request timed out",
+                    _input=self.base_url + endpoint_url,
+                    _detail={"timeout": self.timeout},
+                )
+
+    def _client_timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=remaining(self.timeout))
 
     @staticmethod
     async def _check_response_status(
@@ -83,24 +134,133 @@ class APIHandler:
                     session=session,
                 )
         url = self.base_url + endpoint_url
-        async with session.get(url=url, headers=headers, params=params) as response:
-            result = await self._check_response_status(response)
-            if isinstance(result, list):
-                return result
-            elif isinstance(result, dict):
-                return result
-            if not result:
+        with self._call("GET", endpoint_url) as span:
+            async with session.get(
+                url=url,
+                headers=self.tracer.inject(headers),
+                params=params,
+                timeout=self._client_timeout(),
+            ) as response:
+                span.set(status=response.status)
+                result = await self._check_response_status(response)
                 if isinstance(result, list):
                     return result
                 elif isinstance(result, dict):
                     return result
-                return await self.get(
+                if not result:
+                    if isinstance(result, list):
+                        return result
+                    elif isinstance(result, dict):
+                        return result
+                    return await self.get(
+                        endpoint_url=endpoint_url,
+                        headers=headers,
+                        params=params,
+                        session=session,
+                    )
+                return result
+
+    async def get_items_stream(
+        self,
+        endpoint_url: str,
+        prefix: str,
+        headers: dict | None = None,
+        params: dict | None = None,
+        batch_size: int = 1000,
+        session: aiohttp.ClientSession | None = None,
+    ) -> AsyncIterator[list]:
+        """Function to get array items from api without decoding the whole body
+
+        Items are decoded incrementally while the body is read, only one batch of
+        them is held in memory at a time.
+
+        Args:
+            endpoint_url (str): Endpoint url
+            prefix (str): ijson path of the array items, e.g. "features.item"
+            headers (dict | None): Headers
+            params (dict | None): Query parameters
+            batch_size (int): Number of items per yielded batch
+            session (aiohttp.ClientSession | None): Session to use
+        Returns:
+            AsyncIterator[list]: Batches of decoded items
+        """
+
+        if not session:
+            async with aiohttp.ClientSession() as session:
+                async for batch in self.get_items_stream(
                     endpoint_url=endpoint_url,
+                    prefix=prefix,
                     headers=headers,
                     params=params,
+                    batch_size=batch_size,
                     session=session,
-                )
-            return result
+                ):
+                    yield batch
+            return
+        url = self.base_url + endpoint_url
+        with self._call("GET", endpoint_url, detached=True) as span:
+            async with session.get(
+                url=url,
+                headers=self.tracer.inject(headers),
+                params=params,
+                timeout=self._client_timeout(),
+            ) as response:
+                span.set(status=response.status)
+                if response.status not in (200, 201):
+                    # raises for error statuses, returns None for connection resets
+                    await self._check_response_status(response)
+                    async for batch in self.get_items_stream(
+                        endpoint_url=endpoint_url,
+                        prefix=prefix,
+                        headers=self.tracer.inject(headers),
+                        params=params,
+                        batch_size=batch_size,
+                        session=session,
+                    ):
+                        yield batch
+                    return
+                batch = []
+                async for item in ijson.items_async(
+                    response.content, prefix, use_float=True
+                ):
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+
+    async def ping(self, endpoint_url: str = "", timeout: float = 2.0) -> dict:
+        """Function checks api reachability
+
+        Args:
+            endpoint_url (str): Endpoint url to request
+            timeout (float): Request timeout in seconds
+        Returns:
+            dict: {"reachable": bool, "status": int | None, "latency": float, "error": str | None}
+        """
+
+        url = self.base_url + endpoint_url
+        started = time.monotonic()
+        try:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as session:
+                async with session.get(url=url) as response:
+                    status = response.status
+            return {
+                "reachable": status < 500,
+                "status": status,
+                "latency": round(time.monotonic() - started, 4),
+                "error": None,
+            }
+        except Exception as e:
+            return {
+                "reachable": False,
+                "status": None,
+                "latency": round(time.monotonic() - started, 4),
+                "error": repr(e),
+            }
 
     async def post(
         self,
@@ -132,21 +292,24 @@ class APIHandler:
                     session=session,
                 )
         url = self.base_url + endpoint_url
-        async with session.post(
-            url=url,
-            headers=headers,
-            params=params,
-            data=data,
-        ) as response:
-            result = await self._check_response_status(response)
-            if not result:
-                return await self.post(
-                    endpoint_url=endpoint_url,
-                    headers=headers,
-                    params=params,
-                    session=session,
-                )
-            return result
+        with self._call("POST", endpoint_url) as span:
+            async with session.post(
+                url=url,
+                headers=self.tracer.inject(headers),
+                params=params,
+                data=data,
+                timeout=self._client_timeout(),
+            ) as response:
+                span.set(status=response.status)
+                result = await self._check_response_status(response)
+                if not result:
+                    return await self.post(
+                        endpoint_url=endpoint_url,
+                        headers=headers,
+                        params=params,
+                        session=session,
+                    )
+                return result
 
     async def put(
         self,
@@ -178,21 +341,24 @@ class APIHandler:
                     session=session,
                 )
         url = self.base_url + endpoint_url
-        async with session.put(
-            url=url,
-            headers=headers,
-            params=params,
-            data=data,
-        ) as response:
-            result = await self._check_response_status(response)
-            if not result:
-                return await self.put(
-                    endpoint_url=endpoint_url,
-                    headers=headers,
-                    params=params,
-                    session=session,
-                )
-            return result
+        with self._call("PUT", endpoint_url) as span:
+            async with session.put(
+                url=url,
+                headers=self.tracer.inject(headers),
+                params=params,
+                data=data,
+                timeout=self._client_timeout(),
+            ) as response:
+                span.set(status=response.status)
+                result = await self._check_response_status(response)
+                if not result:
+                    return await self.put(
+                        endpoint_url=endpoint_url,
+                        headers=headers,
+                        params=params,
+                        session=session,
+                    )
+                return result
 
     async def delete(
         self,
@@ -224,18 +390,21 @@ class APIHandler:
                     session=session,
                 )
         url = self.base_url + endpoint_url
-        async with session.delete(
-            url=url,
-            headers=headers,
-            params=params,
-            data=data,
-        ) as response:
-            result = await self._check_response_status(response)
-            if not result:
-                return await self.delete(
-                    endpoint_url=endpoint_url,
-                    headers=headers,
-                    params=params,
-                    session=session,
-                )
-            return result
+        with self._call("DELETE", endpoint_url) as span:
+            async with session.delete(
+                url=url,
+                headers=self.tracer.inject(headers),
+                params=params,
+                data=data,
+                timeout=self._client_timeout(),
+            ) as response:
+                span.set(status=response.status)
+                result = await self._check_response_status(response)
+                if not result:
+                    return await self.delete(
+                        endpoint_url=endpoint_url,
+                        headers=headers,
+                        params=params,
+                        session=session,
+                    )
+                return result
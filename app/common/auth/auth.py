@@ -1,6 +1,10 @@
+import hmac
+
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from app.dependencies import get_setting
+
 http_bearer = HTTPBearer()
 
 
@@ -25,3 +29,33 @@ async def verify_token(
     credentials: HTTPAuthorizationCredentials = Depends(http_bearer),
 ):
     return _get_token_from_header(credentials)
+
+
+async def verify_webhook_token(
+    credentials: HTTPAuthorizationCredentials = Depends(http_bearer),
+) -> str:
+    """Check that request carries the shared WEBHOOK_TOKEN secret"""
+
+    token = _get_token_from_header(credentials)
+    webhook_token = get_setting("WEBHOOK_TOKEN")
+    if not webhook_token:
+        raise HTTPException(status_code=503, detail="Webhook is not configured")
+    if not hmac.compare_digest(token.encode("utf-8"), webhook_token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid webhook token")
+    return token
+
+
+async def verify_traces_token(
+    credentials: HTTPAuthorizationCredentials = Depends(http_bearer),
+) -> str:
+    """Check that request carries the shared TRACES_TOKEN secret"""
+
+    token = _get_token_from_header(credentials)
+    traces_token = get_setting("TRACES_TOKEN")
+    if not traces_token:
+        raise HTTPException(
+            status_code=503, detail="Trace inspection is not configured"
+        )
+    if not hmac.compare_digest(token.encode("utf-8"), traces_token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid traces token")
+    return token
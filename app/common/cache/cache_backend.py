@@ -0,0 +1,35 @@
+from abc import ABC, abstractmethod
+from typing import Any
+
+
+class CacheBackend(ABC):
+    """Interface of cache stores.
+
+    Keys are strings, values are arbitrary Python objects. Out-of-process
+    backends pickle values, so cached values must be picklable and must not be
+    modified in place after they are stored.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Any | None:
+        """Function returns cached value, None if missing or expired"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Function stores value, `ttl` defaults to the cache ttl"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Function removes value"""
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str) -> int:
+        """Function removes all values with keys starting with prefix, returns their number"""
+
+    @abstractmethod
+    async def keys(self, prefix: str = "") -> list[str]:
+        """Function returns keys starting with prefix"""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Function removes all values"""
@@ -0,0 +1,176 @@
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.common.cache.cache_backend import CacheBackend
+
+
+class DiskCache(CacheBackend):
+    """LRU cache in a local SQLite file shared by all workers of the host.
+
+    Placing the file on a memory-backed filesystem (e.g. /dev/shm) turns it into
+    a shared-memory store. Values are pickled, database calls run in the threadpool.
+    """
+
+    def __init__(
+        self, path: str | Path, max_items: int = 128, ttl: float | None = None
+    ) -> None:
+        """Initialisation function
+
+        Args:
+            path (str | Path): Database file path
+            max_items (int): Maximum number of stored entries
+            ttl (float | None): Default time to live in seconds, None for no expiration
+        Returns:
+            None
+        """
+
+        self.path = Path(path)
+        self.max_items = max_items
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)"
+            )
+
+    def _get(self, key: str) -> bytes | None:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._connection.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return value
+
+    def _set(self, key: str, value: bytes, ttl: float | None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now),
+                )
+                self._connection.execute(
+                    "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                    (now,),
+                )
+                self._connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                    "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_items,),
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            return self._connection.execute(sql, params).rowcount
+
+    def _keys(self, prefix: str) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key FROM cache WHERE substr(key, 1, ?) = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (len(prefix), prefix, time.time()),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    async def get(self, key: str) -> Any | None:
+        """Function returns cached value
+
+        Args:
+            key (str): Cache key
+        Returns:
+            Any | None: Cached value or None if missing or expired
+        """
+
+        value = await run_in_threadpool(self._get, key)
+        if value is None:
+            return None
+        return await run_in_threadpool(pickle.loads, value)
+
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Function stores value in cache
+
+        Args:
+            key (str): Cache key
+            value (Any): Picklable value to store
+            ttl (float | None): Time to live in seconds, defaults to cache ttl
+        Returns:
+            None
+        """
+
+        data = await run_in_threadpool(pickle.dumps, value, pickle.HIGHEST_PROTOCOL)
+        await run_in_threadpool(self._set, key, data, self.ttl if ttl is None else ttl)
+
+    async def delete(self, key: str) -> None:
+        """Function removes value from cache
+
+        Args:
+            key (str): Cache key
+        Returns:
+            None
+        """
+
+        await run_in_threadpool(
+            self._execute, "DELETE FROM cache WHERE key = ?", (key,)
+        )
+
+    async def delete_prefix(self, prefix: str) -> int:
+        """Function removes all values with keys starting with prefix
+
+        Args:
+            prefix (str): Cache key prefix
+        Returns:
+            int: Number of removed entries
+        """
+
+        return await run_in_threadpool(
+            self._execute,
+            "DELETE FROM cache WHERE substr(key, 1, ?) = ?",
+            (len(prefix), prefix),
+        )
+
+    async def keys(self, prefix: str = "") -> list[str]:
+        """Function returns keys of not expired values starting with prefix
+
+        Args:
+            prefix (str): Cache key prefix
+        Returns:
+            list[str]: Cache keys
+        """
+
+        return await run_in_threadpool(self._keys, prefix)
+
+    async def clear(self) -> None:
+        """Function removes all values from cache"""
+
+        await run_in_threadpool(self._execute, "DELETE FROM cache", ())
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import weakref
+from typing import Any
+
+import pandas as pd
+import shapely
+from geopandas.array import GeometryDtype
+
+# id(frame) -> (weak reference, digest); frames are treated as immutable once hashed
+_frame_digests: dict[int, tuple[weakref.ref, str]] = {}
+
+
+def _frame_digest(df: pd.DataFrame) -> str:
+    memo = _frame_digests.get(id(df))
+    if memo is not None and memo[0]() is df:
+        return memo[1]
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(list(map(str, df.columns))).encode("utf-8"))
+    geometry_columns = [
+        col for col in df.columns if isinstance(df[col].dtype, GeometryDtype)
+    ]
+    attributes = df.drop(columns=geometry_columns)
+    if len(attributes.columns):
+        try:
+            hashed = pd.util.hash_pandas_object(attributes, index=True)
+        except TypeError:
+            # unhashable cells (dicts, lists) are hashed by their text form
+            hashed = pd.util.hash_pandas_object(attributes.astype(str), index=True)
+        h.update(hashed.values.tobytes())
+    else:
+        h.update(pd.util.hash_pandas_object(df.index).values.tobytes())
+    for col in geometry_columns:
+        for wkb in shapely.to_wkb(df[col].values):
+            h.update(wkb if wkb is not None else b"\x00")
+    crs = getattr(df, "crs", None)
+    h.update(str(crs.to_epsg() if crs is not None else None).encode("utf-8"))
+    digest = h.hexdigest()
+
+    key = id(df)
+    _frame_digests[key] = (
+        weakref.ref(df, lambda _ref, key=key: _frame_digests.pop(key, None)),
+        digest,
+    )
+    return digest
+
+
+def fingerprint(*parts: Any) -> str:
+    """Function builds content hash of the given parts
+
+    DataFrames and GeoDataFrames are hashed by their values and geometries, the
+    digest is memoised per object, so large upstream layers are hashed once.
+    Everything else is hashed by its canonical JSON representation.
+
+    Args:
+        *parts (Any): Values to hash
+    Returns:
+        str: Hex digest
+    """
+
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            h.update(b"frame:" + _frame_digest(part).encode("utf-8"))
+        elif isinstance(part, bytes):
+            h.update(b"bytes:" + part)
+        else:
+            h.update(
+                b"json:" + json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+            )
+        h.update(b"|")
+    return h.hexdigest()
@@ -0,0 +1,112 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.common.cache.cache_backend import CacheBackend
+
+
+class LRUCache(CacheBackend):
+    """In-process LRU cache with per-entry expiration.
+
+    Values are stored as is, without pickling, so materialised objects such as
+    frames with built spatial indexes can be cached.
+    """
+
+    def __init__(self, max_items: int = 128, ttl: float | None = None) -> None:
+        """Initialisation function
+
+        Args:
+            max_items (int): Maximum number of stored entries
+            ttl (float | None): Default time to live in seconds, None for no expiration
+        Returns:
+            None
+        """
+
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+
+    def _expired(self, expires_at: float | None) -> bool:
+        return expires_at is not None and expires_at <= time.monotonic()
+
+    async def get(self, key: str) -> Any | None:
+        """Function returns cached value
+
+        Args:
+            key (str): Cache key
+        Returns:
+            Any | None: Cached value or None if missing or expired
+        """
+
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if self._expired(expires_at):
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Function stores value in cache
+
+        Args:
+            key (str): Cache key
+            value (Any): Value to store
+            ttl (float | None): Time to live in seconds, defaults to cache ttl
+        Returns:
+            None
+        """
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        """Function removes value from cache
+
+        Args:
+            key (str): Cache key
+        Returns:
+            None
+        """
+
+        self._data.pop(key, None)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        """Function removes all values with keys starting with prefix
+
+        Args:
+            prefix (str): Cache key prefix
+        Returns:
+            int: Number of removed entries
+        """
+
+        keys = [key for key in self._data if key.startswith(prefix)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    async def keys(self, prefix: str = "") -> list[str]:
+        """Function returns keys of not expired values starting with prefix
+
+        Args:
+            prefix (str): Cache key prefix
+        Returns:
+            list[str]: Cache keys
+        """
+
+        return [
+            key
+            for key, (expires_at, _) in self._data.items()
+            if key.startswith(prefix) and not self._expired(expires_at)
+        ]
+
+    async def clear(self) -> None:
+        """Function removes all values from cache"""
+
+        self._data.clear()
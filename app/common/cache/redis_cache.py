@@ -0,0 +1,146 @@
+import pickle
+import re
+from typing import Any
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.common.cache.cache_backend import CacheBackend
+
+# Batch size of SCAN and DEL calls in prefix operations
+SCAN_COUNT = 500
+
+
+class RedisCache(CacheBackend):
+    """Cache in a Redis-protocol server (Redis, Valkey, KeyDB, ...) shared by all workers.
+
+    Keys are stored under `namespace`, values are pickled. Eviction is left to the
+    server maxmemory policy, entries expire with the cache ttl. Any client with
+    the redis.asyncio interface can be passed, e.g. fakeredis in tests.
+    """
+
+    def __init__(
+        self, client: Any, ttl: float | None = None, namespace: str = "urbanomy:"
+    ) -> None:
+        """Initialisation function
+
+        Args:
+            client (Any): redis.asyncio compatible client
+            ttl (float | None): Default time to live in seconds, None for no expiration
+            namespace (str): Prefix of all keys of this cache
+        Returns:
+            None
+        """
+
+        self.client = client
+        self.ttl = ttl
+        self.namespace = namespace
+
+    @classmethod
+    def from_url(
+        cls, url: str, ttl: float | None = None, namespace: str = "urbanomy:"
+    ) -> "RedisCache":
+        """Function creates cache connected to server url
+
+        Args:
+            url (str): Server url, e.g. redis://localhost:6379/0
+            ttl (float | None): Default time to live in seconds
+            namespace (str): Prefix of all keys of this cache
+        Returns:
+            RedisCache: Cache
+        """
+
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("redis package is required for Redis cache") from e
+        return cls(redis.from_url(url), ttl=ttl, namespace=namespace)
+
+    def _pattern(self, prefix: str) -> str:
+        return re.sub(r"([*?\[\]\\])", r"\\\1", self.namespace + prefix) + "*"
+
+    async def _scan(self, prefix: str) -> list[bytes]:
+        return [
+            key
+            async for key in self.client.scan_iter(
+                match=self._pattern(prefix), count=SCAN_COUNT
+            )
+        ]
+
+    async def get(self, key: str) -> Any | None:
+        """Function returns cached value
+
+        Args:
+            key (str): Cache key
+        Returns:
+            Any | None: Cached value or None if missing or expired
+        """
+
+        value = await self.client.get(self.namespace + key)
+        if value is None:
+            return None
+        return await run_in_threadpool(pickle.loads, value)
+
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Function stores value in cache
+
+        Args:
+            key (str): Cache key
+            value (Any): Picklable value to store
+            ttl (float | None): Time to live in seconds, defaults to cache ttl
+        Returns:
+            None
+        """
+
+        ttl = self.ttl if ttl is None else ttl
+        data = await run_in_threadpool(pickle.dumps, value, pickle.HIGHEST_PROTOCOL)
+        await self.client.set(
+            self.namespace + key,
+            data,
+            px=max(1, int(ttl * 1000)) if ttl is not None else None,
+        )
+
+    async def delete(self, key: str) -> None:
+        """Function removes value from cache
+
+        Args:
+            key (str): Cache key
+        Returns:
+            None
+        """
+
+        await self.client.delete(self.namespace + key)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        """Function removes all values with keys starting with prefix
+
+        Args:
+            prefix (str): Cache key prefix
+        Returns:
+            int: Number of removed entries
+        """
+
+        keys = await self._scan(prefix)
+        removed = 0
+        for i in range(0, len(keys), SCAN_COUNT):
+            removed += await self.client.delete(*keys[i : i + SCAN_COUNT])
+        return removed
+
+    async def keys(self, prefix: str = "") -> list[str]:
+        """Function returns keys starting with prefix
+
+        Args:
+            prefix (str): Cache key prefix
+        Returns:
+            list[str]: Cache keys
+        """
+
+        offset = len(self.namespace)
+        return [
+            (key.decode("utf-8") if isinstance(key, bytes) else key)[offset:]
+            for key in await self._scan(prefix)
+        ]
+
+    async def clear(self) -> None:
+        """Function removes all values from cache"""
+
+        await self.delete_prefix("")
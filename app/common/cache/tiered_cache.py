@@ -0,0 +1,101 @@
+from typing import Any
+
+from app.common.cache.cache_backend import CacheBackend
+from app.common.cache.lru_cache import LRUCache
+
+
+class TieredCache(CacheBackend):
+    """In-process LRU in front of a shared cache backend.
+
+    Hits of the local tier cost no unpickling and return the same object, so
+    per-object memos (e.g. frame fingerprints) keep working. Local entries live at
+    most the local tier ttl, which bounds how long a worker can serve values
+    another worker has already invalidated in the shared tier.
+    """
+
+    def __init__(self, local: LRUCache, shared: CacheBackend) -> None:
+        """Initialisation function
+
+        Args:
+            local (LRUCache): Per-worker cache
+            shared (CacheBackend): Cache shared between workers
+        Returns:
+            None
+        """
+
+        self.local = local
+        self.shared = shared
+
+    async def get(self, key: str) -> Any | None:
+        """Function returns cached value from the local tier, then the shared one
+
+        Args:
+            key (str): Cache key
+        Returns:
+            Any | None: Cached value or None if missing or expired
+        """
+
+        value = await self.local.get(key)
+        if value is None:
+            value = await self.shared.get(key)
+            if value is not None:
+                await self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Function stores value in both tiers
+
+        Args:
+            key (str): Cache key
+            value (Any): Picklable value to store
+            ttl (float | None): Time to live in seconds, defaults to cache ttl
+        Returns:
+            None
+        """
+
+        local_ttl = self.local.ttl
+        if ttl is not None and (local_ttl is None or ttl < local_ttl):
+            local_ttl = ttl
+        await self.local.set(key, value, local_ttl)
+        await self.shared.set(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        """Function removes value from both tiers
+
+        Args:
+            key (str): Cache key
+        Returns:
+            None
+        """
+
+        await self.local.delete(key)
+        await self.shared.delete(key)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        """Function removes all values with keys starting with prefix from both tiers
+
+        Args:
+            prefix (str): Cache key prefix
+        Returns:
+            int: Number of removed shared entries
+        """
+
+        await self.local.delete_prefix(prefix)
+        return await self.shared.delete_prefix(prefix)
+
+    async def keys(self, prefix: str = "") -> list[str]:
+        """Function returns keys of the shared tier starting with prefix
+
+        Args:
+            prefix (str): Cache key prefix
+        Returns:
+            list[str]: Cache keys
+        """
+
+        return await self.shared.keys(prefix)
+
+    async def clear(self) -> None:
+        """Function removes all values from both tiers"""
+
+        await self.local.clear()
+        await self.shared.clear()
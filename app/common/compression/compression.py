@@ -0,0 +1,233 @@
+import json
+import zlib
+from typing import Any
+
+import brotli
+import zstandard
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+from app.common.conditional.conditional import (etag_matches, make_etag,
+                                                not_modified)
+
+# Server preference order, used to break ties between equal client q-values
+SUPPORTED_ENCODINGS = ("zstd", "br", "gzip")
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+# Bodies below this size are not worth compressing
+MINIMUM_SIZE = 100
+
+# Bodies above this size are compressed in the threadpool instead of the event loop
+OFFLOAD_MIN_SIZE = 64 * 1024
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Function selects the best supported content encoding
+
+    Args:
+        accept_encoding (str | None): Value of Accept-Encoding request header
+    Returns:
+        str | None: Encoding name or None if the body should be sent as is
+    """
+
+    if not accept_encoding:
+        return None
+
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    wildcard = weights.get("*")
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, wildcard)
+        if q is not None and q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Function compresses body in one shot
+
+    Args:
+        body (bytes): Raw body
+        encoding (str): One of SUPPORTED_ENCODINGS
+    Returns:
+        bytes: Compressed body
+    """
+
+    if encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(body) + compressor.flush()
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+async def compress_async(body: bytes, encoding: str) -> bytes:
+    """Function compresses body, moving large bodies off the event loop
+
+    Args:
+        body (bytes): Raw body
+        encoding (str): One of SUPPORTED_ENCODINGS
+    Returns:
+        bytes: Compressed body
+    """
+
+    if len(body) >= OFFLOAD_MIN_SIZE:
+        return await run_in_threadpool(compress, body, encoding)
+    return compress(body, encoding)
+
+
+class StreamCompressor:
+    """Incremental compressor for streamed response bodies."""
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk)
+        return self._compressor.compress(chunk)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def serialize_json(content: Any) -> bytes:
+    """Function serialises content the same way JSONResponse does
+
+    Args:
+        content (Any): Response content
+    Returns:
+        bytes: UTF-8 encoded JSON
+    """
+
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class EncodedPayload:
+    """Serialised response body together with its compressed variants.
+
+    Instances are stored in result caches, so every encoding of a result
+    is computed at most once and repeated hits are served as stored bytes.
+    """
+
+    def __init__(
+        self,
+        body: bytes,
+        media_type: str = "application/json",
+        etag: str | None = None,
+    ) -> None:
+        self.body = body
+        self.media_type = media_type
+        self.variants: dict[str, bytes] = {}
+        self._etag = etag
+
+    @property
+    def etag(self) -> str:
+        """Entity tag given on creation, otherwise derived from the body once"""
+
+        if self._etag is None:
+            self._etag = make_etag(self.body)
+        return self._etag
+
+    @classmethod
+    async def from_content(
+        cls, content: Any, etag: str | None = None
+    ) -> "EncodedPayload":
+        """Function serialises content in the threadpool
+
+        Args:
+            content (Any): JSON-compatible response content
+            etag (str | None): Entity tag, derived from the body if not given
+        Returns:
+            EncodedPayload: Payload with raw body
+        """
+
+        body = await run_in_threadpool(serialize_json, content)
+        return cls(body, etag=etag)
+
+    async def get_variant(self, encoding: str) -> bytes:
+        """Function returns compressed body, compressing it on first use
+
+        Args:
+            encoding (str): One of SUPPORTED_ENCODINGS
+        Returns:
+            bytes: Compressed body
+        """
+
+        variant = self.variants.get(encoding)
+        if variant is None:
+            variant = await compress_async(self.body, encoding)
+            self.variants[encoding] = variant
+        return variant
+
+    async def to_response(
+        self,
+        request: Request,
+        status_code: int = 200,
+        headers: dict[str, str] | None = None,
+        conditional: bool = False,
+    ) -> Response:
+        """Function builds response negotiated with request Accept-Encoding
+
+        Args:
+            request (Request): Incoming request
+            status_code (int): Response status code
+            headers (dict[str, str] | None): Additional response headers
+            conditional (bool): Send ETag and answer matching If-None-Match with 304
+        Returns:
+            Response: Response with raw or precompressed body
+        """
+
+        response_headers = {"Vary": "Accept-Encoding", **(headers or {})}
+        if conditional:
+            if etag_matches(request, self.etag):
+                return not_modified(self.etag, response_headers)
+            response_headers["ETag"] = self.etag
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        body = self.body
+        if encoding is not None and len(body) >= MINIMUM_SIZE:
+            body = await self.get_variant(encoding)
+            response_headers["Content-Encoding"] = encoding
+        return Response(
+            content=body,
+            status_code=status_code,
+            headers=response_headers,
+            media_type=self.media_type,
+        )
@@ -0,0 +1,54 @@
+import hashlib
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts: bytes | str) -> str:
+    """Function builds strong entity tag from content parts
+
+    Args:
+        *parts (bytes | str): Body bytes or digests identifying the representation
+    Returns:
+        str: Quoted entity tag
+    """
+
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else part.encode("utf-8"))
+        h.update(b"|")
+    return f'"{h.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Function checks If-None-Match request header against entity tag
+
+    Comparison is weak as required for If-None-Match, so W/ prefixed tags added
+    by intermediaries still match.
+
+    Args:
+        request (Request): Incoming request
+        etag (str): Quoted entity tag of the current representation
+    Returns:
+        bool: True if the client already has the current representation
+    """
+
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in tags:
+        return True
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+def not_modified(etag: str, headers: dict[str, str] | None = None) -> Response:
+    """Function builds 304 response carrying the validator and caching headers
+
+    Args:
+        etag (str): Quoted entity tag
+        headers (dict[str, str] | None): Headers the full response would carry
+    Returns:
+        Response: Empty 304 response
+    """
+
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
@@ -0,0 +1,205 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+
+# Header clients may use to ask for a shorter deadline, in seconds
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+# Status of requests abandoned by the client (nginx convention), never seen by clients
+CLIENT_CLOSED_REQUEST = 499
+
+_current: ContextVar["Deadline | None"] = ContextVar("request_deadline", default=None)
+
+
+class Deadline:
+    """Time budget of one request.
+
+    Work checks the budget at stage boundaries with `check`, which also records
+    the stage the request is in, so expirations are attributed to stages.
+    A cancelled (client disconnected) or expired deadline fails the next check.
+    Once the response is complete the deadline is finished and no longer limits
+    work left in its context, e.g. background tasks.
+    """
+
+    __slots__ = ("budget", "expires", "stage", "reason", "finished", "_owner")
+
+    def __init__(self, budget: float, owner: "RequestDeadlines | None" = None) -> None:
+        self.budget = budget
+        self.expires = time.monotonic() + budget
+        self.stage = "request"
+        self.reason: str | None = None
+        self.finished = False
+        self._owner = owner
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def cancel(self, reason: str) -> None:
+        """Function marks the request as abandoned, `reason` is deadline or disconnect"""
+
+        if self.reason is None:
+            self.reason = reason
+            if self._owner is not None:
+                self._owner.record(reason, self.stage)
+
+    def finish(self) -> None:
+        """Function ends the budget, later checks pass and add no time limit"""
+
+        self.finished = True
+
+    def check(self, stage: str | None = None) -> None:
+        """Function fails if the request was abandoned or its deadline passed
+
+        Args:
+            stage (str | None): Stage about to start, kept for metrics
+        Returns:
+            None
+        Raises:
+            http_exception 504 when the deadline passed, 499 when the client disconnected
+        """
+
+        if stage is not None:
+            self.stage = stage
+        if self.finished:
+            return
+        if self.reason is None and time.monotonic() >= self.expires:
+            self.cancel("deadline")
+        if self.reason == "deadline":
+            raise http_exception(
+                504,
+                "Request deadline exceeded",
+                self.stage,
+                {"budget": self.budget},
+            )
+        if self.reason == "disconnect":
+            raise http_exception(
+                CLIENT_CLOSED_REQUEST, "Client closed request", self.stage
+            )
+
+
+def current_deadline() -> Deadline | None:
+    return _current.get()
+
+
+def use_deadline(deadline: Deadline) -> None:
+    """Function makes the deadline current in the calling context (task)"""
+
+    _current.set(deadline)
+
+
+def remaining(default: float | None = None) -> float | None:
+    """Function returns seconds left of the current request budget
+
+    Args:
+        default (float | None): Cap applied also outside of requests
+    Returns:
+        float | None: smallest of the remaining budget and default, None if neither is set
+    """
+
+    deadline = _current.get()
+    if deadline is None or deadline.finished:
+        return default
+    if default is None:
+        return deadline.remaining()
+    return min(default, deadline.remaining())
+
+
+def check_deadline(stage: str | None = None) -> None:
+    """Function checks the current request budget, no-op outside of requests"""
+
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+class RequestDeadlines:
+    """Per-endpoint request deadlines and their metrics.
+
+    Every request gets `default` seconds unless an override is configured for the
+    longest matching path prefix. Clients may ask for a shorter budget with the
+    X-Request-Timeout header, never for a longer one.
+    """
+
+    def __init__(
+        self,
+        default: float = 60.0,
+        overrides: dict[str, float] | None = None,
+        exempt: tuple[str, ...] = (),
+    ) -> None:
+        """Initialisation function
+
+        Args:
+            default (float): Budget of a request in seconds
+            overrides (dict[str, float] | None): Budgets by path prefix
+            exempt (tuple[str, ...]): Path prefixes of requests without deadline
+        Returns:
+            None
+        """
+
+        self.default = default
+        self.overrides = dict(
+            sorted((overrides or {}).items(), key=lambda item: -len(item[0]))
+        )
+        self.exempt = exempt
+        self.active = 0
+        self.expired = Counter()
+        self.disconnected = Counter()
+
+    @staticmethod
+    def parse_overrides(value: str | None) -> dict[str, float]:
+        """Function parses "path=seconds,path=seconds" setting value"""
+
+        overrides = {}
+        for item in (value or "").split(","):
+            if not item.strip():
+                continue
+            path, _, seconds = item.partition("=")
+            overrides[path.strip()] = float(seconds)
+        return overrides
+
+    def budget(self, path: str, requested: str | None = None) -> float | None:
+        """Function returns the budget of a request
+
+        Args:
+            path (str): Request path
+            requested (str | None): X-Request-Timeout header value
+        Returns:
+            float | None: budget in seconds, None for exempt paths
+        """
+
+        if path.startswith(self.exempt):
+            return None
+        budget = next(
+            (
+                seconds
+                for prefix, seconds in self.overrides.items()
+                if path.startswith(prefix)
+            ),
+            self.default,
+        )
+        try:
+            requested = float(requested) if requested else None
+        except ValueError:
+            requested = None
+        if requested is not None and requested > 0:
+            budget = min(budget, requested)
+        return budget
+
+    def record(self, reason: str, stage: str) -> None:
+        if reason == "deadline":
+            self.expired[stage] += 1
+        else:
+            self.disconnected[stage] += 1
+
+    def metrics(self) -> dict:
+        return {
+            "default": self.default,
+            "overrides": self.overrides,
+            "active": self.active,
+            "expired_total": sum(self.expired.values()),
+            "disconnected_total": sum(self.disconnected.values()),
+            "expired_by_stage": dict(self.expired),
+            "disconnected_by_stage": dict(self.disconnected),
+        }
@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.common.deadline.deadline import (TIMEOUT_HEADER, Deadline,
+                                          RequestDeadlines, use_deadline)
+from app.common.sse.sse import SSE_MEDIA_TYPE
+
+
+class DeadlineMiddleware:
+    """Runs every request within its deadline.
+
+    The request is handled in its own task, which is cancelled when the client
+    disconnects before the response is complete or when the budget runs out. An
+    expired request which has not started its response is answered with 504.
+    Started event streams are not cancelled on expiry, they end with an `error`
+    event at their next deadline check. Work running in the threadpool cannot be
+    interrupted, it stops at the next deadline check. Background tasks run after
+    the response without a deadline.
+    """
+
+    def __init__(self, app: ASGIApp, deadlines: RequestDeadlines) -> None:
+        self.app = app
+        self.deadlines = deadlines
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        budget = self.deadlines.budget(
+            scope["path"], Headers(scope=scope).get(TIMEOUT_HEADER)
+        )
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(budget, self.deadlines)
+        messages: asyncio.Queue[Message] = asyncio.Queue()
+        response_started = False
+        response_complete = False
+        event_stream = False
+
+        async def send_tracked(message: Message) -> None:
+            nonlocal response_started, response_complete, event_stream
+            if message["type"] == "http.response.start":
+                response_started = True
+                content_type = Headers(raw=message["headers"]).get("content-type", "")
+                event_stream = content_type.startswith(SSE_MEDIA_TYPE)
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_complete = True
+                deadline.finish()
+            await send(message)
+
+        async def run_app() -> None:
+            use_deadline(deadline)
+            await self.app(scope, messages.get, send_tracked)
+
+        handler = asyncio.create_task(run_app())
+
+        async def watch_disconnect() -> None:
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    # background tasks run after the response and must not be cancelled
+                    if not response_complete:
+                        deadline.cancel("disconnect")
+                        handler.cancel()
+                    return
+
+        watcher = asyncio.create_task(watch_disconnect())
+        self.deadlines.active += 1
+        try:
+            done, _ = await asyncio.wait({handler}, timeout=deadline.remaining())
+            if not done and not response_complete and not event_stream:
+                deadline.cancel("deadline")
+                handler.cancel()
+            try:
+                await handler
+            except asyncio.CancelledError:
+                if deadline.reason is None:
+                    raise
+            if deadline.reason == "deadline" and not response_started:
+                await self._send_timeout(send, deadline)
+        finally:
+            self.deadlines.active -= 1
+            watcher.cancel()
+
+    @staticmethod
+    async def _send_timeout(send: Send, deadline: Deadline) -> None:
+        body = json.dumps(
+            {
+                "detail": {
+                    "msg": "Request deadline exceeded",
+                    "input": deadline.stage,
+                    "detail": {"budget": deadline.budget},
+                }
+            }
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
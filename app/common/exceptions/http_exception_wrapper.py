@@ -2,8 +2,10 @@ from fastapi import HTTPException
 
 
 def http_exception(
-    status_code: int, msg: str, _input=None, _detail=None
+    status_code: int, msg: str, _input=None, _detail=None, headers=None
 ) -> HTTPException:
     return HTTPException(
-        status_code=status_code, detail={"msg": msg, "input": _input, "detail": _detail}
+        status_code=status_code,
+        detail={"msg": msg, "input": _input, "detail": _detail},
+        headers=headers,
     )
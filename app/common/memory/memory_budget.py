@@ -0,0 +1,144 @@
+import asyncio
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+
+MIB = 1024 * 1024
+
+
+class MemoryBudget:
+    """Admission of calculations by their estimated memory cost.
+
+    Calculations reserve their estimate from a worker-wide `budget`. One estimate
+    over `request_limit` (or the whole budget) is rejected with 413 up front.
+    Calculations which do not fit next to running ones wait in a FIFO queue for up
+    to `queue_timeout` seconds and fail with 503 afterwards. A zero budget
+    disables the guard.
+    """
+
+    def __init__(
+        self,
+        budget: int = 0,
+        request_limit: int = 0,
+        queue_timeout: float = 10.0,
+    ) -> None:
+        """Initialisation function
+
+        Args:
+            budget (int): Bytes all running calculations of the worker may use, 0 for no limit
+            request_limit (int): Bytes one calculation may use, 0 for the whole budget
+            queue_timeout (float): Maximum wait for memory in seconds
+        Returns:
+            None
+        """
+
+        self.budget = budget
+        self.request_limit = min(request_limit or budget, budget)
+        self.queue_timeout = queue_timeout
+        self.used = 0
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+        self.counters = {
+            "reserved": 0,
+            "queued_total": 0,
+            "rejected_too_large": 0,
+            "rejected_timeout": 0,
+        }
+        self.largest_estimate = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.used + nbytes <= self.budget
+
+    def _grant(self) -> None:
+        while self._waiters and self._fits(self._waiters[0][0]):
+            nbytes, waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.used += nbytes
+            waiter.set_result(None)
+
+    def _release(self, nbytes: int) -> None:
+        self.used -= nbytes
+        self._grant()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int) -> AsyncIterator[None]:
+        """Function holds `nbytes` of the budget while the block runs
+
+        Args:
+            nbytes (int): Estimated memory cost of the calculation
+        Returns:
+            AsyncIterator[None]: context with the reservation
+        Raises:
+            http_exception 413 for estimates over the limit, 503 when memory is not freed in time
+        """
+
+        if not self.enabled:
+            yield
+            return
+        self.largest_estimate = max(self.largest_estimate, nbytes)
+        if nbytes > self.request_limit:
+            self.counters["rejected_too_large"] += 1
+            raise http_exception(
+                413,
+                "Calculation is too large for this worker",
+                _detail={
+                    "estimated_mib": round(nbytes / MIB, 1),
+                    "limit_mib": round(self.request_limit / MIB, 1),
+                },
+            )
+
+        if not self._waiters and self._fits(nbytes):
+            self.used += nbytes
+        else:
+            self.counters["queued_total"] += 1
+            waiter = asyncio.get_running_loop().create_future()
+            entry = (nbytes, waiter)
+            self._waiters.append(entry)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # granted while timing out, give the memory back
+                    self._release(nbytes)
+                else:
+                    waiter.cancel()
+                    if entry in self._waiters:
+                        self._waiters.remove(entry)
+                    self._grant()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.counters["rejected_timeout"] += 1
+                raise http_exception(
+                    503,
+                    "Not enough memory for the calculation, try again later",
+                    _detail={
+                        "estimated_mib": round(nbytes / MIB, 1),
+                        "used_mib": round(self.used / MIB, 1),
+                        "budget_mib": round(self.budget / MIB, 1),
+                    },
+                    headers={"Retry-After": str(math.ceil(self.queue_timeout))},
+                )
+
+        self.counters["reserved"] += 1
+        try:
+            yield
+        finally:
+            self._release(nbytes)
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "budget_mib": round(self.budget / MIB, 1),
+            "request_limit_mib": round(self.request_limit / MIB, 1),
+            "used_mib": round(self.used / MIB, 1),
+            "queued": len(self._waiters),
+            "largest_estimate_mib": round(self.largest_estimate / MIB, 1),
+            **self.counters,
+        }
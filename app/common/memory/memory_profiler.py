@@ -0,0 +1,111 @@
+import os
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from app.common.memory.memory_budget import MIB
+
+PROFILE_MODES = ("off", "tracemalloc", "rss")
+
+
+def current_rss() -> int | None:
+    """Function returns resident set size of the process in bytes (Linux only)"""
+
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss() -> int:
+    """Function returns peak resident set size of the process in bytes"""
+
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryProfiler:
+    """Opt-in memory report per pipeline stage.
+
+    `tracemalloc` records the peak of Python allocations above the allocations at
+    the stage start, `rss` records the growth of the process peak RSS. Both are
+    process-wide, so reports are exact only while one calculation runs at a time.
+    tracemalloc slows allocations down noticeably and is meant for tuning only.
+    """
+
+    def __init__(self, mode: str = "off") -> None:
+        """Initialisation function
+
+        Args:
+            mode (str): off, tracemalloc or rss
+        Returns:
+            None
+        """
+
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown memory profile mode {mode}")
+        self.mode = mode
+        self._stages: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if mode == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def measure(self, stage: str, span: Any = None) -> Iterator[None]:
+        """Function records memory used by the block
+
+        Args:
+            stage (str): Stage name
+            span (Any): Tracing span the measurement is attached to
+        Returns:
+            Iterator[None]: measured context
+        """
+
+        if self.mode == "off":
+            yield
+            return
+        if self.mode == "tracemalloc":
+            start, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        else:
+            start = peak_rss()
+        try:
+            yield
+        finally:
+            if self.mode == "tracemalloc":
+                _, peak = tracemalloc.get_traced_memory()
+            else:
+                peak = peak_rss()
+            self._record(stage, max(0, peak - start))
+            if span is not None:
+                span.set(memory_peak_mib=round(max(0, peak - start) / MIB, 2))
+
+    def _record(self, stage: str, nbytes: int) -> None:
+        with self._lock:
+            stats = self._stages.setdefault(stage, {"count": 0, "total": 0, "max": 0})
+            stats["count"] += 1
+            stats["total"] += nbytes
+            stats["max"] = max(stats["max"], nbytes)
+            stats["last"] = nbytes
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stages = {
+                stage: {
+                    "count": stats["count"],
+                    "peak_mean_mib": round(stats["total"] / stats["count"] / MIB, 2),
+                    "peak_max_mib": round(stats["max"] / MIB, 2),
+                    "peak_last_mib": round(stats["last"] / MIB, 2),
+                }
+                for stage, stats in self._stages.items()
+            }
+        rss = current_rss()
+        return {
+            "mode": self.mode,
+            "rss_mib": None if rss is None else round(rss / MIB, 1),
+            "peak_rss_mib": round(peak_rss() / MIB, 1),
+            "stages": stages,
+        }
@@ -0,0 +1,165 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+
+from loguru import logger
+
+# Number of recorded stalls kept for inspection
+MAX_RECENT_STALLS = 20
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a periodic sleep.
+
+    Every lag above `threshold` is recorded as a stall. With `capture_stacks` a
+    watchdog thread samples the stack of the event loop thread while it is
+    blocked, so stalls point at the code which blocked the loop.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        threshold: float = 0.1,
+        window: float = 10.0,
+        capture_stacks: bool = False,
+    ) -> None:
+        """Initialisation function
+
+        Args:
+            interval (float): Probe period in seconds
+            threshold (float): Lag in seconds recorded as a stall
+            window (float): Period in seconds lag statistics are calculated over
+            capture_stacks (bool): Capture stacks of blocking code
+        Returns:
+            None
+        """
+
+        self.interval = interval
+        self.threshold = threshold
+        self.capture_stacks = capture_stacks
+        self._samples: deque[float] = deque(maxlen=max(1, int(window / interval)))
+        self._stalls: deque[dict] = deque(maxlen=MAX_RECENT_STALLS)
+        self.stalls_total = 0
+        self.stall_time_total = 0.0
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: int | None = None
+        self._heartbeat = time.monotonic()
+        self._blocked_stack: str | None = None
+
+    def start(self) -> None:
+        """Function starts monitoring on the running event loop"""
+
+        if self._task is not None:
+            return
+        self._stopped.clear()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.capture_stacks:
+            self._watchdog = threading.Thread(
+                target=self._watch, name="loop-lag-watchdog", daemon=True
+            )
+            self._watchdog.start()
+        logger.info(
+            f"Event loop lag monitor started, interval={self.interval}s, "
+            f"threshold={self.threshold}s, capture_stacks={self.capture_stacks}"
+        )
+
+    async def stop(self) -> None:
+        """Function stops monitoring"""
+
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._heartbeat = time.monotonic()
+            self._samples.append(lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _record_stall(self, lag: float) -> None:
+        stack, self._blocked_stack = self._blocked_stack, None
+        self.stalls_total += 1
+        self.stall_time_total += lag
+        self._stalls.append(
+            {
+                "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "duration": round(lag, 4),
+                "stack": stack,
+            }
+        )
+        location = stack.strip().splitlines()[-2].strip() if stack else None
+        logger.warning(
+            f"Event loop blocked for {lag:.3f}s"
+            + (f", blocking code: {location}" if location else "")
+        )
+
+    def _watch(self) -> None:
+        captured_heartbeat = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            if blocked_for < self.threshold or heartbeat == captured_heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._blocked_stack = "".join(traceback.format_stack(frame))
+            captured_heartbeat = heartbeat
+
+    def max_lag(self) -> float:
+        """Function returns maximum lag over the window, including an ongoing block
+
+        Returns:
+            float: Lag in seconds
+        """
+
+        ongoing = max(0.0, time.monotonic() - self._heartbeat - self.interval)
+        return max(max(self._samples, default=0.0), ongoing)
+
+    def metrics(self) -> dict:
+        """Function returns lag statistics over the window and recent stalls
+
+        Returns:
+            dict: Lag metrics
+        """
+
+        samples = sorted(self._samples)
+
+        def percentile(q: float) -> float | None:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 4)
+
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "lag_last": round(self._samples[-1], 4) if self._samples else None,
+            "lag_p50": percentile(0.5),
+            "lag_p99": percentile(0.99),
+            "lag_max": round(self.max_lag(), 4),
+            "stalls_total": self.stalls_total,
+            "stall_time_total": round(self.stall_time_total, 4),
+            "recent_stalls": list(self._stalls),
+        }
@@ -0,0 +1,400 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import shapely
+from fastapi.concurrency import run_in_threadpool
+
+
+class ResultStore:
+    """Per-zone calculation results in a local SQLite file with an R*Tree index.
+
+    A result set is a GeoJSON FeatureCollection stored under its result key. Zones
+    keep their GeoJSON geometry and properties as text, so queries are answered
+    without decoding them, and their bounding boxes in an R*Tree, so bbox queries
+    touch only candidate rows. Least recently used sets beyond `max_sets` are
+    dropped. Database calls run in the threadpool.
+    """
+
+    def __init__(self, path: str | Path, max_sets: int = 64) -> None:
+        """Initialisation function
+
+        Args:
+            path (str | Path): Database file path
+            max_sets (int): Maximum number of stored result sets, 0 disables the store
+        Returns:
+            None
+        """
+
+        self.path = Path(path)
+        self.max_sets = max_sets
+        self._lock = threading.Lock()
+        self._connection = None
+        if not self.enabled:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS result_sets ("
+                "key TEXT PRIMARY KEY, scenario_id INTEGER NOT NULL, "
+                "kind TEXT NOT NULL, features INTEGER NOT NULL, metrics TEXT NOT NULL, "
+                "bbox TEXT, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS result_sets_scenario "
+                "ON result_sets (scenario_id, created_at)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS zones ("
+                "id INTEGER PRIMARY KEY, result_key TEXT NOT NULL, feature_id TEXT NOT NULL, "
+                "zone_type_id INTEGER, geometry TEXT NOT NULL, properties TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS zones_result "
+                "ON zones (result_key, zone_type_id)"
+            )
+            self._connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS zones_rtree "
+                "USING rtree(id, min_x, max_x, min_y, max_y)"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_sets > 0
+
+    @staticmethod
+    def _rows(features: list[dict]) -> tuple[list[tuple], np.ndarray, list[str]]:
+        """Zone rows, their bounds (NaN for missing geometry) and numeric properties."""
+
+        geometry = [json.dumps(f.get("geometry")) for f in features]
+        properties = [f.get("properties") or {} for f in features]
+        bounds = shapely.bounds(shapely.from_geojson(geometry, on_invalid="ignore"))
+        metrics = sorted(
+            {
+                name
+                for props in properties
+                for name, value in props.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            }
+        )
+        rows = [
+            (
+                json.dumps(f.get("id")),
+                (
+                    props["zone_type_id"]
+                    if isinstance(props.get("zone_type_id"), int)
+                    else None
+                ),
+                geom,
+                json.dumps(props),
+            )
+            for f, geom, props in zip(features, geometry, properties)
+        ]
+        return rows, bounds, metrics
+
+    def _delete_sets(self, where: str, params: tuple) -> int:
+        keys = [
+            row[0]
+            for row in self._connection.execute(
+                f"SELECT key FROM result_sets WHERE {where}", params
+            ).fetchall()
+        ]
+        for key in keys:
+            self._connection.execute(
+                "DELETE FROM zones_rtree WHERE id IN "
+                "(SELECT id FROM zones WHERE result_key = ?)",
+                (key,),
+            )
+            self._connection.execute("DELETE FROM zones WHERE result_key = ?", (key,))
+            self._connection.execute("DELETE FROM result_sets WHERE key = ?", (key,))
+        return len(keys)
+
+    def _save(
+        self, key: str, scenario_id: int, kind: str, features: list[dict]
+    ) -> None:
+        rows, bounds, metrics = self._rows(features)
+        valid = ~np.isnan(bounds).any(axis=1)
+        bbox = (
+            [
+                *bounds[valid, :2].min(axis=0).tolist(),
+                *bounds[valid, 2:].max(axis=0).tolist(),
+            ]
+            if valid.any()
+            else None
+        )
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete_sets("key = ?", (key,))
+                self._connection.execute(
+                    "INSERT INTO result_sets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        scenario_id,
+                        kind,
+                        len(rows),
+                        json.dumps(metrics),
+                        json.dumps(bbox),
+                        now,
+                        now,
+                    ),
+                )
+                # ids are assigned up front so zones and their boxes go in batches,
+                # the write lock of the transaction keeps them unique between workers
+                start = self._connection.execute(
+                    "SELECT COALESCE(MAX(id), 0) + 1 FROM zones"
+                ).fetchone()[0]
+                self._connection.executemany(
+                    "INSERT INTO zones VALUES (?, ?, ?, ?, ?, ?)",
+                    ((start + i, key, *row) for i, row in enumerate(rows)),
+                )
+                self._connection.executemany(
+                    "INSERT INTO zones_rtree VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (start + int(i), min_x, max_x, min_y, max_y)
+                        for i, (min_x, min_y, max_x, max_y) in zip(
+                            np.flatnonzero(valid), bounds[valid].tolist()
+                        )
+                    ),
+                )
+                self._delete_sets(
+                    "key IN (SELECT key FROM result_sets "
+                    "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sets,),
+                )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _set_record(row: tuple) -> dict:
+        key, scenario_id, kind, features, metrics, bbox, created_at = row
+        return {
+            "key": key,
+            "scenario_id": scenario_id,
+            "kind": kind,
+            "features": features,
+            "metrics": json.loads(metrics),
+            "bbox": json.loads(bbox),
+            "created_at": created_at,
+        }
+
+    def _sets(self, scenario_id: int, kind: str | None) -> list[dict]:
+        sql = (
+            "SELECT key, scenario_id, kind, features, metrics, bbox, created_at "
+            "FROM result_sets WHERE scenario_id = ?"
+        )
+        params: tuple = (scenario_id,)
+        if kind is not None:
+            sql += " AND kind = ?"
+            params += (kind,)
+        with self._lock:
+            rows = self._connection.execute(
+                sql + " ORDER BY created_at DESC", params
+            ).fetchall()
+        return [self._set_record(row) for row in rows]
+
+    def _query(
+        self,
+        key: str,
+        bbox: tuple[float, float, float, float] | None,
+        zone_type_ids: list[int] | None,
+        metric: str | None,
+        min_value: float | None,
+        max_value: float | None,
+        limit: int,
+        after: int | None,
+    ) -> tuple[list[tuple[int, str, str, str]], bool]:
+        sql = "SELECT z.id, z.feature_id, z.geometry, z.properties FROM zones z"
+        where = ["z.result_key = ?", "z.id > ?"]
+        params: list[Any] = [key]
+        if bbox is not None:
+            sql += " JOIN zones_rtree r ON r.id = z.id"
+            where += ["r.max_x >= ?", "r.min_x <= ?", "r.max_y >= ?", "r.min_y <= ?"]
+        if zone_type_ids:
+            where.append(f"z.zone_type_id IN ({', '.join('?' * len(zone_type_ids))})")
+        filters: list[Any] = (
+            [] if bbox is None else [bbox[0], bbox[2], bbox[1], bbox[3]]
+        )
+        filters += zone_type_ids or []
+        if metric is not None:
+            path = f'$."{metric}"'
+            # SQLite orders text after numbers, only numeric values are compared
+            where.append("json_type(z.properties, ?) IN ('integer', 'real')")
+            filters.append(path)
+            if min_value is not None:
+                where.append("json_extract(z.properties, ?) >= ?")
+                filters += [path, min_value]
+            if max_value is not None:
+                where.append("json_extract(z.properties, ?) <= ?")
+                filters += [path, max_value]
+        sql += f" WHERE {' AND '.join(where)} ORDER BY z.id LIMIT ?"
+
+        rows: list[tuple[int, str, str, str]] = []
+        last = after or 0
+        with self._lock:
+            # R*Tree candidates intersect the bbox with their bounds only, they are
+            # refined and fetched in batches until the page (and one more zone) is full
+            while len(rows) <= limit:
+                batch = self._connection.execute(
+                    sql, [key, last, *filters, limit + 1]
+                ).fetchall()
+                if not batch:
+                    break
+                last = batch[-1][0]
+                if bbox is not None:
+                    geometries = shapely.from_geojson(
+                        [row[2] for row in batch], on_invalid="ignore"
+                    )
+                    hits = shapely.intersects(geometries, shapely.box(*bbox))
+                    batch = [row for row, hit in zip(batch, hits) if hit]
+                rows += batch
+                if bbox is None:
+                    break
+            self._connection.execute(
+                "UPDATE result_sets SET accessed_at = ? WHERE key = ?",
+                (time.time(), key),
+            )
+        return rows[:limit], len(rows) > limit
+
+    def _get_set(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT key, scenario_id, kind, features, metrics, bbox, created_at "
+                "FROM result_sets WHERE key = ?",
+                (key,),
+            ).fetchone()
+        return None if row is None else self._set_record(row)
+
+    def _delete_scenario(self, scenario_id: int) -> int:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._delete_sets("scenario_id = ?", (scenario_id,))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return removed
+
+    def _metrics(self) -> dict:
+        with self._lock:
+            sets, zones = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(features), 0) FROM result_sets"
+            ).fetchone()
+        return {"sets": sets, "zones": zones}
+
+    async def save(
+        self, key: str, scenario_id: int, kind: str, features: list[dict]
+    ) -> None:
+        """Function stores GeoJSON features of a result, replacing a set with the same key
+
+        Args:
+            key (str): Result key
+            scenario_id (int): Scenario of the result
+            kind (str): Calculation kind
+            features (list[dict]): GeoJSON features in EPSG:4326
+        Returns:
+            None
+        """
+
+        if self.enabled:
+            await run_in_threadpool(self._save, key, scenario_id, kind, features)
+
+    async def sets(self, scenario_id: int, kind: str | None = None) -> list[dict]:
+        """Function returns stored result sets of a scenario, newest first
+
+        Args:
+            scenario_id (int): Scenario id
+            kind (str | None): Calculation kind filter
+        Returns:
+            list[dict]: set records with key, kind, feature count, metrics and bbox
+        """
+
+        if not self.enabled:
+            return []
+        return await run_in_threadpool(self._sets, scenario_id, kind)
+
+    async def query(
+        self,
+        key: str,
+        bbox: tuple[float, float, float, float] | None = None,
+        zone_type_ids: list[int] | None = None,
+        metric: str | None = None,
+        min_value: float | None = None,
+        max_value: float | None = None,
+        limit: int = 1000,
+        after: int | None = None,
+    ) -> tuple[list[tuple[int, str, str, str]], bool]:
+        """Function returns stored zones of a result set matching all filters in stored order
+
+        Args:
+            key (str): Result key
+            bbox (tuple | None): (minx, miny, maxx, maxy) in EPSG:4326 zones must intersect
+            zone_type_ids (list[int] | None): Accepted zone types
+            metric (str | None): Numeric property compared with min_value and max_value
+            min_value (float | None): Inclusive lower bound of the metric
+            max_value (float | None): Inclusive upper bound of the metric
+            limit (int): Maximum number of returned zones
+            after (int | None): Zone id the page starts after, see the returned ids
+        Returns:
+            tuple[list[tuple[int, str, str, str]], bool]: (zone id, JSON feature id,
+            GeoJSON geometry, JSON properties) rows and whether more zones matched
+        """
+
+        return await run_in_threadpool(
+            self._query,
+            key,
+            bbox,
+            zone_type_ids,
+            metric,
+            min_value,
+            max_value,
+            limit,
+            after,
+        )
+
+    async def get_set(self, key: str) -> dict | None:
+        """Function returns the record of a stored result set, None if it is not stored
+
+        Args:
+            key (str): Result key
+        Returns:
+            dict | None: set record, see `sets`
+        """
+
+        if not self.enabled:
+            return None
+        return await run_in_threadpool(self._get_set, key)
+
+    async def delete_scenario(self, scenario_id: int) -> int:
+        """Function removes all result sets of a scenario
+
+        Args:
+            scenario_id (int): Scenario id
+        Returns:
+            int: Number of removed sets
+        """
+
+        if not self.enabled:
+            return 0
+        return await run_in_threadpool(self._delete_scenario, scenario_id)
+
+    async def metrics(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "max_sets": self.max_sets,
+            **await run_in_threadpool(self._metrics),
+        }
@@ -0,0 +1,137 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import geopandas as gpd
+
+MANIFEST_NAME = "manifest.json"
+
+
+class SnapshotStore:
+    """Local store of fetched upstream data.
+
+    Entries are grouped by scope (e.g. ``scenario_198``), frames are stored as
+    GeoParquet and other data as JSON. Every scope has a manifest with capture
+    times of its entries. Writes are atomic, so readers never see partial files.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        """Initialisation function
+
+        Args:
+            root (str | Path): Directory snapshots are stored in
+        Returns:
+            None
+        """
+
+        self.root = Path(root)
+        self._manifest_lock = threading.Lock()
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", str(name))
+
+    def _scope_dir(self, scope: str) -> Path:
+        return self.root / self._safe(scope)
+
+    def _path(self, scope: str, name: str, frame: bool) -> Path:
+        suffix = ".parquet" if frame else ".json"
+        return self._scope_dir(scope) / f"{self._safe(name)}{suffix}"
+
+    def _write_atomic(self, path: Path, write) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def _read_manifest(self, scope: str) -> dict:
+        path = self._scope_dir(scope) / MANIFEST_NAME
+        if not path.exists():
+            return {}
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, scope: str, name: str, value: Any) -> None:
+        """Function stores value as GeoParquet if it is a GeoDataFrame, else as JSON
+
+        Args:
+            scope (str): Snapshot scope, e.g. scenario
+            name (str): Entry name
+            value (Any): GeoDataFrame or JSON-compatible value
+        Returns:
+            None
+        """
+
+        frame = isinstance(value, gpd.GeoDataFrame)
+        path = self._path(scope, name, frame)
+        if frame:
+            self._write_atomic(path, lambda tmp: value.to_parquet(tmp, index=True))
+        else:
+            self._write_atomic(
+                path,
+                lambda tmp: Path(tmp).write_text(
+                    json.dumps(value, ensure_ascii=False), encoding="utf-8"
+                ),
+            )
+
+        with self._manifest_lock:
+            manifest = self._read_manifest(scope)
+            manifest[name] = {"file": path.name, "captured_at": time.time()}
+            self._write_atomic(
+                self._scope_dir(scope) / MANIFEST_NAME,
+                lambda tmp: Path(tmp).write_text(
+                    json.dumps(manifest, indent=2), encoding="utf-8"
+                ),
+            )
+
+    def load(self, scope: str, name: str) -> Any | None:
+        """Function loads stored value
+
+        Args:
+            scope (str): Snapshot scope
+            name (str): Entry name
+        Returns:
+            Any | None: Stored value or None if there is no snapshot
+        """
+
+        entry = self._read_manifest(scope).get(name)
+        if entry is None:
+            return None
+        path = self._scope_dir(scope) / entry["file"]
+        if not path.exists():
+            return None
+        if path.suffix == ".parquet":
+            return gpd.read_parquet(path)
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def captured_at(self, scope: str, name: str) -> float | None:
+        """Function returns capture time of an entry as unix timestamp, None if missing"""
+
+        entry = self._read_manifest(scope).get(name)
+        return entry["captured_at"] if entry else None
+
+    def list(self) -> dict[str, dict]:
+        """Function returns manifests of all stored scopes
+
+        Returns:
+            dict[str, dict]: Scope name to its manifest
+        """
+
+        if not self.root.exists():
+            return {}
+        return {
+            path.name: self._read_manifest(path.name)
+            for path in sorted(self.root.iterdir())
+            if (path / MANIFEST_NAME).exists()
+        }
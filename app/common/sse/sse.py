@@ -0,0 +1,64 @@
+from typing import Any, AsyncGenerator, AsyncIterator
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from loguru import logger
+
+from app.common.compression.compression import serialize_json
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# Proxies must pass events through as they are written
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def format_event(event: str, data: Any) -> bytes:
+    """Function formats server-sent event with JSON data
+
+    Args:
+        event (str): Event name
+        data (Any): Event data, serialised as single line JSON
+    Returns:
+        bytes: Encoded event
+    """
+
+    return (
+        b"event: "
+        + event.encode("utf-8")
+        + b"\ndata: "
+        + serialize_json(data)
+        + b"\n\n"
+    )
+
+
+async def event_response(
+    request: Request, events: AsyncGenerator[bytes, None]
+) -> StreamingResponse:
+    """Function starts event stream and wraps it into streaming response
+
+    The first event is produced before the response starts, so errors raised up to it
+    (e.g. admission or access errors) are answered with plain HTTP status codes. The
+    stream is closed as soon as the client disconnects, which stops the producer.
+
+    Args:
+        request (Request): Request of the stream
+        events (AsyncGenerator[bytes, None]): Encoded events
+    Returns:
+        StreamingResponse: Event stream response
+    """
+
+    first = await events.__anext__()
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            yield first
+            async for event in events:
+                if await request.is_disconnected():
+                    logger.info(
+                        f"Client disconnected, stream {request.url.path} closed"
+                    )
+                    break
+                yield event
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(body(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
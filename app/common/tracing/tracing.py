@@ -0,0 +1,335 @@
+import json
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+# Header carrying the trace id from clients and to Urban API
+TRACE_HEADER = "X-Trace-Id"
+
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """Timed operation of a trace, used as a (sync) context manager.
+
+    The span is the current one inside its block, spans opened inside it (in the
+    same task, child tasks or threadpool calls) become its children. Detached spans
+    never become current, e.g. spans of async generators, which run in the context
+    of whoever iterates them.
+    """
+
+    __slots__ = (
+        "tracer",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "start",
+        "end",
+        "status",
+        "detached",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        trace_id: str,
+        parent_id: str | None,
+        name: str,
+        attributes: dict[str, Any],
+        detached: bool = False,
+    ) -> None:
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: float | None = None
+        self.status = "ok"
+        self.detached = detached
+        self._token = None
+
+    def set(self, **attributes: Any) -> None:
+        """Function adds attributes to the span"""
+
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        if not self.detached:
+            self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end = time.time()
+        if exc_type is not None:
+            self.status = "error"
+            self.attributes.setdefault("error", exc_type.__name__)
+        if self._token is not None:
+            _current_span.reset(self._token)
+        self.tracer._finish(self)
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": None if self.end is None else self.end - self.start,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoSpan:
+    """Span stand-in outside of traces or with tracing disabled."""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """Lightweight request tracing.
+
+    Spans of the most recent `buffer_size` traces are kept in memory for
+    inspection as a waterfall. With `export_path` finished spans are also
+    appended to a JSON lines file, one span per line, by a writer thread, so
+    file access never blocks the event loop.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        buffer_size: int = 200,
+        export_path: str | Path | None = None,
+    ) -> None:
+        """Initialisation function
+
+        Args:
+            enabled (bool): Record spans
+            buffer_size (int): Number of most recent traces kept in memory
+            export_path (str | Path | None): JSON lines file finished spans are appended to
+        Returns:
+            None
+        """
+
+        self.enabled = enabled
+        self.buffer_size = buffer_size
+        self.export_path = Path(export_path) if export_path else None
+        self._traces: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._export_queue: queue.SimpleQueue[dict | None] = queue.SimpleQueue()
+        self._writer: threading.Thread | None = None
+
+    @staticmethod
+    def new_trace_id() -> str:
+        return secrets.token_hex(16)
+
+    @staticmethod
+    def current_trace_id() -> str | None:
+        span = _current_span.get()
+        return None if span is None else span.trace_id
+
+    def trace(self, name: str, **attributes: Any):
+        """Function opens the root span of a new trace
+
+        Every trace gets a new id, ids received from callers are kept as attributes
+        only, so they can never address or overwrite a buffered trace.
+
+        Args:
+            name (str): Root span name, e.g. request method and path
+            **attributes: Span attributes
+        Returns:
+            Span: root span, no-op span with tracing disabled
+        """
+
+        if not self.enabled:
+            return NO_SPAN
+        trace_id = self.new_trace_id()
+        with self._lock:
+            self._traces[trace_id] = {
+                "trace_id": trace_id,
+                "name": name,
+                "start": time.time(),
+                "spans": [],
+            }
+            self._traces.move_to_end(trace_id)
+            while len(self._traces) > self.buffer_size:
+                self._traces.popitem(last=False)
+        return Span(self, trace_id, None, name, attributes)
+
+    def span(self, name: str, detached: bool = False, **attributes: Any):
+        """Function opens a child span of the current span
+
+        Args:
+            name (str): Span name
+            detached (bool): Never make the span current
+            **attributes: Span attributes
+        Returns:
+            Span: child span, no-op span outside of a trace
+        """
+
+        parent = _current_span.get()
+        if not self.enabled or parent is None:
+            return NO_SPAN
+        return Span(self, parent.trace_id, parent.span_id, name, attributes, detached)
+
+    def inject(self, headers: dict | None) -> dict | None:
+        """Function adds the current trace id to outgoing request headers
+
+        Args:
+            headers (dict | None): Request headers
+        Returns:
+            dict | None: copy of headers with the trace header, headers outside of a trace
+        """
+
+        trace_id = self.current_trace_id()
+        if trace_id is None:
+            return headers
+        return {**(headers or {}), TRACE_HEADER: trace_id}
+
+    def _finish(self, span: Span) -> None:
+        record = span.as_dict()
+        with self._lock:
+            trace = self._traces.get(span.trace_id)
+            if trace is not None:
+                trace["spans"].append(record)
+        if self.export_path is not None:
+            if self._writer is None:
+                with self._lock:
+                    if self._writer is None:
+                        self._writer = threading.Thread(
+                            target=self._write_spans, name="span-export", daemon=True
+                        )
+                        self._writer.start()
+            self._export_queue.put(record)
+
+    def _write_spans(self) -> None:
+        while True:
+            records = [self._export_queue.get()]
+            # spans finished meanwhile are appended with one file open
+            while True:
+                try:
+                    records.append(self._export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            lines = [
+                json.dumps(record, default=str) + "\n"
+                for record in records
+                if record is not None
+            ]
+            try:
+                with self.export_path.open("a", encoding="utf-8") as file:
+                    file.writelines(lines)
+            except OSError as e:
+                logger.warning(f"Span export to {self.export_path} failed: {e}")
+            if stop:
+                return
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Function writes out queued spans and stops the writer thread
+
+        Args:
+            timeout (float): Maximum wait for the writer in seconds
+        Returns:
+            None
+        """
+
+        writer = self._writer
+        if writer is None:
+            return
+        self._export_queue.put(None)
+        writer.join(timeout)
+        self._writer = None
+
+    def recent(self, limit: int = 50) -> list[dict]:
+        """Function lists the most recent traces
+
+        Args:
+            limit (int): Maximum number of traces
+        Returns:
+            list[dict]: traces, newest first, with duration and number of spans
+        """
+
+        with self._lock:
+            traces = list(self._traces.values())[-limit:][::-1]
+            result = []
+            for trace in traces:
+                root = next((s for s in trace["spans"] if s["parent_id"] is None), None)
+                result.append(
+                    {
+                        "trace_id": trace["trace_id"],
+                        "name": trace["name"],
+                        "start": trace["start"],
+                        "duration": None if root is None else root["duration"],
+                        "status": None if root is None else root["status"],
+                        "spans": len(trace["spans"]),
+                    }
+                )
+        return result
+
+    def waterfall(self, trace_id: str) -> dict | None:
+        """Function returns the timeline of a trace
+
+        Spans are ordered by start time, each with its offset from the trace start
+        and depth in the span tree, so overlapping calls are visible.
+
+        Args:
+            trace_id (str): Trace id
+        Returns:
+            dict | None: trace with spans, None if the trace is not kept
+        """
+
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                return None
+            spans = sorted(trace["spans"], key=lambda s: s["start"])
+            start = trace["start"]
+
+        depth: dict[str, int] = {}
+        by_id = {s["span_id"]: s for s in spans}
+
+        def span_depth(span: dict) -> int:
+            if span["span_id"] not in depth:
+                parent = by_id.get(span["parent_id"])
+                depth[span["span_id"]] = 0 if parent is None else span_depth(parent) + 1
+            return depth[span["span_id"]]
+
+        return {
+            "trace_id": trace_id,
+            "name": trace["name"],
+            "start": start,
+            "spans": [
+                {
+                    **span,
+                    "offset": round(span["start"] - start, 6),
+                    "duration": (
+                        None if span["duration"] is None else round(span["duration"], 6)
+                    ),
+                    "depth": span_depth(span),
+                }
+                for span in spans
+            ],
+        }
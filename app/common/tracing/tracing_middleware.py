@@ -0,0 +1,49 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.common.tracing.tracing import TRACE_HEADER, Tracer
+
+# Probes, documentation and trace inspection would crowd the trace buffer out
+UNTRACED_PREFIXES = ("/system", "/docs", "/openapi.json", "/redoc")
+
+# Longest trace id accepted from callers
+MAX_TRACE_ID_LENGTH = 64
+
+
+class TracingMiddleware:
+    """Opens the root span of every request.
+
+    Every request gets a new trace id, returned in the X-Trace-Id response header.
+    An X-Trace-Id request header is recorded as the `client_trace_id` attribute.
+    """
+
+    def __init__(self, app: ASGIApp, tracer: Tracer) -> None:
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not self.tracer.enabled
+            or scope["path"].startswith(UNTRACED_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        attributes = {}
+        client_trace_id = Headers(scope=scope).get(TRACE_HEADER)
+        if client_trace_id and len(client_trace_id) <= MAX_TRACE_ID_LENGTH:
+            attributes["client_trace_id"] = client_trace_id
+        with self.tracer.trace(
+            f"{scope['method']} {scope['path']}", **attributes
+        ) as span:
+
+            async def send_with_trace(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set(status_code=message["status"])
+                    if message["status"] >= 500:
+                        span.status = "error"
+                    MutableHeaders(scope=message).append(TRACE_HEADER, span.trace_id)
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
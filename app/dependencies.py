@@ -4,7 +4,20 @@ from pathlib import Path
 from iduconfig import Config
 from loguru import logger
 
+from app.common.admission.admission import AdmissionController
 from app.common.api_handler.api_handler import APIHandler
+from app.common.cache.cache_backend import CacheBackend
+from app.common.cache.disk_cache import DiskCache
+from app.common.cache.lru_cache import LRUCache
+from app.common.cache.redis_cache import RedisCache
+from app.common.cache.tiered_cache import TieredCache
+from app.common.deadline.deadline import RequestDeadlines
+from app.common.memory.memory_budget import MIB, MemoryBudget
+from app.common.memory.memory_profiler import MemoryProfiler
+from app.common.monitoring.loop_monitor import LoopLagMonitor
+from app.common.result_store.result_store import ResultStore
+from app.common.snapshot.snapshot_store import SnapshotStore
+from app.common.tracing.tracing import Tracer
 
 logger.remove()
 log_level = "INFO"
@@ -20,4 +33,144 @@ logger.add(
     level="INFO",
 )
 
-urban_api_handler = APIHandler(config.get("URBAN_API"))
+
+def get_setting(key: str, default: str | None = None) -> str | None:
+    """Get optional environment variable with a fallback value.
+
+    Args:
+        key (str): name of variable.
+        default (str | None): value returned if variable is not set.
+    Returns:
+        str | None: value of environment variable or default.
+    """
+
+    try:
+        return config.get(key)
+    except ValueError:
+        return default
+
+
+def create_cache(name: str, max_items: int, ttl: float | None) -> CacheBackend:
+    """Create cache of the backend selected by CACHE_BACKEND setting.
+
+    "memory" (default) is a per-worker LRU. "disk" is a SQLite file in CACHE_DIR
+    shared by workers of the host, "redis" is a Redis-protocol server at REDIS_URL
+    shared by all workers. Shared backends get a per-worker LRU in front of them,
+    living CACHE_LOCAL_TTL seconds.
+
+    Args:
+        name (str): cache name, used for file names and key namespaces.
+        max_items (int): maximum number of entries (per worker for the local tier).
+        ttl (float | None): default time to live in seconds.
+    Returns:
+        CacheBackend: cache instance.
+    """
+
+    backend = get_setting("CACHE_BACKEND", "memory")
+    if backend == "memory":
+        return LRUCache(max_items=max_items, ttl=ttl)
+
+    if backend == "disk":
+        shared = DiskCache(
+            Path(get_setting("CACHE_DIR", "cache")) / f"{name}.sqlite",
+            max_items=max_items,
+            ttl=ttl,
+        )
+    elif backend == "redis":
+        shared = RedisCache.from_url(
+            get_setting("REDIS_URL", "redis://localhost:6379/0"),
+            ttl=ttl,
+            namespace=f"urbanomy:{name}:",
+        )
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND {backend}")
+
+    local_ttl = float(get_setting("CACHE_LOCAL_TTL", "60"))
+    return TieredCache(
+        LRUCache(max_items=max_items, ttl=min(local_ttl, ttl or local_ttl)), shared
+    )
+
+
+tracer = Tracer(
+    enabled=get_setting("TRACING_ENABLED", "true").lower() in ("1", "true", "yes"),
+    buffer_size=int(get_setting("TRACE_BUFFER_SIZE", "200")),
+    export_path=get_setting("TRACE_FILE"),
+)
+
+urban_api_handler = APIHandler(
+    config.get("URBAN_API"),
+    tracer=tracer,
+    timeout=float(get_setting("URBAN_API_TIMEOUT", "30")),
+)
+
+# Probes and documentation answer immediately and have no deadline
+request_deadlines = RequestDeadlines(
+    default=float(get_setting("REQUEST_DEADLINE", "60")),
+    overrides=RequestDeadlines.parse_overrides(get_setting("REQUEST_DEADLINES")),
+    exempt=("/system", "/docs", "/openapi.json", "/redoc"),
+)
+
+result_cache = create_cache(
+    "result",
+    max_items=int(get_setting("RESULT_CACHE_MAX_ITEMS", "64")),
+    ttl=float(get_setting("RESULT_CACHE_TTL", "900")),
+)
+
+gateway_cache = create_cache(
+    "gateway",
+    max_items=int(get_setting("GATEWAY_CACHE_MAX_ITEMS", "256")),
+    ttl=float(get_setting("GATEWAY_CACHE_TTL", "300")),
+)
+
+# Materialised per-zone frames with built spatial indexes are never shared between
+# workers. With a shared backend they live as long as local tiers to follow invalidations
+frame_cache = LRUCache(
+    max_items=int(get_setting("FRAME_CACHE_MAX_ITEMS", "16")),
+    ttl=(
+        float(get_setting("RESULT_CACHE_TTL", "900"))
+        if get_setting("CACHE_BACKEND", "memory") == "memory"
+        else float(get_setting("CACHE_LOCAL_TTL", "60"))
+    ),
+)
+
+stage_cache = LRUCache(
+    max_items=int(get_setting("STAGE_CACHE_MAX_ITEMS", "128")),
+    ttl=float(get_setting("STAGE_CACHE_TTL", "3600")),
+)
+
+tile_cache = create_cache(
+    "tile",
+    max_items=int(get_setting("TILE_CACHE_MAX_ITEMS", "4096")),
+    ttl=float(get_setting("RESULT_CACHE_TTL", "900")),
+)
+
+snapshot_store = SnapshotStore(get_setting("SNAPSHOT_DIR", "snapshots"))
+
+result_store = ResultStore(
+    get_setting("RESULT_STORE_PATH")
+    or Path(get_setting("CACHE_DIR", "cache")) / "result_store.sqlite",
+    max_sets=int(get_setting("RESULT_STORE_MAX_SETS", "64")),
+)
+
+calculation_admission = AdmissionController(
+    max_active=int(get_setting("ADMISSION_MAX_ACTIVE", "4")),
+    max_per_client=int(get_setting("ADMISSION_MAX_PER_CLIENT", "2")),
+    queue_size=int(get_setting("ADMISSION_QUEUE_SIZE", "8")),
+    queue_timeout=float(get_setting("ADMISSION_QUEUE_TIMEOUT", "5")),
+)
+
+loop_monitor = LoopLagMonitor(
+    interval=float(get_setting("LOOP_MONITOR_INTERVAL", "0.1")),
+    threshold=float(get_setting("LOOP_LAG_THRESHOLD", "0.1")),
+    window=float(get_setting("LOOP_MONITOR_WINDOW", "10")),
+    capture_stacks=get_setting("LOOP_MONITOR_CAPTURE_STACKS", "false").lower()
+    in ("1", "true", "yes"),
+)
+
+memory_budget = MemoryBudget(
+    budget=int(float(get_setting("MEMORY_BUDGET_MB", "0")) * MIB),
+    request_limit=int(float(get_setting("MEMORY_REQUEST_LIMIT_MB", "0")) * MIB),
+    queue_timeout=float(get_setting("MEMORY_QUEUE_TIMEOUT", "10")),
+)
+
+memory_profiler = MemoryProfiler(get_setting("MEMORY_PROFILE", "off"))
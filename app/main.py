@@ -2,21 +2,35 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import RedirectResponse
 
+from app.common.compression.compression_middleware import CompressionMiddleware
+from app.common.deadline.deadline_middleware import DeadlineMiddleware
+from app.common.tracing.tracing_middleware import TracingMiddleware
 from app.logs_router.logs_controller import logs_router
+from app.system_router.system_controller import system_router
 
-from .dependencies import config
+from .dependencies import config, loop_monitor, request_deadlines, tracer
 from .urbanomy_api.urbanomic_controller import urbanomic_router
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    yield
+    await loop_monitor.stop()
+    tracer.close()
+
+
 app = FastAPI(
     title="Urbanomy API",
     description="API for calculating investing attractiveness of territory using Urbanomy library",
     version=config.get("APP_VERSION"),
+    lifespan=lifespan,
 )
 
+app.add_middleware(DeadlineMiddleware, deadlines=request_deadlines)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,7 +39,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.add_middleware(GZipMiddleware, minimum_size=100)
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+app.add_middleware(TracingMiddleware, tracer=tracer)
 
 
 @app.get("/", include_in_schema=False)
@@ -35,3 +50,4 @@ async def read_root():
 
 app.include_router(urbanomic_router)
 app.include_router(logs_router)
+app.include_router(system_router)
@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+
+from app.common.auth.auth import verify_traces_token
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import (calculation_admission, get_setting, loop_monitor,
+                              memory_budget, memory_profiler,
+                              request_deadlines, result_store, tracer,
+                              urban_api_handler)
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+
+# Worker is not ready while the event loop lagged more than this over the monitor window
+READY_MAX_LOOP_LAG = float(get_setting("READY_MAX_LOOP_LAG", "0.5"))
+
+system_router = APIRouter(prefix="/system", tags=["System"])
+
+
+@system_router.get("/admission")
+async def get_admission_metrics():
+    """
+    Get calculation admission limits, current load and queue wait statistics of this worker
+    """
+
+    return calculation_admission.metrics()
+
+
+@system_router.get("/deadlines")
+async def get_deadline_metrics():
+    """
+    Get request deadline budgets of this worker and counts of requests which ran out of
+    time or were abandoned by clients, by the stage they were in
+    """
+
+    return {
+        **request_deadlines.metrics(),
+        "urban_api_timeout": urban_api_handler.timeout,
+        "urban_api_timeouts": urban_api_handler.timeouts,
+    }
+
+
+@system_router.get("/memory")
+async def get_memory_metrics():
+    """
+    Get the memory budget of this worker with reservations of running calculations and
+    rejections, process RSS and, with MEMORY_PROFILE enabled, memory peaks per pipeline stage
+    """
+
+    return {"budget": memory_budget.metrics(), "profile": memory_profiler.metrics()}
+
+
+@system_router.get("/result_store")
+async def get_result_store_metrics():
+    """
+    Get the number of per-zone result sets and zones kept in the result store
+    """
+
+    return await result_store.metrics()
+
+
+@system_router.get("/health")
+async def get_health():
+    """
+    Get worker health: event loop lag and recent stalls, calculation load and Urban API reachability
+    """
+
+    return {
+        "status": "ok",
+        "event_loop": loop_monitor.metrics(),
+        "admission": calculation_admission.metrics(),
+        "upstream": await UrbanAPIGateway.check_upstream(),
+    }
+
+
+@system_router.get("/ready")
+async def get_readiness():
+    """
+    Readiness of this worker for new traffic, 503 while the event loop lags, the calculation
+    queue is full or Urban API is unreachable
+    """
+
+    upstream = await UrbanAPIGateway.check_upstream()
+    loop_lag = loop_monitor.max_lag()
+    checks = {
+        "event_loop": loop_lag <= READY_MAX_LOOP_LAG,
+        "admission": not calculation_admission.saturated(),
+        "upstream": upstream["reachable"],
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "checks": checks,
+            "loop_lag_max": round(loop_lag, 4),
+            "upstream_latency": upstream["latency"],
+        },
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@system_router.get("/traces")
+async def get_traces(
+    limit: int = Query(50, ge=1, le=1000), _: str = Depends(verify_traces_token)
+):
+    """
+    Get the most recent request traces of this worker, newest first. Requires the
+    TRACES_TOKEN bearer token
+    """
+
+    return {"enabled": tracer.enabled, "traces": tracer.recent(limit)}
+
+
+@system_router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str, _: str = Depends(verify_traces_token)):
+    """
+    Get the timeline of a request trace: Urban API calls and pipeline stages with their
+    offsets from the request start, durations and nesting, as a waterfall. Requires the
+    TRACES_TOKEN bearer token
+    """
+
+    waterfall = tracer.waterfall(trace_id)
+    if waterfall is None:
+        raise http_exception(404, "Trace not found", trace_id)
+    return waterfall
@@ -0,0 +1,41 @@
+from enum import Enum
+from typing import Optional
+
+from fastapi import Body
+from pydantic import BaseModel, Field
+
+from app.urbanomy_api.dto.benchmarks_dto import (BenchmarksDTO,
+                                                 non_residential_demo,
+                                                 residential_demo)
+from app.urbanomy_api.dto.InvestmentAttractivnessFzonesRequestDto import Source
+
+
+class Aggregation(str, Enum):
+    hex = "hex"
+    square = "square"
+    zone_type = "zone_type"
+
+
+class InvestmentAttractivenessAggregationRequestDTO(BaseModel):
+    scenario_id: int = Field(..., examples=[198], description="Scenario id")
+    aggregation: Aggregation = Field(
+        Aggregation.hex,
+        description="Hexagonal or square grid cells or dissolved land-use types",
+    )
+    cell_size: float = Field(
+        500.0,
+        ge=50,
+        le=20000,
+        description="Grid cell width in meters, distance between opposite sides",
+    )
+    source: Optional[Source] = Field(
+        None,
+        description="The source of the landuse zones data. Valid options: PZZ, OSM, User",
+    )
+    year: Optional[int] = Field(
+        None, description="The year of the investment attractiveness"
+    )
+    benchmarks: BenchmarksDTO = Body(
+        default={**residential_demo, **non_residential_demo},
+        description="Benchmark parameters for each functional zone category",
+    )
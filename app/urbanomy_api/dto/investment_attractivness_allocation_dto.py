@@ -0,0 +1,65 @@
+from typing import List, Optional
+
+from fastapi import Body
+from pydantic import BaseModel, Field, model_validator
+from typing_extensions import Self
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.urbanomy_api.dto.benchmarks_dto import (BenchmarksDTO,
+                                                 non_residential_demo,
+                                                 residential_demo)
+from app.urbanomy_api.dto.InvestmentAttractivnessFzonesRequestDto import Source
+
+
+class AllocationConstraint(BaseModel):
+    land_use_type: str = Field(..., examples=["residential_multistorey"])
+    min_area: Optional[float] = Field(
+        None, ge=0, description="Minimum allocated area in square meters"
+    )
+    max_area: Optional[float] = Field(
+        None, ge=0, description="Maximum allocated area in square meters"
+    )
+    min_share: Optional[float] = Field(
+        None, ge=0, le=1, description="Minimum share of the total zones area"
+    )
+    max_share: Optional[float] = Field(
+        None,
+        ge=0,
+        le=1,
+        examples=[0.3],
+        description="Maximum share of the total zones area",
+    )
+
+    @model_validator(mode="after")
+    def has_bound(self) -> Self:
+        if all(
+            bound is None
+            for bound in (self.min_area, self.max_area, self.min_share, self.max_share)
+        ):
+            raise http_exception(
+                422, "allocation constraint must set a bound", self.land_use_type
+            )
+        return self
+
+
+class InvestmentAttractivenessAllocationRequestDTO(BaseModel):
+    scenario_id: int = Field(..., examples=[198], description="Scenario id")
+    as_geojson: bool = Field(
+        ..., examples=[False], description="Which format to return"
+    )
+    source: Optional[Source] = Field(
+        None,
+        description="The source of the landuse zones data. Valid options: PZZ, OSM, User",
+    )
+    metric: str = Field(
+        "ECON_NPV", examples=["ECON_NPV"], description="Per-zone metric to maximise"
+    )
+    benchmarks: BenchmarksDTO = Body(
+        default={**residential_demo, **non_residential_demo},
+        description="Benchmark parameters for each functional zone category, every benchmarked land-use type is a candidate",
+    )
+    constraints: List[AllocationConstraint] = Body(
+        default=[],
+        description="Bounds of the total area allocated to land-use types",
+        examples=[[{"land_use_type": "residential_multistorey", "max_share": 0.3}]],
+    )
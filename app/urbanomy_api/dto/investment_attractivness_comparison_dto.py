@@ -0,0 +1,27 @@
+from typing import List
+
+from fastapi import Body
+from pydantic import BaseModel, Field
+
+from app.urbanomy_api.dto.benchmarks_dto import (BenchmarksDTO,
+                                                 non_residential_demo,
+                                                 residential_demo)
+from app.urbanomy_api.dto.InvestmentAttractivnessFzonesRequestDto import Source
+
+
+class InvestmentAttractivenessComparisonRequestDTO(BaseModel):
+    scenario_id: int = Field(..., examples=[198], description="Scenario id")
+    benchmarks: BenchmarksDTO = Body(
+        default={**residential_demo, **non_residential_demo},
+        description="Benchmark parameters for each functional zone category",
+    )
+    sources: List[Source] = Body(
+        default=[],
+        examples=[["OSM", "PZZ"]],
+        description="Sources of the landuse zones data to compare, all available by default",
+    )
+    years: List[int] = Body(
+        default=[],
+        examples=[[2024]],
+        description="Years of the landuse zones data to compare, all available by default",
+    )
@@ -0,0 +1,116 @@
+from typing import List, Literal, Optional
+
+from fastapi import Body
+from pydantic import BaseModel, Field, model_validator
+from typing_extensions import Self
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.urbanomy_api.dto.benchmarks_dto import (BenchmarksDTO,
+                                                 non_residential_demo,
+                                                 residential_demo)
+from app.urbanomy_api.dto.InvestmentAttractivnessFzonesRequestDto import Source
+
+
+class ParameterDistribution(BaseModel):
+    parameter: str = Field(..., examples=["price_sale"], description="Benchmark field")
+    land_use_type: Optional[str] = Field(
+        None,
+        examples=["residential"],
+        description="Land-use type, all requested types having the field if omitted",
+    )
+    distribution: Literal["uniform", "triangular", "normal", "lognormal"] = Field(
+        "uniform", description="Sampling distribution"
+    )
+    relative: bool = Field(
+        True,
+        description="Samples are multipliers of the benchmark value, absolute values otherwise",
+    )
+    low: Optional[float] = Field(None, examples=[0.8], description="Uniform/triangular")
+    high: Optional[float] = Field(
+        None, examples=[1.2], description="Uniform/triangular"
+    )
+    mode: Optional[float] = Field(None, description="Triangular")
+    mean: Optional[float] = Field(
+        None, description="Normal mean, lognormal median, 1 for relative by default"
+    )
+    std: Optional[float] = Field(
+        None, description="Normal standard deviation, lognormal sigma"
+    )
+
+    @model_validator(mode="after")
+    def valid_parameters(self) -> Self:
+        if self.distribution in ("uniform", "triangular"):
+            if self.low is None or self.high is None or self.low >= self.high:
+                raise http_exception(
+                    422,
+                    f"{self.distribution} distribution requires 'low' < 'high'",
+                    self.parameter,
+                )
+            if self.distribution == "triangular" and (
+                self.mode is None or not self.low <= self.mode <= self.high
+            ):
+                raise http_exception(
+                    422,
+                    "triangular distribution requires 'low' <= 'mode' <= 'high'",
+                    self.parameter,
+                )
+        else:
+            if self.std is None or self.std <= 0:
+                raise http_exception(
+                    422,
+                    f"{self.distribution} distribution requires positive 'std'",
+                    self.parameter,
+                )
+            if self.mean is None and not self.relative:
+                raise http_exception(
+                    422,
+                    f"absolute {self.distribution} distribution requires 'mean'",
+                    self.parameter,
+                )
+            if (
+                self.distribution == "lognormal"
+                and self.mean is not None
+                and self.mean <= 0
+            ):
+                raise http_exception(
+                    422,
+                    "lognormal distribution requires positive 'mean'",
+                    self.parameter,
+                )
+        return self
+
+
+class InvestmentAttractivenessSensitivityRequestDTO(BaseModel):
+    scenario_id: int = Field(..., examples=[198], description="Scenario id")
+    source: Optional[Source] = Field(
+        None,
+        description="The source of the landuse zones data. Valid options: PZZ, OSM, User",
+    )
+    samples: int = Field(500, ge=10, examples=[500], description="Number of samples")
+    seed: int = Field(0, ge=0, description="Random seed of the samples")
+    percentiles: List[float] = Field(
+        [5.0, 50.0, 95.0], min_length=1, description="Percentiles of the bands"
+    )
+    benchmarks: BenchmarksDTO = Body(
+        default={**residential_demo, **non_residential_demo},
+        description="Benchmark parameters for each functional zone category",
+    )
+    distributions: List[ParameterDistribution] = Body(
+        ...,
+        min_length=1,
+        description="Distributions of benchmark fields",
+        examples=[
+            [
+                {"parameter": "price_sale", "low": 0.8, "high": 1.2},
+                {"parameter": "occupancy", "distribution": "normal", "std": 0.1},
+            ]
+        ],
+    )
+
+    @model_validator(mode="after")
+    def valid_percentiles(self) -> Self:
+        if any(not 0 <= q <= 100 for q in self.percentiles):
+            raise http_exception(
+                422, "percentiles must be within [0, 100]", self.percentiles
+            )
+        return self
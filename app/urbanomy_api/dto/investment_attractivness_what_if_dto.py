@@ -0,0 +1,85 @@
+from typing import List, Optional
+
+from fastapi import Body
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing_extensions import Self
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.urbanomy_api.constants.zone_mapping import VALID_ZONE_TYPE_IDS
+from app.urbanomy_api.dto.benchmarks_dto import (BenchmarksDTO,
+                                                 non_residential_demo,
+                                                 residential_demo)
+from app.urbanomy_api.dto.InvestmentAttractivnessFzonesRequestDto import Source
+from app.urbanomy_api.schemas.features_model import (EXAMPLE_GEOMETRY,
+                                                     PolygonalGeometry)
+
+
+class ZoneChange(BaseModel):
+    functional_zone_id: Optional[int] = Field(
+        None,
+        examples=[7],
+        description="Id of the edited zone, new zones are added without id",
+    )
+    zone_type_id: Optional[int] = Field(
+        None, examples=[1], description="New zone type id"
+    )
+    geometry: Optional[PolygonalGeometry] = Field(
+        None, description="New zone geometry in EPSG:4326"
+    )
+    delete: bool = Field(False, description="Remove the zone")
+
+    @field_validator("zone_type_id", mode="after")
+    @classmethod
+    def valid_zone_type_id(cls, v: Optional[int]) -> Optional[int]:
+        if v is not None and v not in VALID_ZONE_TYPE_IDS:
+            allowed = ", ".join(map(str, sorted(VALID_ZONE_TYPE_IDS)))
+            raise http_exception(
+                400, f"Invalid zone_type_id", v, f"Valid zone_type_ids: {allowed}"
+            )
+        return v
+
+    @model_validator(mode="after")
+    def complete_change(self) -> Self:
+        if self.functional_zone_id is None:
+            if self.delete or self.zone_type_id is None or self.geometry is None:
+                raise http_exception(
+                    422, "new zones must include 'zone_type_id' and 'geometry'"
+                )
+        elif not self.delete and self.zone_type_id is None and self.geometry is None:
+            raise http_exception(
+                422,
+                "zone changes must include 'zone_type_id', 'geometry' or 'delete'",
+                self.functional_zone_id,
+            )
+        return self
+
+
+class InvestmentAttractivenessWhatIfRequestDTO(BaseModel):
+    scenario_id: int = Field(..., examples=[198], description="Scenario id")
+    as_geojson: bool = Field(
+        ..., examples=[False], description="Return changed zones as GeoJSON"
+    )
+    source: Optional[Source] = Field(
+        None,
+        description="The source of the landuse zones data. Valid options: PZZ, OSM, User",
+    )
+    baseline: Optional[str] = Field(
+        None,
+        description="ETag of the functional zones result the changes were made against",
+    )
+    benchmarks: BenchmarksDTO = Body(
+        default={**residential_demo, **non_residential_demo},
+        description="Benchmark parameters for each functional zone category",
+    )
+    changes: List[ZoneChange] = Body(
+        ...,
+        min_length=1,
+        description="Changed, added and removed functional zones",
+        examples=[
+            [
+                {"functional_zone_id": 7, "zone_type_id": 2},
+                {"zone_type_id": 1, "geometry": EXAMPLE_GEOMETRY},
+                {"functional_zone_id": 8, "delete": True},
+            ]
+        ],
+    )
@@ -0,0 +1,44 @@
+import json
+
+from fastapi import UploadFile
+from pydantic import BaseModel, Field, ValidationError
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.urbanomy_api.dto.benchmarks_dto import (BenchmarksDTO,
+                                                 non_residential_demo,
+                                                 residential_demo)
+
+
+class InvestmentAttractivenessLayerDto(BaseModel):
+    scenario_id: int = Field(..., examples=[198], description="Scenario id")
+    as_geojson: bool = Field(
+        ..., examples=[False], description="Which format to return"
+    )
+    layer: UploadFile = Field(
+        ...,
+        description="GeoParquet, FlatGeobuf or Arrow IPC / Parquet table with a WKB "
+        "geometry column, polygons with an integer zone_type_id column",
+    )
+    geometry_column: str = Field(
+        default="geometry",
+        description="WKB geometry column of tables without GeoParquet metadata",
+    )
+    crs: int = Field(
+        default=4326,
+        examples=[4326],
+        description="EPSG code of layers which do not declare their CRS",
+    )
+    benchmarks: str = Field(
+        default=json.dumps({**residential_demo, **non_residential_demo}),
+        description="Benchmark parameters for each functional zone category as JSON",
+    )
+
+    def benchmarks_dto(self) -> BenchmarksDTO:
+        try:
+            return BenchmarksDTO.model_validate_json(self.benchmarks)
+        except ValidationError as e:
+            raise http_exception(
+                422,
+                "Invalid benchmarks",
+                _detail=json.loads(e.json(include_url=False, include_input=False)),
+            )
@@ -0,0 +1,24 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.urbanomy_api.modules.stored_result_service import \
+    STORED_RESULT_MAX_LIMIT
+
+
+class ResultPageDto(BaseModel):
+    page_size: Optional[int] = Field(
+        None,
+        ge=1,
+        le=STORED_RESULT_MAX_LIMIT,
+        examples=[1000],
+        description="Return GeoJSON results in pages of this many zones, the response "
+        "holds the first page and next_cursor for /stored_results/{scenario_id}/zones",
+    )
+
+    def check_geojson(self, as_geojson: bool) -> None:
+        if self.page_size is not None and not as_geojson:
+            raise http_exception(
+                400, "Only GeoJSON results are paginated", "page_size", "Set as_geojson"
+            )
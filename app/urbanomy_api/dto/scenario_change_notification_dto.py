@@ -0,0 +1,36 @@
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel, Field, model_validator
+from typing_extensions import Self
+
+
+class ChangeEvent(str, Enum):
+    indicators = "indicators"
+    functional_zones = "functional_zones"
+    territory = "territory"
+    scenario = "scenario"
+
+
+class ScenarioChangeNotificationDTO(BaseModel):
+    scenario_id: Optional[int] = Field(
+        None, examples=[198], description="Changed scenario id"
+    )
+    project_id: Optional[int] = Field(
+        None,
+        examples=[72],
+        description="Changed project id, all known scenarios of the project are invalidated",
+    )
+    event: ChangeEvent = Field(
+        ChangeEvent.scenario, description="What has been changed upstream"
+    )
+    prewarm: bool = Field(
+        False,
+        description="Recalculate default benchmarks results in background after invalidation",
+    )
+
+    @model_validator(mode="after")
+    def validate_target(self) -> Self:
+        if self.scenario_id is None and self.project_id is None:
+            raise ValueError("Either scenario_id or project_id must be provided")
+        return self
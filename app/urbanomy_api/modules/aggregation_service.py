@@ -0,0 +1,275 @@
+import json
+import math
+from typing import Any, Dict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import get_setting
+from app.urbanomy_api.constants.zone_mapping import zone_mapping
+from app.urbanomy_api.dto.investment_attractivness_aggregation_dto import \
+    Aggregation
+from app.urbanomy_api.modules.compiled_benchmarks import CompiledBenchmarks
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+
+# Upper bound of generated cells, guards against tiny cells over large territories
+MAX_GRID_CELLS = int(get_setting("MAX_GRID_CELLS", "200000"))
+
+# Metrics which are totals of a zone, they are split between cells by overlapped area.
+# All other numeric metrics are intensive and averaged with overlapped area weights.
+ADDITIVE_METRICS = frozenset({"ECON_NPV"})
+
+# Unit hexagon vertices, pointy-top with circumradius 1
+_HEX_ANGLES = np.radians(np.arange(30, 390, 60))
+_HEX_VERTICES = np.stack([np.cos(_HEX_ANGLES), np.sin(_HEX_ANGLES)], axis=1)
+
+
+class AggregationService:
+    @staticmethod
+    def metric_columns(gdf: gpd.GeoDataFrame) -> tuple[list[str], list[str]]:
+        """Additive and area-weighted numeric metric columns of per-zone results."""
+
+        numeric = [
+            col
+            for col in gdf.columns
+            if col not in (gdf.geometry.name, "area")
+            and not col.endswith("_id")
+            and pd.api.types.is_numeric_dtype(gdf[col])
+        ]
+        additive = [col for col in numeric if col in ADDITIVE_METRICS]
+        weighted = [col for col in numeric if col not in ADDITIVE_METRICS]
+        return additive, weighted
+
+    @staticmethod
+    def make_grid(
+        bounds: tuple[float, float, float, float], cell_size: float, shape: Aggregation
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Cells covering bounds and their ids. Grids are anchored at the CRS origin, so
+        cells of one size are identical between requests and scenarios.
+        """
+
+        minx, miny, maxx, maxy = bounds
+        if shape == Aggregation.square:
+            step_x = step_y = cell_size
+        else:
+            radius = cell_size / math.sqrt(3)
+            step_x, step_y = cell_size, 1.5 * radius
+        # hexagon rows are shifted by half a cell, one extra column and row covers it
+        margin = 0 if shape == Aggregation.square else 1
+        cols = np.arange(
+            math.floor(minx / step_x) - margin, math.ceil(maxx / step_x) + margin
+        )
+        rows = np.arange(
+            math.floor(miny / step_y) - margin, math.ceil(maxy / step_y) + margin
+        )
+        if len(cols) * len(rows) > MAX_GRID_CELLS:
+            raise http_exception(
+                400,
+                "Grid cell size is too small for the scenario territory",
+                _input={"cell_size": cell_size},
+                _detail={"cells": len(cols) * len(rows), "max_cells": MAX_GRID_CELLS},
+            )
+
+        col, row = (a.ravel() for a in np.meshgrid(cols, rows))
+        ids = np.char.add(np.char.add(col.astype(str), "_"), row.astype(str))
+        if shape == Aggregation.square:
+            x, y = col * step_x, row * step_y
+            return shapely.box(x, y, x + step_x, y + step_y), ids
+
+        cx = col * step_x + (row % 2) * step_x / 2
+        cy = row * step_y
+        ring = np.stack([cx, cy], axis=1)[:, None, :] + radius * _HEX_VERTICES
+        ring = np.concatenate([ring, ring[:, :1]], axis=1)
+        return shapely.polygons(ring), ids
+
+    @staticmethod
+    def aggregate_metrics(
+        zones: gpd.GeoDataFrame,
+        zone_idx: np.ndarray,
+        group_idx: np.ndarray,
+        piece_area: np.ndarray,
+        n_groups: int,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Rolls per-zone metrics up to groups from zone pieces, each piece being the part
+        of zone `zone_idx` falling into group `group_idx`.
+        """
+
+        zone_area = zones.geometry.area.to_numpy()[zone_idx]
+        share = np.divide(
+            piece_area, zone_area, out=np.zeros_like(piece_area), where=zone_area > 0
+        )
+        result = {
+            "area": np.bincount(group_idx, piece_area, n_groups),
+            "zone_count": np.bincount(group_idx, minlength=n_groups),
+        }
+        additive, weighted = AggregationService.metric_columns(zones)
+        for col in additive:
+            values = zones[col].to_numpy(dtype="float64", na_value=np.nan)[zone_idx]
+            valid = ~np.isnan(values)
+            result[col] = np.bincount(
+                group_idx[valid], values[valid] * share[valid], n_groups
+            )
+        for col in weighted:
+            values = zones[col].to_numpy(dtype="float64", na_value=np.nan)[zone_idx]
+            valid = ~np.isnan(values)
+            weights = np.bincount(group_idx[valid], piece_area[valid], n_groups)
+            totals = np.bincount(
+                group_idx[valid], values[valid] * piece_area[valid], n_groups
+            )
+            result[col] = np.divide(
+                totals,
+                weights,
+                out=np.full(n_groups, np.nan),
+                where=weights > 0,
+            )
+        return result
+
+    @staticmethod
+    def _prepare_zones(gdf_out: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        zones = gdf_out[~(gdf_out.geometry.is_empty | gdf_out.geometry.isna())]
+        if zones.crs is not None and zones.crs.is_geographic:
+            zones = zones.to_crs(zones.estimate_utm_crs())
+        geometry = zones.geometry.to_numpy()
+        invalid = ~shapely.is_valid(geometry)
+        if invalid.any():
+            geometry = geometry.copy()
+            geometry[invalid] = shapely.make_valid(geometry[invalid])
+            zones = zones.set_geometry(gpd.GeoSeries(geometry, index=zones.index))
+        return zones.reset_index(drop=True)
+
+    @staticmethod
+    def aggregate_grid(
+        gdf_out: gpd.GeoDataFrame, shape: Aggregation, cell_size: float
+    ) -> gpd.GeoDataFrame:
+        """Area-weighted per-zone metrics of grid cells intersecting zones."""
+
+        zones = AggregationService._prepare_zones(gdf_out)
+        cells, ids = AggregationService.make_grid(
+            tuple(zones.total_bounds), cell_size, shape
+        )
+        zone_geometry = zones.geometry.to_numpy()
+        zone_idx, cell_idx = shapely.STRtree(cells).query(
+            zone_geometry, predicate="intersects"
+        )
+        piece_area = shapely.area(
+            shapely.intersection(zone_geometry[zone_idx], cells[cell_idx])
+        )
+        keep = piece_area > 0
+        zone_idx, cell_idx, piece_area = (
+            zone_idx[keep],
+            cell_idx[keep],
+            piece_area[keep],
+        )
+        used, group_idx = np.unique(cell_idx, return_inverse=True)
+
+        metrics = AggregationService.aggregate_metrics(
+            zones, zone_idx, group_idx, piece_area, len(used)
+        )
+        # land-use type covering the largest part of each cell
+        pieces = pd.DataFrame(
+            {
+                "group": group_idx,
+                "ip_type": zones["ip_type"].to_numpy()[zone_idx],
+                "area": piece_area,
+            }
+        )
+        dominant = (
+            pieces.groupby(["group", "ip_type"], observed=True)["area"]
+            .sum()
+            .reset_index()
+            .sort_values("area", ascending=False, kind="stable")
+            .drop_duplicates("group")
+            .set_index("group")["ip_type"]
+            .reindex(np.arange(len(used)))
+            .astype(str)
+        )
+
+        cell_area = shapely.area(cells[used])
+        return gpd.GeoDataFrame(
+            {
+                "cell_id": ids[used],
+                "land_use_type_name": dominant.to_numpy(),
+                "coverage": metrics["area"] / cell_area,
+                **metrics,
+            },
+            geometry=cells[used],
+            crs=zones.crs,
+        )
+
+    @staticmethod
+    def aggregate_zone_types(gdf_out: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """Per-zone metrics dissolved by land-use type."""
+
+        zones = AggregationService._prepare_zones(gdf_out)
+        types, group_idx = np.unique(
+            zones["ip_type"].astype(str).to_numpy(), return_inverse=True
+        )
+        zone_idx = np.arange(len(zones))
+        metrics = AggregationService.aggregate_metrics(
+            zones, zone_idx, group_idx, zones.geometry.area.to_numpy(), len(types)
+        )
+        zone_geometry = zones.geometry.to_numpy()
+        geometry = [
+            shapely.union_all(zone_geometry[group_idx == i]) for i in range(len(types))
+        ]
+        return gpd.GeoDataFrame(
+            {"land_use_type_name": types, **metrics},
+            geometry=geometry,
+            crs=zones.crs,
+        )
+
+    @staticmethod
+    def aggregate(
+        gdf_out: gpd.GeoDataFrame, aggregation: Aggregation, cell_size: float
+    ) -> Dict[str, Any]:
+        """GeoJSON FeatureCollection of aggregated per-zone metrics."""
+
+        if gdf_out.empty:
+            return {"type": "FeatureCollection", "features": []}
+        try:
+            if aggregation == Aggregation.zone_type:
+                gdf = AggregationService.aggregate_zone_types(gdf_out)
+            else:
+                gdf = AggregationService.aggregate_grid(gdf_out, aggregation, cell_size)
+        except shapely.errors.GEOSException as e:
+            raise http_exception(
+                500,
+                "Error occurred while aggregating investment attractiveness",
+                _detail={"error": str(e)},
+            )
+        gdf["land_use_type_id"] = (
+            gdf["land_use_type_name"].map(zone_mapping).astype("Int64")
+        )
+        return json.loads(gdf.to_crs(4326).to_json(drop_id=True))
+
+    @staticmethod
+    async def run_aggregation(
+        scenario_id: int,
+        benchmarks: CompiledBenchmarks,
+        aggregation: Aggregation,
+        cell_size: float,
+        source: str = None,
+        token: str = None,
+        year: int = None,
+    ) -> Dict[str, Any]:
+        logger.info(
+            f"Running investment aggregation "
+            f"for scenario {scenario_id}, "
+            f"aggregation={aggregation.value}, "
+            f"cell_size={cell_size}, "
+            f"benchmarks={benchmarks}"
+        )
+        gdf_out, _ = await InvestmentPotentialService.compute_investment_fzones(
+            scenario_id, benchmarks, source=source, token=token, year=year
+        )
+        return await run_in_threadpool(
+            AggregationService.aggregate, gdf_out, aggregation, cell_size
+        )
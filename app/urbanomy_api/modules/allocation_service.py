@@ -0,0 +1,299 @@
+import json
+from typing import Any, Dict, List
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from scipy.optimize import Bounds, LinearConstraint, milp
+from scipy.sparse import csr_matrix, vstack
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import get_setting
+from app.urbanomy_api.constants.zone_mapping import zone_mapping
+from app.urbanomy_api.dto.investment_attractivness_allocation_dto import \
+    AllocationConstraint
+from app.urbanomy_api.modules.compiled_benchmarks import CompiledBenchmarks
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+
+# Solver time limit in seconds, the best allocation found so far is returned on expiry
+ALLOCATION_TIME_LIMIT = float(get_setting("ALLOCATION_TIME_LIMIT", "10"))
+
+
+class AllocationService:
+    @staticmethod
+    def metric_matrix(
+        zones: gpd.GeoDataFrame | pd.DataFrame,
+        score_gdf: gpd.GeoDataFrame,
+        benchmarks: CompiledBenchmarks,
+        metric: str,
+    ) -> np.ndarray:
+        """
+        Metric of every zone under every benchmarked land-use type, shape
+        (zones, len(benchmarks.keys)). Zones are stacked once per land-use type and
+        evaluated in a single analyzer pass.
+        """
+
+        if isinstance(zones, gpd.GeoDataFrame):
+            zones = InvestmentPotentialService.drop_geometry(zones)
+        types = list(benchmarks.keys)
+        potential = InvestmentPotentialService.potential_values(score_gdf)
+        n = len(zones)
+
+        stacked = zones.drop(columns=["ip_type", "ip_value"]).take(
+            np.tile(np.arange(n), len(types))
+        )
+        stacked = stacked.reset_index(drop=True)
+        stacked["ip_type"] = pd.Categorical(np.repeat(types, n), categories=types)
+        stacked["ip_value"] = np.repeat(
+            np.array([potential.get(t, np.nan) for t in types], dtype="float32"), n
+        )
+        gdf_out, _ = InvestmentPotentialService.calculate_investment_attractiveness(
+            stacked, benchmarks
+        )
+        if metric not in gdf_out.columns or not pd.api.types.is_numeric_dtype(
+            gdf_out[metric]
+        ):
+            raise http_exception(
+                400,
+                "Unknown metric",
+                metric,
+                {
+                    "metrics": [
+                        col
+                        for col in gdf_out.columns
+                        if col not in stacked.columns
+                        and pd.api.types.is_numeric_dtype(gdf_out[col])
+                    ]
+                },
+            )
+
+        matrix = np.full(n * len(types), np.nan)
+        matrix[gdf_out.index.to_numpy()] = gdf_out[metric].to_numpy(
+            dtype="float64", na_value=np.nan
+        )
+        return matrix.reshape(len(types), n).T
+
+    @staticmethod
+    def allocate(
+        matrix: np.ndarray,
+        area: np.ndarray,
+        types: List[str],
+        constraints: List[AllocationConstraint],
+    ) -> tuple[np.ndarray, str]:
+        """
+        Index of the allocated land-use type of each zone (-1 for zones without
+        options) and solution status.
+
+        Without constraints every zone independently takes its best type. With area
+        constraints the allocation is solved as a binary program over the non-empty
+        cells of the matrix.
+        """
+
+        valid = ~np.isnan(matrix)
+        has_option = valid.any(axis=1)
+        if not constraints:
+            best = np.nanargmax(np.where(valid, matrix, -np.inf), axis=1)
+            return np.where(has_option, best, -1), "optimal"
+
+        zone_idx, type_idx = np.nonzero(valid)
+        n_vars = len(zone_idx)
+        option_rows = np.cumsum(has_option) - 1
+        assignment = csr_matrix(
+            (np.ones(n_vars), (option_rows[zone_idx], np.arange(n_vars))),
+            shape=(int(has_option.sum()), n_vars),
+        )
+        lower = np.ones(assignment.shape[0])
+        upper = np.ones(assignment.shape[0])
+        total_area = float(area[has_option].sum())
+        bound_rows, bound_lower, bound_upper = [], [], []
+        for constraint in constraints:
+            if constraint.land_use_type not in types:
+                raise http_exception(
+                    400,
+                    "Constrained land-use type is not benchmarked",
+                    constraint.land_use_type,
+                    {"land_use_types": types},
+                )
+            t = types.index(constraint.land_use_type)
+            mask = type_idx == t
+            bound_rows.append(
+                csr_matrix(
+                    (
+                        area[zone_idx[mask]],
+                        (np.zeros(mask.sum()), np.flatnonzero(mask)),
+                    ),
+                    shape=(1, n_vars),
+                )
+            )
+            bound_lower.append(
+                max(
+                    constraint.min_area or 0.0,
+                    (constraint.min_share or 0.0) * total_area,
+                )
+            )
+            bound_upper.append(
+                min(
+                    np.inf if constraint.max_area is None else constraint.max_area,
+                    (
+                        np.inf
+                        if constraint.max_share is None
+                        else constraint.max_share * total_area
+                    ),
+                )
+            )
+
+        # objective is scaled to keep solver tolerances meaningful for large values
+        objective = -matrix[zone_idx, type_idx]
+        scale = np.abs(objective).max() or 1.0
+        result = milp(
+            objective / scale,
+            constraints=[
+                LinearConstraint(
+                    vstack([assignment, *bound_rows]).tocsr(),
+                    np.concatenate([lower, bound_lower]),
+                    np.concatenate([upper, bound_upper]),
+                )
+            ],
+            integrality=np.ones(n_vars),
+            bounds=Bounds(0, 1),
+            options={"time_limit": ALLOCATION_TIME_LIMIT},
+        )
+        if result.x is None:
+            raise http_exception(
+                422,
+                "Allocation constraints cannot be satisfied",
+                [c.model_dump() for c in constraints],
+                {"solver": result.message, "total_area": total_area},
+            )
+
+        chosen = result.x > 0.5
+        best = np.full(len(matrix), -1)
+        best[zone_idx[chosen]] = type_idx[chosen]
+        return best, "optimal" if result.status == 0 else "time_limit"
+
+    @staticmethod
+    def evaluate(
+        zones: gpd.GeoDataFrame | pd.DataFrame,
+        score_gdf: gpd.GeoDataFrame,
+        benchmarks: CompiledBenchmarks,
+        metric: str,
+        constraints: List[AllocationConstraint],
+        as_geojson: bool,
+    ) -> Dict[str, Any]:
+        """Best land-use allocation of zones with the full metric matrix."""
+
+        types = list(benchmarks.keys)
+        matrix = AllocationService.metric_matrix(zones, score_gdf, benchmarks, metric)
+        area = zones["area"].to_numpy(dtype="float64")
+        best, status = AllocationService.allocate(matrix, area, types, constraints)
+
+        allocated = best >= 0
+        best_value = np.full(len(best), np.nan)
+        best_value[allocated] = matrix[allocated, best[allocated]]
+        type_position = {name: i for i, name in enumerate(types)}
+        current = zones["ip_type"].astype(str).map(type_position).to_numpy()
+        current_value = np.full(len(best), np.nan)
+        has_current = ~pd.isna(current)
+        current_value[has_current] = matrix[
+            has_current, current[has_current].astype(int)
+        ]
+
+        out = zones.drop(columns=["ip_type", "ip_value"])
+        out["land_use_type_name"] = zones["ip_type"].astype(str).to_numpy()
+        out["land_use_type_id"] = (
+            out["land_use_type_name"].map(zone_mapping).astype("Int64")
+        )
+        out["best_land_use_type_name"] = np.where(
+            allocated, np.array(types, dtype=object)[np.maximum(best, 0)], None
+        )
+        out["best_land_use_type_id"] = (
+            out["best_land_use_type_name"].map(zone_mapping).astype("Int64")
+        )
+        out[metric] = current_value
+        out[f"best_{metric}"] = best_value
+        out["gain"] = best_value - current_value
+        out["values"] = [
+            [None if np.isnan(v) else v for v in row] for row in matrix.tolist()
+        ]
+
+        allocation = (
+            pd.DataFrame(
+                {
+                    "land_use_type": out["best_land_use_type_name"],
+                    "area": area,
+                    metric: best_value,
+                }
+            )
+            .dropna(subset=["land_use_type"])
+            .groupby("land_use_type")
+            .agg(area=("area", "sum"), zones=("area", "size"), total=(metric, "sum"))
+            .rename(columns={"total": metric})
+            .reset_index()
+        )
+        allocation["land_use_type_id"] = (
+            allocation["land_use_type"].map(zone_mapping).astype("Int64")
+        )
+
+        if as_geojson:
+            zones_content = json.loads(out.to_crs(4326).to_json(drop_id=True))
+        else:
+            zones_content = InvestmentPotentialService.zone_records(
+                pd.DataFrame(out.drop(columns=out.geometry.name))
+                if isinstance(out, gpd.GeoDataFrame)
+                else out
+            )
+        return {
+            "metric": metric,
+            "status": status,
+            "objective": float(np.nansum(best_value)),
+            "land_use_types": types,
+            "allocation": allocation.to_dict(orient="records"),
+            "zones": zones_content,
+        }
+
+    @staticmethod
+    async def run_allocation(
+        scenario_id: int,
+        as_geojson: bool,
+        benchmarks: CompiledBenchmarks,
+        metric: str,
+        constraints: List[AllocationConstraint],
+        source: str = None,
+        token: str = None,
+    ) -> Dict[str, Any]:
+        logger.info(
+            f"Running land-use allocation "
+            f"for scenario {scenario_id}, "
+            f"metric={metric}, "
+            f"constraints={len(constraints)}, "
+            f"benchmarks={benchmarks}"
+        )
+        landuse_score_gdf, score_key = (
+            await InvestmentPotentialService.territory_values_stage(
+                scenario_id, benchmarks, as_long=True, token=token
+            )
+        )
+        functional_zones_gdf = await UrbanAPIGateway.get_functional_zones(
+            scenario_id, source=source, token=token
+        )
+        if as_geojson:
+            zones = await InvestmentPotentialService.mapped_zones_stage(
+                landuse_score_gdf, score_key, functional_zones_gdf
+            )
+        else:
+            zones = await InvestmentPotentialService.zone_values_stage(
+                landuse_score_gdf, score_key, functional_zones_gdf
+            )
+        return await run_in_threadpool(
+            AllocationService.evaluate,
+            zones,
+            landuse_score_gdf,
+            benchmarks,
+            metric,
+            constraints,
+            as_geojson,
+        )
@@ -0,0 +1,170 @@
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException
+from loguru import logger
+
+from app.dependencies import calculation_admission, get_setting
+from app.urbanomy_api.dto.scenario_change_notification_dto import (
+    ChangeEvent, ScenarioChangeNotificationDTO)
+from app.urbanomy_api.modules.compiled_benchmarks import DEFAULT_BENCHMARKS
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.memory_estimator import MemoryEstimator
+from app.urbanomy_api.modules.result_cache import ResultCache
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+
+# Admission and memory rejections, pre-warming is skipped while the worker is loaded
+PREWARM_SKIP_STATUSES = (413, 429, 503)
+
+# Gateway key scopes affected by each kind of upstream change
+EVENT_SCOPES = {
+    ChangeEvent.indicators: "indicators",
+    ChangeEvent.functional_zones: "functional_zone",
+    ChangeEvent.territory: None,
+    ChangeEvent.scenario: "",
+}
+
+
+class CacheInvalidationService:
+    @staticmethod
+    async def invalidate(notification: ScenarioChangeNotificationDTO) -> dict:
+        """
+        Drops gateway and result cache entries affected by an upstream change.
+
+        Project notifications affect every scenario of the project served before.
+        Stage artifacts are keyed by content and need no invalidation.
+        """
+
+        scenario_ids: set[int] = set()
+        project_ids: set[int] = set()
+        if notification.scenario_id is not None:
+            scenario_ids.add(notification.scenario_id)
+        if notification.project_id is not None:
+            project_ids.add(notification.project_id)
+            scenario_ids |= await UrbanAPIGateway.get_known_scenarios(
+                notification.project_id
+            )
+
+        gateway_entries = 0
+        scope = EVENT_SCOPES[notification.event]
+        if notification.event in (ChangeEvent.territory, ChangeEvent.scenario):
+            for scenario_id in scenario_ids:
+                project_id = await UrbanAPIGateway.get_known_project(scenario_id)
+                if project_id is not None:
+                    project_ids.add(project_id)
+            for project_id in project_ids:
+                gateway_entries += await UrbanAPIGateway.invalidate_project(project_id)
+        if scope is not None:
+            for scenario_id in scenario_ids:
+                gateway_entries += await UrbanAPIGateway.invalidate_scenario(
+                    scenario_id, scope
+                )
+
+        result_entries = 0
+        for scenario_id in scenario_ids:
+            result_entries += await ResultCache.invalidate_scenario(scenario_id)
+
+        logger.info(
+            f"Invalidated {gateway_entries} gateway and {result_entries} result entries "
+            f"for scenarios {sorted(scenario_ids)}, projects {sorted(project_ids)}"
+        )
+        return {
+            "scenario_ids": sorted(scenario_ids),
+            "project_ids": sorted(project_ids),
+            "gateway_entries": gateway_entries,
+            "result_entries": result_entries,
+        }
+
+    @staticmethod
+    def get_service_token() -> str | None:
+        """Token used for background calls to Urban API, None disables pre-warming."""
+
+        return get_setting("URBAN_API_SERVICE_TOKEN")
+
+    @staticmethod
+    async def _admitted(
+        token: str,
+        estimate: Callable[[], Awaitable[int]],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Runs a pre-warming calculation within the memory budget and admission limits."""
+
+        return await MemoryEstimator.guard(
+            estimate, lambda: calculation_admission.run(token, compute)
+        )
+
+    @staticmethod
+    async def prewarm_scenario(scenario_id: int, token: str) -> None:
+        """
+        Calculates default benchmarks results of a scenario into the result cache.
+
+        Keys are built the same way as in the calculation endpoints, so a following
+        user request with default benchmarks is served from cache.
+        """
+
+        async def _noop() -> None:
+            return None
+
+        try:
+            territory_upstream = await InvestmentPotentialService.upstream_fingerprint(
+                scenario_id, token
+            )
+            fzones_upstream = await InvestmentPotentialService.upstream_fingerprint(
+                scenario_id, token, with_zones=True
+            )
+        except Exception as e:
+            logger.warning(f"Pre-warming scenario {scenario_id} failed: {e!r}")
+            return
+
+        for as_geojson in (False, True):
+            try:
+                await ResultCache.get_or_compute(
+                    ResultCache.build_key(
+                        "territory",
+                        scenario_id,
+                        as_geojson=as_geojson,
+                        benchmarks=DEFAULT_BENCHMARKS.digest,
+                        upstream=territory_upstream,
+                    ),
+                    lambda: CacheInvalidationService._admitted(
+                        token,
+                        lambda: MemoryEstimator.scenario(scenario_id, token),
+                        lambda: InvestmentPotentialService.run_investment_calculation(
+                            scenario_id, as_geojson, DEFAULT_BENCHMARKS, token
+                        ),
+                    ),
+                    _noop,
+                )
+                await ResultCache.get_or_compute(
+                    ResultCache.build_key(
+                        "fzones",
+                        scenario_id,
+                        as_geojson=as_geojson,
+                        benchmarks=DEFAULT_BENCHMARKS.digest,
+                        source=None,
+                        upstream=fzones_upstream,
+                    ),
+                    lambda: CacheInvalidationService._admitted(
+                        token,
+                        lambda: MemoryEstimator.scenario(
+                            scenario_id, token, with_zones=True
+                        ),
+                        lambda: InvestmentPotentialService.run_investment_calculation_fzones(
+                            scenario_id, as_geojson, DEFAULT_BENCHMARKS, None, token
+                        ),
+                    ),
+                    _noop,
+                )
+            except HTTPException as e:
+                if e.status_code in PREWARM_SKIP_STATUSES:
+                    logger.info(
+                        f"Pre-warming scenario {scenario_id} skipped, "
+                        f"calculation not admitted with {e.status_code}"
+                    )
+                else:
+                    logger.warning(f"Pre-warming scenario {scenario_id} failed: {e!r}")
+                return
+            except Exception as e:
+                logger.warning(f"Pre-warming scenario {scenario_id} failed: {e!r}")
+                return
+        logger.info(f"Default results pre-warmed for scenario {scenario_id}")
@@ -0,0 +1,165 @@
+import time
+from typing import Any, AsyncGenerator, Dict, List
+
+import geopandas as gpd
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.common.sse.sse import format_event
+from app.dependencies import calculation_admission, get_setting
+from app.urbanomy_api.modules.compiled_benchmarks import CompiledBenchmarks
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.memory_estimator import MemoryEstimator
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+from app.urbanomy_api.modules.what_if_service import SUMMARY_TOTALS
+
+# Number of zones calculated and sent in one partial result
+STREAM_CHUNK_SIZE = int(get_setting("STREAM_CHUNK_SIZE", "2000"))
+
+
+class CalculationStreamService:
+    @staticmethod
+    def combine_summaries(
+        parts: List[tuple[pd.DataFrame, pd.DataFrame]],
+    ) -> pd.DataFrame:
+        """
+        Summary of all zones from per-chunk results and summaries. Totals are summed,
+        means are weighted with chunk zone counts.
+        """
+
+        if not parts:
+            return pd.DataFrame()
+        columns = list(parts[0][1].columns)
+        sums, counts = [], []
+        for gdf_out, summary in parts:
+            metrics = [col for col in columns if col in gdf_out.columns]
+            means = [col for col in metrics if col not in SUMMARY_TOTALS]
+            count = gdf_out.groupby(gdf_out["ip_type"].astype(str))[means].count()
+            part = summary[metrics].copy()
+            part[means] = part[means] * count.reindex(part.index)
+            sums.append(part)
+            counts.append(count)
+        total = pd.concat(sums).groupby(level=0).sum(min_count=1)
+        count = pd.concat(counts).groupby(level=0).sum()
+        means = list(count.columns)
+        total[means] = total[means] / count.where(count > 0)
+        total.index.name = parts[0][1].index.name
+        return total.reindex(columns=columns)
+
+    @staticmethod
+    def chunk_content(
+        gdf_out: gpd.GeoDataFrame | pd.DataFrame, as_geojson: bool
+    ) -> Dict[str, Any] | List[Dict[str, Any]]:
+        """Partial result of a chunk, FeatureCollection or records without geometry."""
+
+        if as_geojson:
+            return InvestmentPotentialService.generate_response(
+                gdf_out, None, as_geojson=True
+            )
+        return InvestmentPotentialService.zone_records(gdf_out)
+
+    @staticmethod
+    def progress(stage: str, **detail) -> bytes:
+        return format_event("progress", {"stage": stage, **detail})
+
+    @staticmethod
+    async def stream_fzones(
+        scenario_id: int,
+        as_geojson: bool,
+        benchmarks: CompiledBenchmarks,
+        source: str = None,
+        token: str = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Functional zones calculation as server-sent events: `progress` of each stage,
+        `zones` with per-zone results of every chunk of zones as soon as it is
+        calculated, then `summary` and `done`. Failures after the stream started are
+        sent as an `error` event.
+
+        The first event is yielded once memory is reserved and the calculation is
+        admitted. Closing the generator stops the calculation after the running chunk.
+        """
+
+        async with MemoryEstimator.reserve(
+            lambda: MemoryEstimator.scenario(
+                scenario_id, token, with_zones=True, source=source
+            )
+        ), calculation_admission.admit(token):
+            started = time.monotonic()
+            yield CalculationStreamService.progress("fetching")
+            try:
+                await UrbanAPIGateway.get_territory(scenario_id, token=token)
+                await UrbanAPIGateway.get_indicator_values(scenario_id, token=token)
+                functional_zones_gdf = await UrbanAPIGateway.get_functional_zones(
+                    scenario_id, source=source, token=token
+                )
+
+                yield CalculationStreamService.progress("scoring")
+                landuse_score_gdf, score_key = (
+                    await InvestmentPotentialService.territory_values_stage(
+                        scenario_id, benchmarks, as_long=True, token=token
+                    )
+                )
+
+                yield CalculationStreamService.progress("mapping")
+                if as_geojson:
+                    mapped_zones = await InvestmentPotentialService.mapped_zones_stage(
+                        landuse_score_gdf, score_key, functional_zones_gdf
+                    )
+                else:
+                    mapped_zones = await InvestmentPotentialService.zone_values_stage(
+                        landuse_score_gdf, score_key, functional_zones_gdf
+                    )
+                mapped_zones = mapped_zones[
+                    mapped_zones["ip_type"].isin(benchmarks.keys).to_numpy()
+                ]
+
+                total = len(mapped_zones)
+                parts = []
+                yield CalculationStreamService.progress(
+                    "attractiveness", done=0, total=total
+                )
+                for start in range(0, total, STREAM_CHUNK_SIZE):
+                    chunk = mapped_zones.iloc[start : start + STREAM_CHUNK_SIZE]
+                    gdf_out, summary = (
+                        await InvestmentPotentialService.attractiveness_stage(
+                            chunk, benchmarks
+                        )
+                    )
+                    parts.append((gdf_out, summary))
+                    content = await run_in_threadpool(
+                        CalculationStreamService.chunk_content, gdf_out, as_geojson
+                    )
+                    yield format_event("zones", content)
+                    yield CalculationStreamService.progress(
+                        "attractiveness", done=start + len(chunk), total=total
+                    )
+
+                yield CalculationStreamService.progress("serializing")
+                summary = await run_in_threadpool(
+                    CalculationStreamService.combine_summaries, parts
+                )
+                content = await InvestmentPotentialService.response_stage(
+                    None, summary, as_geojson=False
+                )
+                yield format_event("summary", content)
+            except HTTPException as e:
+                yield format_event(
+                    "error", {"status_code": e.status_code, "detail": e.detail}
+                )
+                return
+            except Exception as e:
+                logger.exception(
+                    f"Calculation stream for scenario {scenario_id} failed"
+                )
+                yield format_event(
+                    "error", {"status_code": 500, "detail": {"error": str(e)}}
+                )
+                return
+            yield format_event(
+                "done",
+                {"zones": total, "elapsed": round(time.monotonic() - started, 3)},
+            )
@@ -0,0 +1,200 @@
+import asyncio
+from typing import Any, Awaitable, Iterable
+
+import pandas as pd
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.common.cache.fingerprint import fingerprint
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import get_setting, tracer
+from app.urbanomy_api.constants.zone_mapping import zone_mapping
+from app.urbanomy_api.modules.aggregation_service import ADDITIVE_METRICS
+from app.urbanomy_api.modules.compiled_benchmarks import CompiledBenchmarks
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.memory_estimator import MemoryEstimator
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+
+# Largest number of source and year combinations compared in one request
+MAX_COMPARISON_COMBINATIONS = int(get_setting("MAX_COMPARISON_COMBINATIONS", "8"))
+
+
+class ComparisonService:
+    @staticmethod
+    async def combinations(
+        scenario_id: int,
+        sources: list[str] | None = None,
+        years: list[int] | None = None,
+        token: str | None = None,
+    ) -> list[dict]:
+        """Requested source and year combinations available for the scenario."""
+
+        selected = await UrbanAPIGateway.select_functional_zone_sources(
+            scenario_id, sources, years, token
+        )
+        if len(selected) > MAX_COMPARISON_COMBINATIONS:
+            raise http_exception(
+                400,
+                "Too many source and year combinations",
+                len(selected),
+                f"At most {MAX_COMPARISON_COMBINATIONS} are compared, select sources or years",
+            )
+        return [{"source": s["source"], "year": s["year"]} for s in selected]
+
+    @staticmethod
+    async def _zones(scenario_id: int, combinations: list[dict], token: str | None):
+        return await ComparisonService._gather(
+            UrbanAPIGateway.get_functional_zones(
+                scenario_id, source=c["source"], token=token, year=c["year"]
+            )
+            for c in combinations
+        )
+
+    @staticmethod
+    async def _gather(aws: Iterable[Awaitable[Any]]) -> list[Any]:
+        """Runs awaitables concurrently, the rest is cancelled when one of them fails."""
+
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    @staticmethod
+    async def upstream_fingerprint(
+        scenario_id: int, combinations: list[dict], token: str | None = None
+    ) -> str:
+        """Content hash of territory, indicator values and zones of all combinations."""
+
+        territory = await UrbanAPIGateway.get_territory(scenario_id, token=token)
+        indicators = await UrbanAPIGateway.get_indicator_values(
+            scenario_id, token=token
+        )
+        zones = await ComparisonService._zones(scenario_id, combinations, token)
+        return fingerprint(territory, indicators, *zones)
+
+    @staticmethod
+    async def estimate(
+        scenario_id: int, combinations: list[dict], token: str | None = None
+    ) -> int:
+        """Estimated peak memory: the shared territory and zones of every combination."""
+
+        zones = await ComparisonService._zones(scenario_id, combinations, token)
+        return await MemoryEstimator.scenario(scenario_id, token=token) + sum(
+            MemoryEstimator.cost(*MemoryEstimator.frame_counts(gdf)) for gdf in zones
+        )
+
+    @staticmethod
+    async def _compute_combination(
+        scenario_id: int,
+        benchmarks: CompiledBenchmarks,
+        landuse_score_gdf,
+        score_key: str,
+        combination: dict,
+        token: str | None,
+    ) -> tuple[int, pd.DataFrame]:
+        with tracer.span("comparison.combination", **combination):
+            zones = await UrbanAPIGateway.get_functional_zones(
+                scenario_id,
+                source=combination["source"],
+                token=token,
+                year=combination["year"],
+            )
+            mapped_zones = await InvestmentPotentialService.zone_values_stage(
+                landuse_score_gdf, score_key, zones
+            )
+            _, summary = await InvestmentPotentialService.attractiveness_stage(
+                mapped_zones, benchmarks
+            )
+        return len(zones), summary
+
+    @staticmethod
+    def side_by_side(
+        combinations: list[dict], results: list[tuple[int, pd.DataFrame]]
+    ) -> dict:
+        """
+        Land-use type summaries of all combinations, `values` of every land-use type
+        are aligned with `combinations` (null where a combination has no such zones).
+        """
+
+        records = [
+            {
+                record.pop("land_use_type"): record
+                for record in InvestmentPotentialService.generate_response(
+                    None, summary, as_geojson=False
+                )
+            }
+            for _, summary in results
+        ]
+        order = {name: i for i, name in enumerate(zone_mapping)}
+        land_use_types = sorted(
+            {name for by_type in records for name in by_type},
+            key=lambda name: (order.get(name, len(order)), name),
+        )
+        rows = []
+        for name in land_use_types:
+            values = [by_type.get(name) for by_type in records]
+            type_id = next(v["land_use_type_id"] for v in values if v is not None)
+            rows.append(
+                {
+                    "land_use_type": name,
+                    "land_use_type_id": type_id,
+                    "values": [
+                        (
+                            None
+                            if v is None
+                            else {k: x for k, x in v.items() if k != "land_use_type_id"}
+                        )
+                        for v in values
+                    ],
+                }
+            )
+
+        totals = []
+        for combination, (zones, summary) in zip(combinations, results):
+            additive = [
+                c for c in summary.columns if c == "area" or c in ADDITIVE_METRICS
+            ]
+            totals.append(
+                {
+                    **combination,
+                    "zones": zones,
+                    **{c: float(summary[c].sum()) for c in additive},
+                }
+            )
+        return {"combinations": totals, "land_use_types": rows}
+
+    @staticmethod
+    async def run_comparison(
+        scenario_id: int,
+        benchmarks: CompiledBenchmarks,
+        combinations: list[dict],
+        token: str | None = None,
+    ) -> dict:
+        """
+        Summaries of functional zones of several source and year combinations. The
+        territory stage is calculated once, combinations run concurrently.
+        """
+
+        logger.info(
+            f"Running investment comparison for scenario {scenario_id}, "
+            f"combinations={combinations}, benchmarks={benchmarks}"
+        )
+        landuse_score_gdf, score_key = (
+            await InvestmentPotentialService.territory_values_stage(
+                scenario_id, benchmarks, as_long=True, token=token
+            )
+        )
+        results = await ComparisonService._gather(
+            ComparisonService._compute_combination(
+                scenario_id, benchmarks, landuse_score_gdf, score_key, c, token
+            )
+            for c in combinations
+        )
+        return await run_in_threadpool(
+            ComparisonService.side_by_side, combinations, results
+        )
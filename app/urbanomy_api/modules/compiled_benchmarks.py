@@ -0,0 +1,170 @@
+import hashlib
+import weakref
+from typing import Any, Dict
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.urbanomy_api.dto.benchmarks_dto import (BenchmarksDTO,
+                                                 NonResidentialBenchmark,
+                                                 ResidentialBenchmark,
+                                                 non_residential_demo,
+                                                 residential_demo)
+
+# Row order of compiled benchmarks
+LAND_USE_TYPES: tuple[str, ...] = tuple(BenchmarksDTO.model_fields)
+LAND_USE_INDEX: Dict[str, int] = {name: i for i, name in enumerate(LAND_USE_TYPES)}
+
+# Benchmark model of each land-use type, used to restore integer parameters
+LAND_USE_MODELS: Dict[str, type[BaseModel]] = {
+    name: (
+        ResidentialBenchmark
+        if name.startswith("residential")
+        else NonResidentialBenchmark
+    )
+    for name in LAND_USE_TYPES
+}
+
+# Column order of compiled benchmarks, union of residential and non-residential parameters
+PARAMETERS: tuple[str, ...] = tuple(
+    dict.fromkeys(
+        [*ResidentialBenchmark.model_fields, *NonResidentialBenchmark.model_fields]
+    )
+)
+PARAMETER_INDEX: Dict[str, int] = {name: i for i, name in enumerate(PARAMETERS)}
+
+# Live compiled sets by digest, equal benchmarks share one instance and its analyzer dict
+_interned: "weakref.WeakValueDictionary[str, CompiledBenchmarks]" = (
+    weakref.WeakValueDictionary()
+)
+
+
+class CompiledBenchmarks:
+    """Benchmarks normalised into a read-only land-use type x parameter matrix.
+
+    Rows follow LAND_USE_TYPES and columns follow PARAMETERS, parameters which do
+    not apply to a land-use type and types absent from the request are NaN.
+    Instances are immutable, hashable and interned by content digest, so they can
+    be used directly as cache key parts.
+    """
+
+    __slots__ = ("values", "present", "digest", "keys", "_dict", "__weakref__")
+
+    def __init__(self, values: np.ndarray, present: np.ndarray, digest: str) -> None:
+        self.values = values
+        self.present = present
+        self.digest = digest
+        self.keys: tuple[str, ...] = tuple(
+            name for name, flag in zip(LAND_USE_TYPES, present) if flag
+        )
+        self._dict: Dict[str, Dict[str, Any]] | None = None
+
+    @classmethod
+    def from_values(
+        cls, values: np.ndarray, present: np.ndarray
+    ) -> "CompiledBenchmarks":
+        """Function builds compiled benchmarks from matrix, reusing an equal live instance
+
+        Args:
+            values (np.ndarray): Matrix of shape (len(LAND_USE_TYPES), len(PARAMETERS))
+            present (np.ndarray): Boolean mask of requested land-use types
+        Returns:
+            CompiledBenchmarks: Compiled benchmarks
+        """
+
+        values = np.array(values, dtype="float64")
+        present = np.array(present, dtype=bool)
+        values[~present] = np.nan
+        values.flags.writeable = False
+        present.flags.writeable = False
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(present.tobytes())
+        h.update(values.tobytes())
+        digest = h.hexdigest()
+
+        compiled = _interned.get(digest)
+        if compiled is None:
+            compiled = cls(values, present, digest)
+            _interned[digest] = compiled
+        return compiled
+
+    @classmethod
+    def from_dto(cls, benchmarks: BenchmarksDTO) -> "CompiledBenchmarks":
+        """Function compiles request benchmarks
+
+        Args:
+            benchmarks (BenchmarksDTO): Request benchmarks
+        Returns:
+            CompiledBenchmarks: Compiled benchmarks
+        """
+
+        values = np.full((len(LAND_USE_TYPES), len(PARAMETERS)), np.nan)
+        present = np.zeros(len(LAND_USE_TYPES), dtype=bool)
+        for i, name in enumerate(LAND_USE_TYPES):
+            benchmark = getattr(benchmarks, name)
+            if benchmark is None:
+                continue
+            present[i] = True
+            for param in LAND_USE_MODELS[name].model_fields:
+                values[i, PARAMETER_INDEX[param]] = getattr(benchmark, param)
+        return cls.from_values(values, present)
+
+    def __contains__(self, land_use_type: str) -> bool:
+        index = LAND_USE_INDEX.get(land_use_type)
+        return index is not None and bool(self.present[index])
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CompiledBenchmarks):
+            return NotImplemented
+        return self.digest == other.digest
+
+    def __repr__(self) -> str:
+        return f"CompiledBenchmarks(keys={list(self.keys)}, digest={self.digest})"
+
+    def vector(self, land_use_type: str) -> np.ndarray:
+        """Read-only parameter vector of a land-use type in PARAMETERS order."""
+
+        return self.values[LAND_USE_INDEX[land_use_type]]
+
+    def parameter(self, name: str) -> np.ndarray:
+        """Read-only vector of a parameter over LAND_USE_TYPES."""
+
+        return self.values[:, PARAMETER_INDEX[name]]
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Nested dict of requested land-use types in the form analyzers accept.
+        Built once per compiled set, callers must not modify it.
+        """
+
+        if self._dict is None:
+            result = {}
+            for name in self.keys:
+                model = LAND_USE_MODELS[name]
+                row = self.vector(name)
+                result[name] = {
+                    param: (
+                        int(row[PARAMETER_INDEX[param]])
+                        if field.annotation is int
+                        else float(row[PARAMETER_INDEX[param]])
+                    )
+                    for param, field in model.model_fields.items()
+                }
+            self._dict = result
+        return self._dict
+
+
+DEFAULT_BENCHMARKS_CONTENT: Dict[str, Dict[str, Any]] = {
+    **residential_demo,
+    **non_residential_demo,
+}
+DEFAULT_BENCHMARKS = CompiledBenchmarks.from_dto(
+    BenchmarksDTO(**DEFAULT_BENCHMARKS_CONTENT)
+)
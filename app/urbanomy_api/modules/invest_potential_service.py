@@ -3,21 +3,28 @@ import math
 from typing import Any, Dict, List
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
 from urbanomy.methods.investment_potential import (
     LAND_USE_TO_POTENTIAL_COLUMN, InvestmentAttractivenessAnalyzer,
     LandUseScoreAnalyzer)
 
+from app.common.cache.fingerprint import fingerprint
+from app.common.deadline.deadline import check_deadline
 from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import memory_profiler, tracer
 from app.urbanomy_api.constants.zone_mapping import zone_mapping
+from app.urbanomy_api.modules.compiled_benchmarks import CompiledBenchmarks
+from app.urbanomy_api.modules.stage_cache import StageCache
 from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
 from app.urbanomy_api.schemas.features_model import FeatureCollection
 
 
 class InvestmentPotentialService:
     @staticmethod
-    async def calculate_landuse_score(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    def calculate_landuse_score(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         try:
             analyzer = LandUseScoreAnalyzer(weights=None)
             score_gdf = analyzer.compute_scores_long(gdf)
@@ -33,34 +40,32 @@ class InvestmentPotentialService:
         return score_gdf
 
     @staticmethod
-    def _required_columns(benchmarks: dict[str, dict[str, any]]) -> set[str]:
+    def _required_columns(benchmarks: CompiledBenchmarks) -> set[str]:
         """Translate land-use keys in `benchmarks` into indicator column names."""
         return {
             LAND_USE_TO_POTENTIAL_COLUMN[key]
-            for key, val in benchmarks.items()
-            if val is not None and key in LAND_USE_TO_POTENTIAL_COLUMN
+            for key in benchmarks.keys
+            if key in LAND_USE_TO_POTENTIAL_COLUMN
         }
 
     @staticmethod
-    async def get_territory_indicator_values(
+    def get_territory_indicator_values(
         scenario_id: int,
         gdf: gpd.GeoDataFrame,
-        benchmarks: dict[str, dict[str, any]],
+        indicators: list[dict],
+        benchmarks: CompiledBenchmarks,
         as_long: bool = False,
-        token: str | None = None,
     ) -> gpd.GeoDataFrame:
         """
         If as_long=False (default) — returns gdf with indicators as columns (wide).
         If as_long=True — returns GeoDataFrame with indicators as columns ['ip_type','ip_value','geometry'] (long).
         """
 
-        indicators = await UrbanAPIGateway.get_indicator_values(
-            scenario_id, token=token
-        )
+        gdf = gdf.copy()
         attrs = {ind["indicator"]["name_full"]: ind["value"] for ind in indicators}
         for name, value in attrs.items():
             gdf[name] = value
-        requested_keys = [k for k, v in benchmarks.items() if v is not None]
+        requested_keys = list(benchmarks.keys)
 
         res_cols_detailed = [
             "Потенциал развития среднеэтажной жилой застройки",
@@ -69,7 +74,7 @@ class InvestmentPotentialService:
             "Потенциал развития жилой застройки типа ИЖС",
         ]
 
-        if benchmarks.get("residential") is not None:
+        if "residential" in benchmarks:
             present = [c for c in res_cols_detailed if c in gdf.columns]
 
             if not present:
@@ -100,48 +105,51 @@ class InvestmentPotentialService:
         if not as_long:
             return gdf.to_crs(gdf.estimate_utm_crs())
 
-        records = (
-            gdf.apply(
-                lambda row: [
-                    {
-                        "ip_type": key,
-                        "ip_value": row[LAND_USE_TO_POTENTIAL_COLUMN[key]],
-                        "geometry": row.geometry,
-                    }
-                    for key in requested_keys
-                ],
-                axis=1,
-            )
-            .explode()
-            .tolist()
-        )
-
-        if not records:
+        if not requested_keys:
             return gpd.GeoDataFrame(
                 columns=["ip_type", "ip_value", "geometry"],
                 geometry="geometry",
                 crs=gdf.crs,
             )
 
+        # row-major layout: every territory row is followed by its requested keys
+        values = gdf[
+            [LAND_USE_TO_POTENTIAL_COLUMN[key] for key in requested_keys]
+        ].to_numpy(dtype="float32")
         long_gdf = gpd.GeoDataFrame(
-            pd.DataFrame(records), geometry="geometry", crs=gdf.crs
+            {
+                "ip_type": pd.Categorical(np.tile(requested_keys, len(gdf))),
+                "ip_value": values.reshape(-1),
+                "geometry": np.repeat(gdf.geometry.values, len(requested_keys)),
+            },
+            geometry="geometry",
+            crs=gdf.crs,
         )
         logger.info(f"Indicator values fetched successfully for scenario {scenario_id}")
         return long_gdf.to_crs(long_gdf.estimate_utm_crs()).reset_index(drop=True)
 
     @staticmethod
-    async def calculate_investment_attractiveness(
-        gdf: gpd.GeoDataFrame, benchmarks: dict[str, dict[str, any]]
+    def calculate_investment_attractiveness(
+        gdf: gpd.GeoDataFrame, benchmarks: CompiledBenchmarks
     ) -> gpd.GeoDataFrame | pd.DataFrame:
-        benchmarks = {k: v for k, v in benchmarks.items() if v is not None}
-        valid_keys = set(benchmarks.keys())
-        mask = gdf["ip_type"].isin(valid_keys)
-        gdf = gdf.loc[mask].copy()
+        mask = gdf["ip_type"].isin(benchmarks.keys).to_numpy()
+        # take() gives the analyzer its own frame in a single copy, so cached stage
+        # artifacts are never modified
+        gdf = gdf.take(np.flatnonzero(mask))
+        if isinstance(gdf["ip_type"].dtype, pd.CategoricalDtype):
+            gdf["ip_type"] = gdf["ip_type"].cat.remove_unused_categories()
+        return InvestmentPotentialService.analyze(gdf, benchmarks.as_dict())
+
+    @staticmethod
+    def analyze(
+        gdf: gpd.GeoDataFrame | pd.DataFrame, benchmarks: Dict[str, Dict[str, Any]]
+    ) -> tuple[gpd.GeoDataFrame | pd.DataFrame, pd.DataFrame]:
+        """Analyzer metrics of zones whose `ip_type` values are all keys of `benchmarks`."""
+
         try:
             an = InvestmentAttractivenessAnalyzer(benchmarks=benchmarks)
             gdf_out, summary = an.calculate_investment_metrics(gdf)
-            gdf_out = gdf_out.copy()
-            gdf_out.loc[:, "ECON_NPV"] = gdf_out["ECON_NPV"].astype(float)
+            gdf_out["ECON_NPV"] = gdf_out["ECON_NPV"].astype(float)
         except Exception as e:
             raise http_exception(
                 500,
@@ -152,17 +160,16 @@ class InvestmentPotentialService:
         return gdf_out, summary
 
     @staticmethod
-    async def map_zones(
-        score_gdf: gpd.GeoDataFrame, zones_gdf: gpd.GeoDataFrame
-    ) -> gpd.GeoDataFrame:
+    def potential_values(score_gdf: gpd.GeoDataFrame) -> Dict[str, float]:
+        """
+        Potential value of each scored land-use type, residential types share the best
+        residential value.
+        """
 
         try:
             ip_map: Dict[str, float] = score_gdf.set_index("ip_type")[
                 "ip_value"
             ].to_dict()
-            zone_map: Dict[str, int] = zone_mapping
-
-            zone_to_ip = {v: k for k, v in zone_map.items()}
         except Exception as e:
             raise http_exception(500, "Error mapping zones", _detail={"error": str(e)})
 
@@ -174,32 +181,101 @@ class InvestmentPotentialService:
             "residential",
         ]
         residential_keys = [k for k in residential_keys_all if k in ip_map]
-        max_res_val = max(ip_map[k] for k in residential_keys) if residential_keys else None
+        max_res_val = (
+            max(ip_map[k] for k in residential_keys) if residential_keys else None
+        )
+        return {
+            itype: max_res_val if itype in residential_keys else value
+            for itype, value in ip_map.items()
+        }
 
-        out = zones_gdf.copy()
-        out = out.to_crs(out.estimate_utm_crs())
-        out["ip_type"] = (
-            out["zone_type_id"]
-            .map(zone_to_ip)
+    @staticmethod
+    def _resolve_zone_values(
+        score_gdf: gpd.GeoDataFrame, zone_type_id: pd.Series
+    ) -> tuple[pd.Series, pd.Series]:
+        """Land-use type and potential value for each zone type id."""
+
+        value_map = InvestmentPotentialService.potential_values(score_gdf)
+        zone_to_ip = {v: k for k, v in zone_mapping.items()}
+        ip_type = (
+            zone_type_id.map(zone_to_ip)
             .fillna("residential_lowrise")
             .astype(str)
+            .astype("category")
         )
+        ip_value = ip_type.map(value_map).astype("float32")
+        return ip_type, ip_value
+
+    @staticmethod
+    def map_zones(
+        score_gdf: gpd.GeoDataFrame, zones_gdf: gpd.GeoDataFrame, crs: Any = None
+    ) -> gpd.GeoDataFrame:
+        """
+        Zones with resolved land-use type, area and potential value, projected to `crs`
+        or to the UTM zone of the layer.
+        """
 
+        out = zones_gdf.to_crs(crs or zones_gdf.estimate_utm_crs())
+        ip_type, ip_value = InvestmentPotentialService._resolve_zone_values(
+            score_gdf, out["zone_type_id"]
+        )
+        out["ip_type"] = ip_type
         out["area"] = out.geometry.area
+        out["ip_value"] = ip_value
+        logger.info(f"Zone values have been calculated")
+        return out
 
-        def _resolve_value(zid: int, itype: str) -> float | None:
-            if itype in residential_keys:
-                return max_res_val
-            return ip_map.get(itype)
+    @staticmethod
+    def map_zone_values(
+        score_gdf: gpd.GeoDataFrame, zones_gdf: gpd.GeoDataFrame
+    ) -> pd.DataFrame:
+        """
+        Summary-only counterpart of `map_zones`: zone areas are computed once in UTM
+        and geometry is dropped, the result is a plain attribute frame.
+        """
 
-        out["ip_value"] = out.apply(
-            lambda row: _resolve_value(row["zone_type_id"], row["ip_type"]), axis=1
+        geometry = zones_gdf.geometry
+        area = geometry.to_crs(zones_gdf.estimate_utm_crs()).area.to_numpy()
+        out = pd.DataFrame(zones_gdf.drop(columns=geometry.name))
+        ip_type, ip_value = InvestmentPotentialService._resolve_zone_values(
+            score_gdf, out["zone_type_id"]
         )
-        logger.info(f"Zone values have been calculated")
+        out["ip_type"] = ip_type
+        out["area"] = area
+        out["ip_value"] = ip_value
+        logger.info(f"Zone values have been calculated without geometry")
         return out
 
     @staticmethod
-    async def generate_response(
+    def drop_geometry(gdf: gpd.GeoDataFrame) -> pd.DataFrame:
+        """Plain attribute frame with `area` in square meters instead of geometry."""
+
+        out = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+        if "area" not in out.columns:
+            geometry = gdf.geometry
+            if geometry.crs is not None and geometry.crs.is_geographic:
+                geometry = geometry.to_crs(gdf.estimate_utm_crs())
+            out["area"] = geometry.area.to_numpy()
+        return out
+
+    @staticmethod
+    def zone_records(gdf: gpd.GeoDataFrame | pd.DataFrame) -> List[Dict[str, Any]]:
+        """Per-zone results as plain records without geometry."""
+
+        df = (
+            InvestmentPotentialService.drop_geometry(gdf)
+            if isinstance(gdf, gpd.GeoDataFrame)
+            else gdf.copy()
+        )
+        df = df.rename(columns={"ip_type": "land_use_type_name"})
+        df["land_use_type_id"] = (
+            df["land_use_type_name"].map(zone_mapping).astype("Int64")
+        )
+        df = df.astype(object).where(df.notna(), None)
+        return df.to_dict(orient="records")
+
+    @staticmethod
+    def generate_response(
         gdf_out: gpd.GeoDataFrame, summary: pd.DataFrame, as_geojson: bool = False
     ) -> List[Dict[str, Any]]:
         if not as_geojson:
@@ -218,17 +294,158 @@ class InvestmentPotentialService:
                 cleaned.append(new_rec)
             return cleaned
 
-        gdf = gdf_out.to_crs(4326).copy()
+        gdf = gdf_out.to_crs(4326)
         gdf["land_use_type_id"] = gdf["ip_type"].map(zone_mapping).astype("Int64")
         gdf = gdf.rename(columns={"ip_type": "land_use_type_name"})
         geojson_str = gdf.to_json()
         return json.loads(geojson_str)
 
+    @staticmethod
+    def _map_and_project_zones(
+        score_gdf: gpd.GeoDataFrame, zones_gdf: gpd.GeoDataFrame
+    ) -> gpd.GeoDataFrame:
+        mapped_zones_gdf = InvestmentPotentialService.map_zones(score_gdf, zones_gdf)
+        return mapped_zones_gdf.to_crs(mapped_zones_gdf.estimate_utm_crs())
+
+    @staticmethod
+    async def upstream_fingerprint(
+        scenario_id: int,
+        token: str | None = None,
+        with_zones: bool = False,
+        source: str | None = None,
+        year: int | None = None,
+    ) -> str:
+        """
+        Content hash of the upstream data a result is calculated from: territory,
+        indicator values and, with `with_zones`, the selected functional zones.
+
+        Data is read through the gateway cache, so the pipeline following a changed
+        fingerprint reuses the same objects and their memoised digests.
+        """
+
+        parts = [
+            await UrbanAPIGateway.get_territory(scenario_id, token=token),
+            await UrbanAPIGateway.get_indicator_values(scenario_id, token=token),
+        ]
+        if with_zones:
+            parts.append(
+                await UrbanAPIGateway.get_functional_zones(
+                    scenario_id, source=source, token=token, year=year
+                )
+            )
+        return fingerprint(*parts)
+
+    @staticmethod
+    async def territory_values_stage(
+        scenario_id: int,
+        benchmarks: CompiledBenchmarks,
+        as_long: bool = False,
+        token: str | None = None,
+    ) -> tuple[gpd.GeoDataFrame, str]:
+        """
+        Projected territory with indicator values, keyed by territory geometry,
+        indicator values and the set of requested land-use types.
+        """
+
+        territory_gdf = await UrbanAPIGateway.get_territory(scenario_id, token=token)
+        indicators = await UrbanAPIGateway.get_indicator_values(
+            scenario_id, token=token
+        )
+        key = fingerprint(territory_gdf, indicators, sorted(benchmarks.keys), as_long)
+        territory_values_gdf = await StageCache.run(
+            "territory",
+            key,
+            InvestmentPotentialService.get_territory_indicator_values,
+            scenario_id,
+            territory_gdf,
+            indicators,
+            benchmarks,
+            as_long,
+        )
+        return territory_values_gdf, key
+
+    @staticmethod
+    async def landuse_score_stage(
+        territory_values_gdf: gpd.GeoDataFrame, territory_key: str
+    ) -> tuple[gpd.GeoDataFrame, str]:
+        """Scored long table, keyed by the territory stage artifact."""
+
+        key = fingerprint("landuse_score", territory_key)
+        landuse_score_gdf = await StageCache.run(
+            "landuse_score",
+            key,
+            InvestmentPotentialService.calculate_landuse_score,
+            territory_values_gdf,
+        )
+        return landuse_score_gdf, key
+
+    @staticmethod
+    async def mapped_zones_stage(
+        score_gdf: gpd.GeoDataFrame, score_key: str, zones_gdf: gpd.GeoDataFrame
+    ) -> gpd.GeoDataFrame:
+        """Zones with resolved land-use values, keyed by scores and zone layer."""
+
+        key = fingerprint("mapped_zones", score_key, zones_gdf)
+        return await StageCache.run(
+            "mapped_zones",
+            key,
+            InvestmentPotentialService._map_and_project_zones,
+            score_gdf,
+            zones_gdf,
+        )
+
+    @staticmethod
+    async def zone_values_stage(
+        score_gdf: gpd.GeoDataFrame, score_key: str, zones_gdf: gpd.GeoDataFrame
+    ) -> pd.DataFrame:
+        """Zone values without geometry for summary-only responses."""
+
+        key = fingerprint("zone_values", score_key, zones_gdf)
+        return await StageCache.run(
+            "zone_values",
+            key,
+            InvestmentPotentialService.map_zone_values,
+            score_gdf,
+            zones_gdf,
+        )
+
+    @staticmethod
+    async def attractiveness_stage(
+        gdf: gpd.GeoDataFrame | pd.DataFrame,
+        benchmarks: CompiledBenchmarks,
+    ) -> tuple[gpd.GeoDataFrame | pd.DataFrame, pd.DataFrame]:
+        """Benchmark dependent part of the pipeline, never cached as a stage."""
+
+        check_deadline("stage.attractiveness")
+        with tracer.span(
+            "stage.attractiveness", zones=len(gdf)
+        ) as span, memory_profiler.measure("stage.attractiveness", span):
+            return await run_in_threadpool(
+                InvestmentPotentialService.calculate_investment_attractiveness,
+                gdf,
+                benchmarks,
+            )
+
+    @staticmethod
+    async def response_stage(
+        gdf_out: gpd.GeoDataFrame, summary: pd.DataFrame, as_geojson: bool
+    ) -> List[Dict[str, Any]]:
+        check_deadline("stage.response")
+        with tracer.span(
+            "stage.response", as_geojson=as_geojson
+        ) as span, memory_profiler.measure("stage.response", span):
+            return await run_in_threadpool(
+                InvestmentPotentialService.generate_response,
+                gdf_out,
+                summary,
+                as_geojson,
+            )
+
     @staticmethod
     async def run_investment_calculation(
         scenario_id,
         as_geojson: bool,
-        benchmarks: dict[str, dict[str, any]],
+        benchmarks: CompiledBenchmarks,
         token: str = None,
     ) -> gpd.GeoDataFrame | pd.DataFrame:
         logger.info(
@@ -237,30 +454,64 @@ class InvestmentPotentialService:
             f"as_geojson={as_geojson}, "
             f"benchmarks={benchmarks}"
         )
-        territory_gdf = await UrbanAPIGateway.get_territory(scenario_id, token=token)
-        territory_values_gdf = (
-            await InvestmentPotentialService.get_territory_indicator_values(
-                scenario_id, territory_gdf, token=token, benchmarks=benchmarks
+        territory_values_gdf, territory_key = (
+            await InvestmentPotentialService.territory_values_stage(
+                scenario_id, benchmarks, token=token
             )
         )
-        landuse_score_gdf = await InvestmentPotentialService.calculate_landuse_score(
-            territory_values_gdf
+        landuse_score_gdf, _ = await InvestmentPotentialService.landuse_score_stage(
+            territory_values_gdf, territory_key
         )
-        gdf_out, summary = (
-            await InvestmentPotentialService.calculate_investment_attractiveness(
-                landuse_score_gdf, benchmarks
+        if not as_geojson:
+            landuse_score_gdf = InvestmentPotentialService.drop_geometry(
+                landuse_score_gdf
             )
+        gdf_out, summary = await InvestmentPotentialService.attractiveness_stage(
+            landuse_score_gdf, benchmarks
         )
-        response = await InvestmentPotentialService.generate_response(
+        return await InvestmentPotentialService.response_stage(
             gdf_out, summary, as_geojson
         )
-        return response
+
+    @staticmethod
+    async def compute_investment_fzones(
+        scenario_id,
+        benchmarks: CompiledBenchmarks,
+        source: str = None,
+        token: str = None,
+        year: int = None,
+        with_geometry: bool = True,
+    ) -> tuple[gpd.GeoDataFrame | pd.DataFrame, pd.DataFrame]:
+        """
+        Per-zone metrics and summary for scenario functional zones.
+        With `with_geometry=False` zones never carry geometry past area calculation.
+        """
+
+        landuse_score_gdf, score_key = (
+            await InvestmentPotentialService.territory_values_stage(
+                scenario_id, benchmarks, as_long=True, token=token
+            )
+        )
+        functional_zones_gdf = await UrbanAPIGateway.get_functional_zones(
+            scenario_id, source=source, token=token, year=year
+        )
+        if with_geometry:
+            mapped_zones = await InvestmentPotentialService.mapped_zones_stage(
+                landuse_score_gdf, score_key, functional_zones_gdf
+            )
+        else:
+            mapped_zones = await InvestmentPotentialService.zone_values_stage(
+                landuse_score_gdf, score_key, functional_zones_gdf
+            )
+        return await InvestmentPotentialService.attractiveness_stage(
+            mapped_zones, benchmarks
+        )
 
     @staticmethod
     async def run_investment_calculation_fzones(
         scenario_id,
         as_geojson: bool,
-        benchmarks: dict[str, dict[str, any]],
+        benchmarks: CompiledBenchmarks,
         source: str = None,
         token: str = None,
         year: int = None,
@@ -271,71 +522,69 @@ class InvestmentPotentialService:
             f"as_geojson={as_geojson}, "
             f"benchmarks={benchmarks}"
         )
-        territory_gdf = await UrbanAPIGateway.get_territory(scenario_id, token=token)
-        landuse_score_gdf = (
-            await InvestmentPotentialService.get_territory_indicator_values(
-                scenario_id,
-                territory_gdf,
-                benchmarks=benchmarks,
-                as_long=True,
-                token=token,
-            )
-        )
-        functional_zones_gdf = await UrbanAPIGateway.get_functional_zones(
-            scenario_id, source=source, token=token, year=year
+        gdf_out, summary = await InvestmentPotentialService.compute_investment_fzones(
+            scenario_id,
+            benchmarks,
+            source=source,
+            token=token,
+            year=year,
+            with_geometry=as_geojson,
         )
-        mapped_zones_gdf = await InvestmentPotentialService.map_zones(
-            landuse_score_gdf, functional_zones_gdf
-        )
-        mapped_zones_gdf = mapped_zones_gdf.to_crs(mapped_zones_gdf.estimate_utm_crs())
-        gdf_out, summary = (
-            await InvestmentPotentialService.calculate_investment_attractiveness(
-                mapped_zones_gdf, benchmarks
-            )
-        )
-        response = await InvestmentPotentialService.generate_response(
+        return await InvestmentPotentialService.response_stage(
             gdf_out, summary, as_geojson
         )
-        return response
 
     @staticmethod
     async def run_investment_calculation_coords(
         scenario_id,
         as_geojson: bool,
-        benchmarks: dict[str, dict[str, any]],
+        benchmarks: CompiledBenchmarks,
         geojson: FeatureCollection,
         token: str = None,
     ) -> gpd.GeoDataFrame | pd.DataFrame:
         geojson_dict = geojson.as_geo_dict()
         gdf = gpd.GeoDataFrame.from_features(geojson_dict["features"])
         gdf = gdf.set_crs("EPSG:4326")
+        return await InvestmentPotentialService.run_investment_calculation_layer(
+            scenario_id, as_geojson, benchmarks, gdf, token
+        )
+
+    @staticmethod
+    async def run_investment_calculation_layer(
+        scenario_id,
+        as_geojson: bool,
+        benchmarks: CompiledBenchmarks,
+        gdf: gpd.GeoDataFrame,
+        token: str = None,
+    ) -> gpd.GeoDataFrame | pd.DataFrame:
+        """
+        Calculation over client zones with a validated `zone_type_id` column in
+        EPSG:4326, shared by the GeoJSON and the uploaded layer endpoints.
+        """
+
         logger.info(
             f"Running investment calculation "
             f"for scenario {scenario_id}, "
             f"as_geojson={as_geojson}, "
             f"benchmarks={benchmarks}, "
-            f"Features: {geojson_dict}"
+            f"features={len(gdf)}"
         )
-        territory_gdf = await UrbanAPIGateway.get_territory(scenario_id, token=token)
-        landuse_score_gdf = (
-            await InvestmentPotentialService.get_territory_indicator_values(
-                scenario_id,
-                territory_gdf,
-                benchmarks=benchmarks,
-                as_long=True,
-                token=token,
+        landuse_score_gdf, score_key = (
+            await InvestmentPotentialService.territory_values_stage(
+                scenario_id, benchmarks, as_long=True, token=token
             )
         )
-        mapped_zones_gdf = await InvestmentPotentialService.map_zones(
-            landuse_score_gdf, gdf
-        )
-        mapped_zones_gdf = mapped_zones_gdf.to_crs(mapped_zones_gdf.estimate_utm_crs())
-        gdf_out, summary = (
-            await InvestmentPotentialService.calculate_investment_attractiveness(
-                mapped_zones_gdf, benchmarks
+        if as_geojson:
+            mapped_zones = await InvestmentPotentialService.mapped_zones_stage(
+                landuse_score_gdf, score_key, gdf
+            )
+        else:
+            mapped_zones = await InvestmentPotentialService.zone_values_stage(
+                landuse_score_gdf, score_key, gdf
             )
+        gdf_out, summary = await InvestmentPotentialService.attractiveness_stage(
+            mapped_zones, benchmarks
         )
-        response = await InvestmentPotentialService.generate_response(
+        return await InvestmentPotentialService.response_stage(
             gdf_out, summary, as_geojson
         )
-        return response
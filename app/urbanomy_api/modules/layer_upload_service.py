@@ -0,0 +1,221 @@
+import hashlib
+import io
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import pyogrio
+import shapely
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.common.deadline.deadline import check_deadline
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.common.memory.memory_budget import MIB
+from app.dependencies import calculation_admission, get_setting, tracer
+from app.urbanomy_api.constants.zone_mapping import VALID_ZONE_TYPE_IDS
+from app.urbanomy_api.modules.compiled_benchmarks import CompiledBenchmarks
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.memory_estimator import MemoryEstimator
+
+# Largest accepted layer file
+UPLOAD_MAX_BYTES = int(float(get_setting("UPLOAD_MAX_MB", "64")) * MIB)
+
+# Leading bytes of the accepted formats, Arrow IPC streams start with a continuation
+LAYER_MAGIC = {
+    b"PAR1": "parquet",
+    b"fgb\x03": "flatgeobuf",
+    b"ARROW1": "arrow_file",
+    b"\xff\xff\xff\xff": "arrow_stream",
+}
+
+POLYGONAL_TYPE_IDS = (
+    shapely.GeometryType.POLYGON.value,
+    shapely.GeometryType.MULTIPOLYGON.value,
+)
+
+
+class LayerUploadService:
+    @staticmethod
+    async def read_upload(layer: UploadFile) -> bytes:
+        """Uploaded layer bytes, 413 over UPLOAD_MAX_MB."""
+
+        if layer.size is not None and layer.size > UPLOAD_MAX_BYTES:
+            raise http_exception(
+                413,
+                "Uploaded layer is too large",
+                layer.filename,
+                {"limit_mib": round(UPLOAD_MAX_BYTES / MIB, 1)},
+            )
+        data = await layer.read()
+        if not data:
+            raise http_exception(422, "Uploaded layer is empty", layer.filename)
+        return data
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def detect_format(data: bytes) -> str:
+        for magic, layer_format in LAYER_MAGIC.items():
+            if data.startswith(magic):
+                return layer_format
+        raise http_exception(
+            415,
+            "Unsupported layer format",
+            data[:8].hex(),
+            "Upload GeoParquet, FlatGeobuf or Arrow IPC / Parquet with a WKB column",
+        )
+
+    @staticmethod
+    def _from_wkb_table(
+        table: pa.Table, geometry_column: str, crs: int
+    ) -> gpd.GeoDataFrame:
+        if geometry_column not in table.column_names:
+            raise http_exception(
+                422,
+                "Geometry column not found",
+                geometry_column,
+                f"Columns: {', '.join(table.column_names)}",
+            )
+        column = table.column(geometry_column)
+        if not (
+            pa.types.is_binary(column.type) or pa.types.is_large_binary(column.type)
+        ):
+            raise http_exception(
+                422, "Geometry column must hold WKB", geometry_column, str(column.type)
+            )
+        try:
+            geometry = shapely.from_wkb(column.to_numpy(zero_copy_only=False))
+        except shapely.errors.GEOSException as e:
+            raise http_exception(
+                422, "Invalid WKB geometry", geometry_column, {"error": str(e)}
+            )
+        frame = table.drop_columns([geometry_column]).to_pandas()
+        return gpd.GeoDataFrame(frame, geometry=geometry, crs=crs)
+
+    @staticmethod
+    def _read_frame(data: bytes, geometry_column: str, crs: int) -> gpd.GeoDataFrame:
+        layer_format = LayerUploadService.detect_format(data)
+        try:
+            if layer_format == "flatgeobuf":
+                return pyogrio.read_dataframe(data)
+            if layer_format == "parquet":
+                # only the footer is read to tell GeoParquet from a plain WKB table
+                if b"geo" in (pq.read_schema(io.BytesIO(data)).metadata or {}):
+                    return gpd.read_parquet(io.BytesIO(data))
+                table = pq.read_table(io.BytesIO(data))
+            else:
+                reader = (
+                    ipc.open_file if layer_format == "arrow_file" else ipc.open_stream
+                )
+                table = reader(pa.py_buffer(data)).read_all()
+        except (pa.ArrowException, pyogrio.errors.DataSourceError, ValueError) as e:
+            raise http_exception(
+                422, "Layer could not be read", layer_format, {"error": str(e)}
+            )
+        return LayerUploadService._from_wkb_table(table, geometry_column, crs)
+
+    @staticmethod
+    def validate_layer(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """
+        Column-wise counterpart of the Feature validation of GeoJSON zones. Only
+        scalar attribute columns are kept, they are returned with the result.
+        """
+
+        if gdf.empty:
+            raise http_exception(422, "Layer has no features")
+        if "zone_type_id" not in gdf.columns:
+            raise http_exception(
+                422, "Layer must include a 'zone_type_id' column", list(gdf.columns)
+            )
+        zone_type_id = gdf["zone_type_id"]
+        if pd.api.types.is_float_dtype(zone_type_id) and (
+            zone_type_id.notna().all() and (zone_type_id % 1 == 0).all()
+        ):
+            zone_type_id = zone_type_id.astype("int64")
+        if zone_type_id.isna().any() or not pd.api.types.is_integer_dtype(zone_type_id):
+            raise http_exception(
+                422, "'zone_type_id' must be an integer", str(gdf["zone_type_id"].dtype)
+            )
+        invalid = ~zone_type_id.isin(VALID_ZONE_TYPE_IDS)
+        if invalid.any():
+            allowed = ", ".join(map(str, sorted(VALID_ZONE_TYPE_IDS)))
+            raise http_exception(
+                400,
+                "Invalid zone_type_id",
+                sorted(zone_type_id[invalid].unique().tolist()),
+                f"Valid zone_type_ids: {allowed}",
+            )
+
+        type_ids = shapely.get_type_id(gdf.geometry.values)
+        not_polygonal = ~np.isin(type_ids, POLYGONAL_TYPE_IDS)
+        if not_polygonal.any():
+            raise http_exception(
+                422,
+                "Layer geometries must be Polygon or MultiPolygon",
+                np.flatnonzero(not_polygonal)[:10].tolist(),
+                {"invalid_features": int(not_polygonal.sum())},
+            )
+
+        keep = [
+            name
+            for name in gdf.columns
+            if name == gdf.geometry.name
+            or pd.api.types.is_numeric_dtype(gdf[name])
+            or pd.api.types.is_bool_dtype(gdf[name])
+            or pd.api.types.infer_dtype(gdf[name], skipna=True) in ("string", "empty")
+        ]
+        out = gdf[keep].reset_index(drop=True)
+        out["zone_type_id"] = zone_type_id.to_numpy()
+        return out
+
+    @staticmethod
+    def read_layer(data: bytes, geometry_column: str, crs: int) -> gpd.GeoDataFrame:
+        """
+        Validated zones of an uploaded layer in EPSG:4326. Layers without a declared
+        CRS are taken in `crs`.
+        """
+
+        gdf = LayerUploadService._read_frame(data, geometry_column, crs)
+        if gdf.crs is None:
+            gdf = gdf.set_crs(crs)
+        gdf = LayerUploadService.validate_layer(gdf)
+        if not gdf.crs.equals("EPSG:4326"):
+            gdf = gdf.to_crs(4326)
+        logger.info(f"Uploaded layer read with {len(gdf)} zones")
+        return gdf
+
+    @staticmethod
+    async def run_upload(
+        scenario_id: int,
+        as_geojson: bool,
+        benchmarks: CompiledBenchmarks,
+        data: bytes,
+        geometry_column: str,
+        crs: int,
+        token: str | None = None,
+    ) -> gpd.GeoDataFrame | pd.DataFrame:
+        """Calculation over an uploaded layer within memory and admission limits."""
+
+        check_deadline("layer_read")
+        with tracer.span("layer_read", bytes=len(data)) as span:
+            gdf = await run_in_threadpool(
+                LayerUploadService.read_layer, data, geometry_column, crs
+            )
+            span.set(zones=len(gdf))
+        return await MemoryEstimator.guard(
+            lambda: MemoryEstimator.layer(scenario_id, gdf, token),
+            lambda: calculation_admission.run(
+                token,
+                lambda: InvestmentPotentialService.run_investment_calculation_layer(
+                    scenario_id, as_geojson, benchmarks, gdf, token
+                ),
+            ),
+        )
@@ -0,0 +1,109 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+import geopandas as gpd
+import shapely
+from loguru import logger
+
+from app.common.memory.memory_budget import MIB
+from app.dependencies import get_setting, memory_budget
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+from app.urbanomy_api.schemas.features_model import FeatureCollection
+
+# Peak bytes of one zone row through the pipeline (all copies of its attributes)
+BYTES_PER_FEATURE = int(get_setting("MEMORY_BYTES_PER_FEATURE", "4096"))
+
+# Peak bytes of one geometry vertex: decoded JSON, shapely, projected copy and output
+BYTES_PER_VERTEX = int(get_setting("MEMORY_BYTES_PER_VERTEX", "512"))
+
+T = TypeVar("T")
+
+
+class MemoryEstimator:
+    @staticmethod
+    def cost(features: int, vertices: int, rows_factor: int = 1) -> int:
+        """
+        Estimated peak memory of a calculation over `features` with `vertices` in
+        total. `rows_factor` multiplies attribute rows, e.g. for zones evaluated once
+        per land-use type.
+        """
+
+        return features * rows_factor * BYTES_PER_FEATURE + vertices * BYTES_PER_VERTEX
+
+    @staticmethod
+    def frame_counts(gdf: gpd.GeoDataFrame) -> tuple[int, int]:
+        """Number of features and geometry vertices of a frame."""
+
+        vertices = shapely.get_num_coordinates(gdf.geometry.values)
+        return len(gdf), int(vertices.sum())
+
+    @staticmethod
+    async def scenario(
+        scenario_id: int,
+        token: str | None = None,
+        with_zones: bool = False,
+        source: str | None = None,
+        year: int | None = None,
+        rows_factor: int = 1,
+    ) -> int:
+        """
+        Estimated peak memory of a scenario calculation from its territory and, with
+        `with_zones`, functional zones. Data comes from the gateway cache, which the
+        calculation reads as well.
+        """
+
+        territory = await UrbanAPIGateway.get_territory(scenario_id, token=token)
+        features, vertices = MemoryEstimator.frame_counts(territory)
+        if with_zones:
+            zones = await UrbanAPIGateway.get_functional_zones(
+                scenario_id, source=source, token=token, year=year
+            )
+            zone_features, zone_vertices = MemoryEstimator.frame_counts(zones)
+            features += zone_features * rows_factor
+            vertices += zone_vertices
+        return MemoryEstimator.cost(features, vertices)
+
+    @staticmethod
+    async def coords(
+        scenario_id: int, geojson: FeatureCollection, token: str | None = None
+    ) -> int:
+        """Estimated peak memory of a calculation over posted features."""
+
+        return await MemoryEstimator.scenario(
+            scenario_id, token=token
+        ) + MemoryEstimator.cost(len(geojson.features), geojson.vertex_count())
+
+    @staticmethod
+    async def layer(
+        scenario_id: int, gdf: gpd.GeoDataFrame, token: str | None = None
+    ) -> int:
+        """Estimated peak memory of a calculation over an uploaded zone layer."""
+
+        return await MemoryEstimator.scenario(
+            scenario_id, token=token
+        ) + MemoryEstimator.cost(*MemoryEstimator.frame_counts(gdf))
+
+    @staticmethod
+    @asynccontextmanager
+    async def reserve(estimate: Callable[[], Awaitable[int]]) -> AsyncIterator[None]:
+        """
+        Holds the estimated memory cost of a calculation from the worker memory
+        budget, see MemoryBudget. Nothing is estimated while the budget is disabled.
+        """
+
+        if not memory_budget.enabled:
+            yield
+            return
+        nbytes = await estimate()
+        logger.info(f"Calculation estimated at {nbytes / MIB:.1f} MiB")
+        async with memory_budget.reserve(nbytes):
+            yield
+
+    @staticmethod
+    async def guard(
+        estimate: Callable[[], Awaitable[int]], compute: Callable[[], Awaitable[T]]
+    ) -> T:
+        """Runs `compute` within its memory reservation."""
+
+        async with MemoryEstimator.reserve(estimate):
+            return await compute()
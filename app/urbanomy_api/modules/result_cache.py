@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from starlette.background import BackgroundTask
+
+from app.common.compression.compression import EncodedPayload
+from app.common.conditional.conditional import (etag_matches, make_etag,
+                                                not_modified)
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import (frame_cache, result_cache, result_store,
+                              tile_cache, tracer)
+from app.urbanomy_api.modules.stored_result_service import StoredResultService
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+
+# Results of geometries posted by users are private to them and never stored
+UNSTORED_KINDS = frozenset({"coords", "layer"})
+
+
+class ResultCache:
+    # saves in progress by result key, pagination waits for them instead of saving again
+    _saving: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def build_key(kind: str, scenario_id: int, **params: Any) -> str:
+        """
+        Builds cache key for a calculation result.
+
+        Keys start with ``result:{scenario_id}:`` so all results of a scenario can be
+        dropped at once with a prefix deletion.
+        """
+
+        digest = hashlib.sha256(
+            json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        return f"result:{scenario_id}:{kind}:{digest}"
+
+    @staticmethod
+    def etag(key: str) -> str:
+        """
+        Strong ETag of a result. Keys include normalised inputs and upstream data
+        fingerprints, so equal keys always produce byte-identical bodies.
+        """
+
+        return make_etag(key)
+
+    @staticmethod
+    async def get_or_compute(
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        authorize: Callable[[], Awaitable[Any]],
+    ) -> EncodedPayload:
+        """
+        Returns serialised result from cache or computes and stores it, computed
+        results are also kept in the result store before returning.
+        """
+
+        payload, content = await ResultCache._get_or_compute(key, compute, authorize)
+        if content is not None:
+            await ResultCache.persist(key, content)
+        return payload
+
+    @staticmethod
+    async def _get_or_compute(
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        authorize: Callable[[], Awaitable[Any]],
+    ) -> tuple[EncodedPayload, Any]:
+        """
+        Returns serialised result and, when it was just computed, its content.
+
+        `authorize` is awaited on cache hits only, so cached results are never served
+        to a token which has no access to the scenario. On misses the pipeline itself
+        performs the upstream calls with the user token, unless snapshots may stand
+        in for upstream data, then access is checked before computing as well.
+        """
+
+        payload = await result_cache.get(key)
+        if payload is not None:
+            await authorize()
+            logger.info(f"Serving cached result {key}")
+            return payload, None
+
+        if UrbanAPIGateway.snapshot_mode != "off":
+            await authorize()
+        content = await compute()
+        payload = await EncodedPayload.from_content(content, etag=ResultCache.etag(key))
+        await result_cache.set(key, payload)
+        return payload, content
+
+    @staticmethod
+    def storable(key: str, content: Any) -> bool:
+        """
+        Whether the result goes to the result store: per-zone (GeoJSON) results of
+        scenario data, results of posted geometries are not stored.
+        """
+
+        _, _, kind, _ = key.split(":")
+        return (
+            result_store.enabled
+            and kind not in UNSTORED_KINDS
+            and isinstance(content, dict)
+            and content.get("type") == "FeatureCollection"
+        )
+
+    @staticmethod
+    async def persist(key: str, content: Any) -> None:
+        """
+        Keeps per-zone (GeoJSON) results in the result store for bbox and attribute
+        queries. The store is an addition to the cache, its failures never fail the
+        calculation. A save of the same key already in progress is awaited instead
+        of being repeated.
+        """
+
+        if not ResultCache.storable(key, content):
+            return
+        saving = ResultCache._saving.get(key)
+        if saving is None:
+            saving = asyncio.ensure_future(ResultCache._save(key, content))
+            ResultCache._saving[key] = saving
+            saving.add_done_callback(lambda _: ResultCache._saving.pop(key, None))
+        await asyncio.shield(saving)
+
+    @staticmethod
+    async def _save(key: str, content: dict) -> None:
+        _, scenario_id, kind, _ = key.split(":")
+        try:
+            with tracer.span("result_store.save", zones=len(content["features"])):
+                await result_store.save(
+                    key, int(scenario_id), kind, content["features"]
+                )
+        except Exception:
+            logger.exception(f"Result {key} could not be stored")
+
+    @staticmethod
+    async def first_page(
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        authorize: Callable[[], Awaitable[Any]],
+        page_size: int,
+    ) -> EncodedPayload:
+        """
+        First `page_size` zones of a GeoJSON result, further pages are read from the
+        result store with the returned cursor. Results cached before they were stored
+        (or dropped from the store since) are stored from the cached body.
+        """
+
+        payload, content = await ResultCache._get_or_compute(key, compute, authorize)
+        saving = ResultCache._saving.get(key)
+        if saving is not None:
+            await asyncio.shield(saving)
+        if await result_store.get_set(key) is None:
+            if content is None:
+                content = await run_in_threadpool(json.loads, payload.body)
+            if not ResultCache.storable(key, content):
+                raise http_exception(
+                    400,
+                    "Only GeoJSON results of scenario data are paginated",
+                    "page_size",
+                )
+            await ResultCache.persist(key, content)
+        _, scenario_id, _, _ = key.split(":")
+        return await StoredResultService.query_zones(
+            int(scenario_id), result_key=key, limit=page_size
+        )
+
+    @staticmethod
+    async def respond(
+        request: Request,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        authorize: Callable[[], Awaitable[Any]],
+        page_size: int | None = None,
+    ) -> Response:
+        """
+        Answers a calculation request, with 304 if the client holds the current result.
+
+        Matching If-None-Match is resolved from the key alone, the pipeline is not run
+        and the result does not have to be in cache. With `page_size` only the first
+        page of the result is sent, see `first_page`.
+        """
+
+        if page_size is not None:
+            page = await ResultCache.first_page(key, compute, authorize, page_size)
+            return await page.to_response(request, conditional=True)
+        etag = ResultCache.etag(key)
+        if etag_matches(request, etag):
+            await authorize()
+            logger.info(f"Result {key} not modified")
+            return not_modified(etag, {"Vary": "Accept-Encoding"})
+        payload, content = await ResultCache._get_or_compute(key, compute, authorize)
+        variants = len(payload.variants)
+        response = await payload.to_response(request, conditional=True)
+        if len(payload.variants) > variants:
+            # shared cache backends keep their own copy, store the new encoding there
+            await result_cache.set(key, payload)
+        if content is not None and ResultCache.storable(key, content):
+            # the response does not wait for the result store
+            response.background = BackgroundTask(ResultCache.persist, key, content)
+        return response
+
+    @staticmethod
+    async def get_or_compute_object(
+        key: str, compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Returns materialised (not serialised) result from cache or computes it.
+
+        Used for per-zone frames which are served in parts, e.g. as vector tiles.
+        They are kept per worker, so spatial indexes are built once and never pickled.
+        Access must be checked by the caller.
+        """
+
+        value = await frame_cache.get(key)
+        if value is None:
+            value = await compute()
+            await frame_cache.set(key, value)
+        return value
+
+    @staticmethod
+    async def invalidate_scenario(scenario_id: int) -> int:
+        """
+        Drops all cached results, frames, tiles and stored result sets of a scenario.
+        Returns number of dropped entries.
+        """
+
+        prefix = f"result:{scenario_id}:"
+        return (
+            await result_cache.delete_prefix(prefix)
+            + await frame_cache.delete_prefix(prefix)
+            + await tile_cache.delete_prefix(prefix)
+            + await result_store.delete_scenario(scenario_id)
+        )
@@ -0,0 +1,367 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.common.deadline.deadline import check_deadline
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import get_setting
+from app.urbanomy_api.constants.zone_mapping import zone_mapping
+from app.urbanomy_api.dto.investment_attractivness_sensitivity_dto import \
+    ParameterDistribution
+from app.urbanomy_api.modules.compiled_benchmarks import (LAND_USE_INDEX,
+                                                          LAND_USE_TYPES,
+                                                          PARAMETER_INDEX,
+                                                          CompiledBenchmarks)
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+
+MC_MAX_SAMPLES = int(get_setting("MC_MAX_SAMPLES", "2000"))
+
+# Stacked zone rows evaluated in one analyzer pass, samples are batched up to it
+SENSITIVITY_BATCH_ROWS = int(get_setting("SENSITIVITY_BATCH_ROWS", "200000"))
+
+# Separates land-use type and sample number in benchmark keys of stacked samples
+SAMPLE_SEPARATOR = "#"
+
+# Benchmark fields which are shares, samples are clipped to [0, 1]
+SHARE_PARAMETERS = frozenset({"occupancy"})
+
+
+class SensitivityService:
+    @staticmethod
+    def draw(
+        rng: np.random.Generator, distribution: ParameterDistribution, size: int
+    ) -> np.ndarray:
+        """Samples of one distribution."""
+
+        if distribution.distribution == "uniform":
+            return rng.uniform(distribution.low, distribution.high, size)
+        if distribution.distribution == "triangular":
+            return rng.triangular(
+                distribution.low, distribution.mode, distribution.high, size
+            )
+        center = 1.0 if distribution.mean is None else distribution.mean
+        if distribution.distribution == "normal":
+            return rng.normal(center, distribution.std, size)
+        return rng.lognormal(np.log(center), distribution.std, size)
+
+    @staticmethod
+    def sample_benchmarks(
+        benchmarks: CompiledBenchmarks,
+        distributions: List[ParameterDistribution],
+        samples: int,
+        seed: int = 0,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Benchmark matrices of all samples as an array of shape
+        (samples, len(LAND_USE_TYPES), len(PARAMETERS)) and the mask of land-use types
+        changed by the distributions.
+
+        One draw of a distribution is shared by all land-use types it applies to, so
+        e.g. a market-wide price change moves all types together.
+        """
+
+        rng = np.random.default_rng(seed)
+        values = np.repeat(benchmarks.values[None], samples, axis=0)
+        affected = np.zeros(len(LAND_USE_TYPES), dtype=bool)
+        for distribution in distributions:
+            column = PARAMETER_INDEX.get(distribution.parameter)
+            if column is None:
+                raise http_exception(
+                    400,
+                    "Unknown benchmark field",
+                    distribution.parameter,
+                    {"fields": list(PARAMETER_INDEX)},
+                )
+            rows = benchmarks.present & ~np.isnan(
+                benchmarks.parameter(distribution.parameter)
+            )
+            if distribution.land_use_type is not None:
+                index = LAND_USE_INDEX.get(distribution.land_use_type)
+                if index is None or not rows[index]:
+                    raise http_exception(
+                        400,
+                        "Benchmark field is not set for the land-use type",
+                        {
+                            "land_use_type": distribution.land_use_type,
+                            "parameter": distribution.parameter,
+                        },
+                    )
+                rows = np.arange(len(LAND_USE_TYPES)) == index
+            if not rows.any():
+                raise http_exception(
+                    400, "Benchmark field is not set", distribution.parameter
+                )
+
+            draws = SensitivityService.draw(rng, distribution, samples)[:, None]
+            base = benchmarks.values[rows, column][None, :]
+            values[:, rows, column] = base * draws if distribution.relative else draws
+            affected |= rows
+
+        np.maximum(values, 0, out=values)
+        for name in SHARE_PARAMETERS:
+            np.minimum(
+                values[:, :, PARAMETER_INDEX[name]],
+                1,
+                out=values[:, :, PARAMETER_INDEX[name]],
+            )
+        return values, affected
+
+    @staticmethod
+    def bands(stack: np.ndarray, percentiles: List[float]) -> Dict[str, np.ndarray]:
+        """Percentiles and mean over samples (first axis), NaN samples are ignored."""
+
+        with np.errstate(invalid="ignore"):
+            quantiles = np.nanpercentile(stack, percentiles, axis=0)
+            result = {f"p{q:g}": quantiles[i] for i, q in enumerate(percentiles)}
+            result["mean"] = np.nanmean(stack, axis=0)
+        return result
+
+    @staticmethod
+    def evaluate_samples(
+        zones: pd.DataFrame,
+        values: np.ndarray,
+        affected: np.ndarray,
+        types: List[str],
+        start: int,
+        stop: int,
+    ) -> tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """
+        Zone metrics of shape (stop - start, zones) and land-use type metrics of shape
+        (stop - start, types) of samples `start` to `stop`.
+
+        A single sample is evaluated with its own benchmarks. Several samples are
+        stacked like the land-use types in `AllocationService.metric_matrix`: zones
+        are repeated once per sample and every sample gets its own benchmark keys,
+        so the whole batch is evaluated in a single analyzer pass.
+        """
+
+        if stop - start == 1:
+            sample = CompiledBenchmarks.from_values(values[start], affected)
+            gdf_out, summary = (
+                InvestmentPotentialService.calculate_investment_attractiveness(
+                    zones, sample
+                )
+            )
+            source, n, keys = zones, len(zones), types
+            positions = zones.index.get_indexer(gdf_out.index)
+        else:
+            n = len(zones)
+            codes = pd.Categorical(zones["ip_type"], categories=types).codes
+            keys = [
+                f"{name}{SAMPLE_SEPARATOR}{i}"
+                for i in range(start, stop)
+                for name in types
+            ]
+            benchmarks = {}
+            for i in range(start, stop):
+                sample = CompiledBenchmarks.from_values(values[i], affected).as_dict()
+                for name in types:
+                    benchmarks[f"{name}{SAMPLE_SEPARATOR}{i}"] = sample[name]
+            source = zones.take(np.tile(np.arange(n), stop - start))
+            source = source.reset_index(drop=True)
+            source["ip_type"] = pd.Categorical.from_codes(
+                np.repeat(np.arange(stop - start) * len(types), n)
+                + np.tile(codes, stop - start),
+                categories=keys,
+            )
+            gdf_out, summary = InvestmentPotentialService.analyze(source, benchmarks)
+            positions = gdf_out.index.to_numpy()
+
+        zone_values = {}
+        for col in gdf_out.columns:
+            if col in source.columns or not pd.api.types.is_numeric_dtype(gdf_out[col]):
+                continue
+            matrix = np.full((stop - start) * n, np.nan)
+            matrix[positions] = gdf_out[col].to_numpy(dtype="float64", na_value=np.nan)
+            zone_values[col] = matrix.reshape(stop - start, n)
+
+        # categorical type index makes every reindex compare categories
+        summary = summary.set_axis(summary.index.astype(str))
+        type_values = {
+            col: summary[col]
+            .reindex(keys)
+            .to_numpy(dtype="float64", na_value=np.nan)
+            .reshape(stop - start, len(types))
+            for col in summary.columns
+            if pd.api.types.is_numeric_dtype(summary[col])
+        }
+        return zone_values, type_values
+
+    @staticmethod
+    def matches(
+        reference: tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]],
+        batch: tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]],
+    ) -> bool:
+        """Whether the first sample of a batch equals the single-sample reference."""
+
+        for expected, actual in zip(reference, batch):
+            if expected.keys() != actual.keys():
+                return False
+            for col, array in expected.items():
+                if not np.allclose(array, actual[col][:1], rtol=1e-9, equal_nan=True):
+                    return False
+        return True
+
+    @staticmethod
+    def evaluate(
+        zones: pd.DataFrame,
+        benchmarks: CompiledBenchmarks,
+        distributions: List[ParameterDistribution],
+        samples: int,
+        seed: int,
+        percentiles: List[float],
+    ) -> Dict[str, Any]:
+        """
+        Percentile bands of zone and land-use type metrics over benchmark samples.
+
+        Only zones of land-use types changed by the distributions are evaluated, the
+        metrics of other zones do not depend on the samples. Samples are evaluated in
+        batches of up to SENSITIVITY_BATCH_ROWS stacked zones. The first sample is
+        also evaluated on its own as the reference, batching is dropped for the
+        request if the analyzer gives different results for stacked samples.
+        """
+
+        values, affected = SensitivityService.sample_benchmarks(
+            benchmarks, distributions, samples, seed
+        )
+        types = [name for name, flag in zip(LAND_USE_TYPES, affected) if flag]
+        zones = zones[zones["ip_type"].isin(types).to_numpy()]
+        if zones.empty:
+            return {"samples": samples, "land_use_types": [], "zones": []}
+
+        reference = SensitivityService.evaluate_samples(
+            zones, values, affected, types, 0, 1
+        )
+        size = max(1, SENSITIVITY_BATCH_ROWS // len(zones))
+        zone_stacks: Dict[str, np.ndarray] = {}
+        type_stacks: Dict[str, np.ndarray] = {}
+        start = 0
+        while start < samples:
+            # runs in the threadpool, so abandoned requests stop between batches
+            check_deadline("sensitivity")
+            stop = min(start + size, samples)
+            try:
+                zone_values, type_values = SensitivityService.evaluate_samples(
+                    zones, values, affected, types, start, stop
+                )
+                consistent = start > 0 or SensitivityService.matches(
+                    reference, (zone_values, type_values)
+                )
+            except HTTPException:
+                if size == 1:
+                    raise
+                consistent = False
+            if not consistent:
+                logger.warning(
+                    "Batched sensitivity samples differ from the analyzer reference, "
+                    "samples are evaluated one by one"
+                )
+                size = 1
+                continue
+            if not zone_stacks:
+                zone_stacks = {
+                    col: np.empty((samples, len(zones))) for col in zone_values
+                }
+                type_stacks = {
+                    col: np.empty((samples, len(types))) for col in type_values
+                }
+            for col, stack in zone_stacks.items():
+                stack[start:stop] = zone_values[col]
+            for col, stack in type_stacks.items():
+                stack[start:stop] = type_values[col]
+            start = stop
+
+        zone_result = pd.DataFrame(
+            {
+                "functional_zone_id": (
+                    zones["functional_zone_id"].to_numpy()
+                    if "functional_zone_id" in zones.columns
+                    else None
+                ),
+                "land_use_type_name": zones["ip_type"].astype(str).to_numpy(),
+            }
+        )
+        zone_result["land_use_type_id"] = (
+            zone_result["land_use_type_name"].map(zone_mapping).astype("Int64")
+        )
+        zone_bands = {
+            col: SensitivityService.bands(stack, percentiles)
+            for col, stack in zone_stacks.items()
+        }
+        type_bands = {
+            col: SensitivityService.bands(stack, percentiles)
+            for col, stack in type_stacks.items()
+        }
+
+        def records(base: pd.DataFrame, bands: Dict[str, Dict[str, np.ndarray]]):
+            base = base.astype(object).where(base.notna(), None)
+            result = base.to_dict(orient="records")
+            for col, band in bands.items():
+                for name, array in band.items():
+                    for record, value in zip(result, array.tolist()):
+                        record.setdefault(col, {})[name] = (
+                            None if np.isnan(value) else value
+                        )
+            return result
+
+        type_result = pd.DataFrame({"land_use_type": types})
+        type_result["land_use_type_id"] = (
+            type_result["land_use_type"].map(zone_mapping).astype("Int64")
+        )
+        return {
+            "samples": samples,
+            "land_use_types": records(type_result, type_bands),
+            "zones": records(zone_result, zone_bands),
+        }
+
+    @staticmethod
+    async def run_sensitivity(
+        scenario_id: int,
+        benchmarks: CompiledBenchmarks,
+        distributions: List[ParameterDistribution],
+        samples: int,
+        seed: int,
+        percentiles: List[float],
+        source: str = None,
+        token: str = None,
+    ) -> Dict[str, Any]:
+        if samples > MC_MAX_SAMPLES:
+            raise http_exception(
+                400,
+                "Too many samples",
+                samples,
+                {"max_samples": MC_MAX_SAMPLES},
+            )
+        logger.info(
+            f"Running sensitivity analysis "
+            f"for scenario {scenario_id}, "
+            f"samples={samples}, "
+            f"distributions={[d.parameter for d in distributions]}, "
+            f"benchmarks={benchmarks}"
+        )
+        landuse_score_gdf, score_key = (
+            await InvestmentPotentialService.territory_values_stage(
+                scenario_id, benchmarks, as_long=True, token=token
+            )
+        )
+        functional_zones_gdf = await UrbanAPIGateway.get_functional_zones(
+            scenario_id, source=source, token=token
+        )
+        zones = await InvestmentPotentialService.zone_values_stage(
+            landuse_score_gdf, score_key, functional_zones_gdf
+        )
+        return await run_in_threadpool(
+            SensitivityService.evaluate,
+            zones,
+            benchmarks,
+            distributions,
+            samples,
+            seed,
+            percentiles,
+        )
@@ -0,0 +1,73 @@
+import asyncio
+from typing import Any, Callable
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.common.deadline.deadline import check_deadline
+from app.common.tracing.tracing import Span
+from app.dependencies import memory_profiler, stage_cache, tracer
+
+
+class StageCache:
+    """
+    Runs pipeline stages and caches their artifacts by content hash of stage inputs.
+
+    Artifacts are shared between requests and must be treated as read-only.
+    Concurrent requests for the same artifact wait for a single computation.
+    """
+
+    _inflight: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    async def run(stage: str, key: str, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Returns cached artifact of `stage` for `key` or computes it with `func(*args)`
+        in the threadpool, keeping the event loop free during geopandas work.
+        """
+
+        with tracer.span(f"stage.{stage}") as span:
+            return await StageCache._run(stage, key, span, func, *args)
+
+    @staticmethod
+    async def _run(
+        stage: str, key: str, span: Span, func: Callable[..., Any], *args: Any
+    ) -> Any:
+        cache_key = f"stage:{stage}:{key}"
+        artifact = await stage_cache.get(cache_key)
+        if artifact is not None:
+            logger.info(f"Stage {stage} artifact reused")
+            span.set(cache="hit")
+            return artifact
+
+        inflight = StageCache._inflight.get(cache_key)
+        if inflight is not None:
+            span.set(cache="shared")
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # the computing request was abandoned, take over the computation
+                return await StageCache.run(stage, key, func, *args)
+
+        span.set(cache="miss")
+        check_deadline(f"stage.{stage}")
+        future = asyncio.get_running_loop().create_future()
+        StageCache._inflight[cache_key] = future
+        try:
+            with memory_profiler.measure(f"stage.{stage}", span):
+                artifact = await run_in_threadpool(func, *args)
+            await stage_cache.set(cache_key, artifact)
+            future.set_result(artifact)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # the exception is re-raised here, waiters receive it through the future
+            future.exception()
+            raise
+        finally:
+            StageCache._inflight.pop(cache_key, None)
+        return artifact
@@ -0,0 +1,173 @@
+import base64
+import binascii
+import json
+import math
+
+from app.common.compression.compression import EncodedPayload
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import get_setting, result_store
+
+# Largest number of zones one query returns
+STORED_RESULT_MAX_LIMIT = int(get_setting("STORED_RESULT_MAX_LIMIT", "10000"))
+
+
+class StoredResultService:
+    @staticmethod
+    def parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+        """Bounding box from "minx,miny,maxx,maxy" in EPSG:4326."""
+
+        try:
+            values = tuple(float(value) for value in bbox.split(","))
+        except ValueError:
+            values = ()
+        if (
+            len(values) != 4
+            or not all(math.isfinite(value) for value in values)
+            or values[0] > values[2]
+            or values[1] > values[3]
+        ):
+            raise http_exception(
+                400, "Invalid bbox", bbox, "Expected minx,miny,maxx,maxy in EPSG:4326"
+            )
+        return values
+
+    @staticmethod
+    async def list_sets(scenario_id: int, kind: str | None = None) -> list[dict]:
+        if not result_store.enabled:
+            raise http_exception(404, "Result store is disabled")
+        return await result_store.sets(scenario_id, kind)
+
+    @staticmethod
+    def encode_cursor(result_set: dict, after: int) -> str:
+        """Opaque cursor of the page after zone `after` of a stored result set."""
+
+        state = json.dumps(
+            {
+                "key": result_set["key"],
+                "created": result_set["created_at"],
+                "after": after,
+            }
+        )
+        return base64.urlsafe_b64encode(state.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str, scenario_id: int) -> dict:
+        try:
+            state = json.loads(
+                base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            )
+            valid = (
+                isinstance(state["key"], str)
+                and isinstance(state["after"], int)
+                and isinstance(state["created"], float)
+            )
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            valid = False
+        if not valid or not state["key"].startswith(f"result:{scenario_id}:"):
+            raise http_exception(400, "Invalid cursor", cursor)
+        return state
+
+    @staticmethod
+    async def resolve_set(
+        scenario_id: int, result_key: str | None, kind: str | None
+    ) -> dict:
+        """Requested result set of the scenario, the newest one without a key."""
+
+        if not result_store.enabled:
+            raise http_exception(404, "Result store is disabled")
+        if result_key is not None:
+            if not result_key.startswith(f"result:{scenario_id}:"):
+                raise http_exception(
+                    400, "Result belongs to another scenario", result_key
+                )
+            sets = [await result_store.get_set(result_key)]
+        else:
+            sets = await StoredResultService.list_sets(scenario_id, kind)
+        selected = next((s for s in sets if s is not None), None)
+        if selected is None:
+            raise http_exception(
+                404,
+                "No stored result",
+                {"scenario_id": scenario_id, "result": result_key, "kind": kind},
+                "Per-zone results are stored by calculations returning GeoJSON",
+            )
+        return selected
+
+    @staticmethod
+    async def query_zones(
+        scenario_id: int,
+        result_key: str | None = None,
+        kind: str | None = None,
+        bbox: str | None = None,
+        zone_type_ids: list[int] | None = None,
+        metric: str | None = None,
+        min_value: float | None = None,
+        max_value: float | None = None,
+        limit: int = 1000,
+        cursor: str | None = None,
+    ) -> EncodedPayload:
+        """
+        Page of stored zones of a result set as a GeoJSON FeatureCollection, filtered
+        by bbox, zone type and metric range without running the pipeline. Zones keep
+        the order of the result, `next_cursor` continues after the last returned zone
+        with the same filters. The body is joined from the stored GeoJSON text, zones
+        are not decoded.
+        """
+
+        if not 0 < limit <= STORED_RESULT_MAX_LIMIT:
+            raise http_exception(
+                400,
+                "Invalid limit",
+                limit,
+                f"Limit must be 1..{STORED_RESULT_MAX_LIMIT}",
+            )
+        bounds = StoredResultService.parse_bbox(bbox) if bbox is not None else None
+        after = None
+        if cursor is not None:
+            state = StoredResultService.decode_cursor(cursor, scenario_id)
+            result_key, after = state["key"], state["after"]
+        result_set = await StoredResultService.resolve_set(
+            scenario_id, result_key, kind
+        )
+        if cursor is not None and result_set["created_at"] != state["created"]:
+            # zone ids of a stored again set do not continue the old ones
+            raise http_exception(
+                410, "Result was stored again, restart pagination", result_key
+            )
+        if metric is None and (min_value is not None or max_value is not None):
+            raise http_exception(400, "min_value and max_value need a metric")
+        if metric is not None and metric not in result_set["metrics"]:
+            raise http_exception(
+                400,
+                "Unknown metric",
+                metric,
+                f"Stored metrics: {', '.join(result_set['metrics'])}",
+            )
+
+        rows, more = await result_store.query(
+            result_set["key"],
+            bbox=bounds,
+            zone_type_ids=zone_type_ids,
+            metric=metric,
+            min_value=min_value,
+            max_value=max_value,
+            limit=limit,
+            after=after,
+        )
+        features = ",".join(
+            f'{{"type":"Feature","id":{feature_id},"geometry":{geometry},"properties":{properties}}}'
+            for _, feature_id, geometry, properties in rows
+        )
+        head = json.dumps(
+            {
+                "type": "FeatureCollection",
+                "result": result_set["key"],
+                "total_features": result_set["features"],
+                "next_cursor": (
+                    StoredResultService.encode_cursor(result_set, rows[-1][0])
+                    if more
+                    else None
+                ),
+            }
+        )
+        return EncodedPayload(f'{head[:-1]},"features":[{features}]}}'.encode())
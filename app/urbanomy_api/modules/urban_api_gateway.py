@@ -1,13 +1,129 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, Awaitable, Callable
+
+import aiohttp
 import geopandas as gpd
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
+from shapely.geometry import shape
 
+from app.common.deadline.deadline import CLIENT_CLOSED_REQUEST
 from app.common.exceptions.http_exception_wrapper import http_exception
-from app.dependencies import urban_api_handler
+from app.dependencies import (gateway_cache, get_setting, snapshot_store,
+                              urban_api_handler)
+
+ACCESS_CACHE_TTL = float(get_setting("ACCESS_CACHE_TTL", "60"))
+
+# Upstream reachability probe, results are reused for UPSTREAM_PROBE_TTL seconds
+URBAN_API_HEALTH_PATH = get_setting("URBAN_API_HEALTH_PATH", "/health_check/ping")
+UPSTREAM_PROBE_TIMEOUT = float(get_setting("UPSTREAM_PROBE_TIMEOUT", "2"))
+UPSTREAM_PROBE_TTL = float(get_setting("UPSTREAM_PROBE_TTL", "10"))
+
+# Functional zones are decoded from the upstream response in batches of this size
+ZONES_BATCH_SIZE = int(get_setting("ZONES_BATCH_SIZE", "5000"))
+
+# Upstream zone attributes not used by calculations, dropped while streaming
+ZONE_DROP_COLUMNS = [
+    "territory",
+    "created_at",
+    "updated_at",
+    "zone_type_name",
+    "year",
+    "source",
+    "name",
+]
+
+
+# Scenario/project relations never change, so they outlive regular gateway entries
+RELATION_TTL = 86400.0
+
+SNAPSHOT_MODES = ("off", "record", "replay", "fallback")
+
+# Timed out or abandoned calls are reported as such, never as missing data
+TIMEOUT_STATUSES = (504, CLIENT_CLOSED_REQUEST)
+SNAPSHOT_MODE = get_setting("SNAPSHOT_MODE", "off")
+if SNAPSHOT_MODE not in SNAPSHOT_MODES:
+    raise ValueError(f"SNAPSHOT_MODE must be one of {SNAPSHOT_MODES}")
 
 
 class UrbanAPIGateway:
     SOURCE_PRIORITY = ["OSM", "PZZ", "User"]
 
+    # "record" stores fetched data in the snapshot store, "replay" serves only
+    # snapshots, "fallback" records and serves stale snapshots when upstream fails
+    snapshot_mode = SNAPSHOT_MODE
+
+    # scenario/project relations seen by this process, used to resolve invalidations,
+    # they are also stored in gateway cache to be shared between workers
+    _scenario_projects: dict[int, int] = {}
+
+    @staticmethod
+    async def _cached(key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns upstream data from gateway cache or loads and stores it.
+
+        Keys are ``gateway:scenario:{id}:...`` or ``gateway:project:{id}:...``, cached
+        values are shared between requests and must not be modified in place.
+        Scenario info is cached per token only, see `check_scenario_access`.
+        """
+
+        value = await gateway_cache.get(key)
+        if value is None:
+            value = await loader()
+            await gateway_cache.set(key, value)
+        return value
+
+    @staticmethod
+    async def _snapshot(
+        scenario_id: int, name: str, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Loads upstream data according to `snapshot_mode`. Fallback is used for
+        upstream failures only (5xx, connection errors, timeouts), never for
+        rejected access or missing data.
+        """
+
+        mode = UrbanAPIGateway.snapshot_mode
+        if mode == "off":
+            return await loader()
+
+        scope = f"scenario_{scenario_id}"
+        if mode == "replay":
+            value = await run_in_threadpool(snapshot_store.load, scope, name)
+            if value is None:
+                raise http_exception(
+                    404,
+                    "No snapshot found for replay",
+                    _input={"scenario_id": scenario_id, "name": name},
+                )
+            return value
+
+        try:
+            value = await loader()
+        except (aiohttp.ClientError, asyncio.TimeoutError, HTTPException) as e:
+            if (
+                mode != "fallback"
+                or isinstance(e, HTTPException)
+                and e.status_code < 500
+            ):
+                raise
+            value = await run_in_threadpool(snapshot_store.load, scope, name)
+            if value is None:
+                raise
+            captured_at = snapshot_store.captured_at(scope, name)
+            logger.warning(
+                f"Urban API failed with {e!r}, serving {name} snapshot of scenario "
+                f"{scenario_id} captured {time.time() - captured_at:.0f}s ago"
+            )
+            return value
+
+        await run_in_threadpool(snapshot_store.save, scope, name, value)
+        return value
+
     @staticmethod
     async def _form_source_params(sources: list[dict]) -> dict:
         max_year = max(s["year"] for s in sources)
@@ -19,6 +135,29 @@ class UrbanAPIGateway:
                     return s
         return subset[0]
 
+    @staticmethod
+    async def get_functional_zone_source_list(
+        scenario_id: int, token: str = None
+    ) -> list[dict]:
+        """All source and year combinations of functional zones of the scenario."""
+
+        endpoint = f"/api/v1/scenarios/{scenario_id}/functional_zone_sources"
+        response = await UrbanAPIGateway._cached(
+            f"gateway:scenario:{scenario_id}:functional_zone_sources",
+            lambda: UrbanAPIGateway._snapshot(
+                scenario_id,
+                "functional_zone_sources",
+                lambda: urban_api_handler.get(
+                    endpoint_url=endpoint, headers={"Authorization": f"Bearer {token}"}
+                ),
+            ),
+        )
+        if not response:
+            raise http_exception(
+                404, f"No functional zone sources found for scenario_id {scenario_id}"
+            )
+        return response
+
     @staticmethod
     async def get_functional_zone_sources(
         scenario_id: int,
@@ -26,14 +165,9 @@ class UrbanAPIGateway:
         token: str = None,
         year: int = None,
     ) -> dict:
-        endpoint = f"/api/v1/scenarios/{scenario_id}/functional_zone_sources"
-        response = await urban_api_handler.get(
-            endpoint_url=endpoint, headers={"Authorization": f"Bearer {token}"}
+        response = await UrbanAPIGateway.get_functional_zone_source_list(
+            scenario_id, token
         )
-        if not response:
-            raise http_exception(
-                404, f"No functional zone sources found for scenario_id {scenario_id}"
-            )
 
         if source and year is not None:
             matches = [
@@ -64,6 +198,43 @@ class UrbanAPIGateway:
 
         return await UrbanAPIGateway._form_source_params(response)
 
+    @staticmethod
+    async def select_functional_zone_sources(
+        scenario_id: int,
+        sources: list[str] | None = None,
+        years: list[int] | None = None,
+        token: str = None,
+    ) -> list[dict]:
+        """
+        Source and year combinations matching the requested sources and years (all
+        when empty), ordered by SOURCE_PRIORITY and newest year first.
+        """
+
+        response = await UrbanAPIGateway.get_functional_zone_source_list(
+            scenario_id, token
+        )
+        subset = [
+            s
+            for s in response
+            if (not sources or s.get("source") in sources)
+            and (not years or s.get("year") in years)
+        ]
+        if not subset:
+            raise http_exception(
+                404,
+                "No functional zone data for the requested sources and years",
+                {"sources": sources, "years": years},
+                [{"source": s.get("source"), "year": s.get("year")} for s in response],
+            )
+        priority = {src: i for i, src in enumerate(UrbanAPIGateway.SOURCE_PRIORITY)}
+        return sorted(
+            subset,
+            key=lambda s: (
+                priority.get(s["source"], len(priority)),
+                -s["year"],
+            ),
+        )
+
     @staticmethod
     async def get_functional_zones(
         scenario_id: int,
@@ -100,68 +271,128 @@ class UrbanAPIGateway:
 
         endpoint = f"/api/v1/scenarios/{scenario_id}/functional_zones?year={year}&source={source}"
 
-        response = await urban_api_handler.get(
-            endpoint, headers={"Authorization": f"Bearer {token}" ""}
+        return await UrbanAPIGateway._cached(
+            f"gateway:scenario:{scenario_id}:functional_zones:{source}:{year}",
+            lambda: UrbanAPIGateway._snapshot(
+                scenario_id,
+                f"functional_zones_{source}_{year}",
+                lambda: UrbanAPIGateway._load_functional_zones(
+                    scenario_id, endpoint, token
+                ),
+            ),
         )
-        features = response.get("features", response)
-        landuse_polygons = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
-
-        if "properties" in landuse_polygons.columns:
-            landuse_polygons["landuse_zone"] = landuse_polygons["properties"].apply(
-                lambda x: x.get("landuse_zon") if isinstance(x, dict) else None
-            )
-
-        if "functional_zone_type" in landuse_polygons.columns:
-            landuse_polygons["zone_type_id"] = landuse_polygons[
-                "functional_zone_type"
-            ].apply(lambda x: x.get("id") if isinstance(x, dict) else None)
-            landuse_polygons["zone_type_name"] = landuse_polygons[
-                "functional_zone_type"
-            ].apply(
-                lambda x: (
-                    x.get("name")
-                    if isinstance(x, dict) and x.get("name") != "unknown"
-                    else "residential"
-                )
+
+    @staticmethod
+    def _zones_batch_frame(features: list[dict]) -> gpd.GeoDataFrame:
+        """
+        Builds frame of one batch of upstream zone features. Only attributes used by
+        calculations are kept, nested objects are reduced to the values read from them.
+        """
+
+        geometry = []
+        records = []
+        landuse_zone = []
+        zone_type_id = []
+        functional_zone_id = []
+        for feature in features:
+            geometry.append(
+                shape(feature["geometry"]) if feature.get("geometry") else None
             )
+            properties = dict(feature.get("properties") or {})
+            nested = properties.pop("properties", None)
+            landuse_zone.append(
+                nested.get("landuse_zon") if isinstance(nested, dict) else None
+            )
+            functional_zone_id.append(properties.pop("functional_zone_id", None))
+            zone_type = properties.pop("functional_zone_type", None)
+            zone_type_id.append(
+                zone_type.get("id") if isinstance(zone_type, dict) else None
+            )
+            for column in ZONE_DROP_COLUMNS:
+                properties.pop(column, None)
+            records.append(properties)
 
-        landuse_polygons.drop(
-            columns=[
-                "properties",
-                "functional_zone_type",
-                "territory",
-                "created_at",
-                "updated_at",
-                "zone_type_name",
-                "functional_zone_id",
-                "year",
-                "source",
-                "name",
-            ],
-            inplace=True,
-            errors="ignore",
+        batch = gpd.GeoDataFrame(
+            pd.DataFrame.from_records(records, index=range(len(records))),
+            geometry=gpd.GeoSeries(geometry, crs="EPSG:4326"),
         )
+        batch["landuse_zone"] = landuse_zone
+        batch["zone_type_id"] = pd.array(zone_type_id, dtype="Int16")
+        # zone ids are kept so results can be related back to upstream zones
+        batch["functional_zone_id"] = pd.array(functional_zone_id, dtype="Int64")
+        return batch
 
-        landuse_polygons.replace(
-            {"landuse_zone": {None: "Residential"}, "zone_type_id": {14: 1}},
-            inplace=True,
-        )
+    @staticmethod
+    async def _load_functional_zones(
+        scenario_id: int, endpoint: str, token: str = None
+    ) -> gpd.GeoDataFrame:
+        """
+        Streams upstream FeatureCollection into a frame batch by batch, the full JSON
+        tree of a large zone layer is never held in memory.
+        """
 
-        logger.info("Functional zones fetched")
+        batches = []
+        has_landuse = has_zone_type = False
+        async for features in urban_api_handler.get_items_stream(
+            endpoint,
+            "features.item",
+            headers={"Authorization": f"Bearer {token}" ""},
+            batch_size=ZONES_BATCH_SIZE,
+        ):
+            has_landuse = has_landuse or any(
+                "properties" in (f.get("properties") or {}) for f in features
+            )
+            has_zone_type = has_zone_type or any(
+                "functional_zone_type" in (f.get("properties") or {}) for f in features
+            )
+            batches.append(
+                await run_in_threadpool(UrbanAPIGateway._zones_batch_frame, features)
+            )
 
-        if not response or "features" not in response or not response["features"]:
+        if not batches:
             raise http_exception(
                 404, "No functional zones found for the given scenario ID", scenario_id
             )
 
+        landuse_polygons = (
+            batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True)
+        )
+        del batches
+        if not has_landuse:
+            landuse_polygons.drop(columns="landuse_zone", inplace=True)
+        if not has_zone_type:
+            landuse_polygons.drop(columns="zone_type_id", inplace=True)
+
+        landuse_polygons.replace(
+            {"landuse_zone": {None: "Residential"}, "zone_type_id": {14: 1}},
+            inplace=True,
+        )
+        if "landuse_zone" in landuse_polygons.columns:
+            landuse_polygons["landuse_zone"] = landuse_polygons["landuse_zone"].astype(
+                "category"
+            )
+
+        logger.info("Functional zones fetched")
         return landuse_polygons
 
     @staticmethod
-    async def get_project_id(scenario_id: int, token: str = None) -> int:
+    async def _load_scenario(scenario_id: int, token: str = None) -> dict:
         endpoint = f"/api/v1/scenarios/{scenario_id}"
-        response = await urban_api_handler.get(
+        return await urban_api_handler.get(
             endpoint, headers={"Authorization": f"Bearer {token}" ""}
         )
+
+    @staticmethod
+    async def get_project_id(scenario_id: int, token: str = None) -> int:
+        response = await UrbanAPIGateway._snapshot(
+            scenario_id,
+            "scenario",
+            lambda: UrbanAPIGateway._load_scenario(scenario_id, token),
+        )
+        return await UrbanAPIGateway._project_id(scenario_id, response)
+
+    @staticmethod
+    async def _project_id(scenario_id: int, response: dict) -> int:
         try:
             project_id = response.get("project", {}).get("project_id")
         except Exception:
@@ -169,15 +400,144 @@ class UrbanAPIGateway:
                 404, "Project ID is missing in scenario data.", scenario_id
             )
 
+        if (
+            project_id is not None
+            and UrbanAPIGateway._scenario_projects.get(scenario_id) != project_id
+        ):
+            UrbanAPIGateway._scenario_projects[scenario_id] = project_id
+            await gateway_cache.set(
+                f"gateway:relation:{project_id}:{scenario_id}", True, ttl=RELATION_TTL
+            )
+        return project_id
+
+    @staticmethod
+    async def check_scenario_access(scenario_id: int, token: str = None) -> int:
+        """
+        Checks that the token can read the scenario and returns its project id.
+
+        Successful checks are remembered per token for ACCESS_CACHE_TTL seconds, so
+        cached results and tiles do not cost an upstream call each. The check always
+        asks Urban API, snapshots are never used for it, and fails closed with 503
+        while Urban API is unavailable.
+        """
+
+        token_hash = hashlib.sha256(str(token).encode("utf-8")).hexdigest()[:32]
+        key = f"gateway:scenario:{scenario_id}:access:{token_hash}"
+        project_id = await gateway_cache.get(key)
+        if project_id is None:
+            try:
+                response = await UrbanAPIGateway._load_scenario(scenario_id, token)
+            except HTTPException as e:
+                if e.status_code < 500 or e.status_code in TIMEOUT_STATUSES:
+                    raise
+                raise http_exception(
+                    503,
+                    "Urban API is unavailable, scenario access cannot be checked",
+                    scenario_id,
+                    e.detail,
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise http_exception(
+                    503,
+                    "Urban API is unavailable, scenario access cannot be checked",
+                    scenario_id,
+                    repr(e),
+                )
+            project_id = await UrbanAPIGateway._project_id(scenario_id, response)
+            await gateway_cache.set(key, project_id, ttl=ACCESS_CACHE_TTL)
         return project_id
 
+    @staticmethod
+    async def check_upstream() -> dict:
+        """
+        Returns Urban API reachability and latency. Probes are cached briefly, so
+        frequent orchestrator checks do not turn into upstream traffic.
+        """
+
+        key = "gateway:upstream:ping"
+        probe = await gateway_cache.get(key)
+        if probe is None:
+            probe = await urban_api_handler.ping(
+                URBAN_API_HEALTH_PATH, timeout=UPSTREAM_PROBE_TIMEOUT
+            )
+            probe["checked_at"] = time.time()
+            await gateway_cache.set(key, probe, ttl=UPSTREAM_PROBE_TTL)
+        return probe
+
+    @staticmethod
+    async def get_known_scenarios(project_id: int) -> set[int]:
+        """
+        Returns ids of scenarios of the project which have been requested before by
+        this worker or, with a shared cache backend, by any worker.
+        """
+
+        known = {
+            scenario_id
+            for scenario_id, known_project_id in UrbanAPIGateway._scenario_projects.items()
+            if known_project_id == project_id
+        }
+        for key in await gateway_cache.keys(f"gateway:relation:{project_id}:"):
+            known.add(int(key.rsplit(":", 1)[1]))
+        return known
+
+    @staticmethod
+    async def get_known_project(scenario_id: int) -> int | None:
+        """Returns project id of a scenario which has been requested before."""
+
+        project_id = UrbanAPIGateway._scenario_projects.get(scenario_id)
+        if project_id is not None:
+            return project_id
+        for key in await gateway_cache.keys("gateway:relation:"):
+            _, _, project_id, known_scenario_id = key.split(":")
+            if int(known_scenario_id) == scenario_id:
+                return int(project_id)
+        return None
+
+    @staticmethod
+    async def invalidate_scenario(scenario_id: int, scope: str = "") -> int:
+        """
+        Drops cached upstream data of a scenario.
+
+        `scope` narrows invalidation to keys starting with it, e.g. ``indicators`` or
+        ``functional_zone`` (sources and zones). Returns number of dropped entries.
+        """
+
+        return await gateway_cache.delete_prefix(
+            f"gateway:scenario:{scenario_id}:{scope}"
+        )
+
+    @staticmethod
+    async def invalidate_project(project_id: int) -> int:
+        """Drops cached upstream data of a project. Returns number of dropped entries."""
+
+        return await gateway_cache.delete_prefix(f"gateway:project:{project_id}:")
+
     @staticmethod
     async def get_territory(scenario_id: int, token: str = None) -> gpd.GeoDataFrame:
         project_id = await UrbanAPIGateway.get_project_id(scenario_id, token)
+        return await UrbanAPIGateway._cached(
+            f"gateway:project:{project_id}:territory",
+            lambda: UrbanAPIGateway._load_territory(scenario_id, project_id, token),
+        )
+
+    @staticmethod
+    async def _load_territory(
+        scenario_id: int, project_id: int, token: str = None
+    ) -> gpd.GeoDataFrame:
         endpoint = f"/api/v1/projects/{project_id}/territory"
         try:
-            response = await urban_api_handler.get(
-                endpoint, headers={"Authorization": f"Bearer {token}" ""}
+            response = await UrbanAPIGateway._snapshot(
+                scenario_id,
+                "territory",
+                lambda: urban_api_handler.get(
+                    endpoint, headers={"Authorization": f"Bearer {token}" ""}
+                ),
+            )
+        except HTTPException as e:
+            if e.status_code in TIMEOUT_STATUSES:
+                raise
+            raise http_exception(
+                404, "No territory found for the given scenario ID", scenario_id
             )
         except Exception:
             raise http_exception(
@@ -199,8 +559,21 @@ class UrbanAPIGateway:
     async def get_indicator_values(scenario_id: int, token: str = None) -> dict:
         endpoint = f"/api/v1/scenarios/{scenario_id}/indicators_values"
         try:
-            response = await urban_api_handler.get(
-                endpoint, headers={"Authorization": f"Bearer {token}" ""}
+            response = await UrbanAPIGateway._cached(
+                f"gateway:scenario:{scenario_id}:indicators",
+                lambda: UrbanAPIGateway._snapshot(
+                    scenario_id,
+                    "indicators",
+                    lambda: urban_api_handler.get(
+                        endpoint, headers={"Authorization": f"Bearer {token}" ""}
+                    ),
+                ),
+            )
+        except HTTPException as e:
+            if e.status_code in TIMEOUT_STATUSES:
+                raise
+            raise http_exception(
+                404, "No indicators values found for the given scenario ID", scenario_id
             )
         except Exception:
             raise http_exception(
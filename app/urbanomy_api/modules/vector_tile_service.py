@@ -0,0 +1,200 @@
+import geopandas as gpd
+import mapbox_vector_tile
+import pandas as pd
+import shapely
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.common.compression.compression import EncodedPayload
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.dependencies import tile_cache
+from app.urbanomy_api.constants.zone_mapping import zone_mapping
+from app.urbanomy_api.modules.compiled_benchmarks import DEFAULT_BENCHMARKS
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.result_cache import ResultCache
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MVT_LAYER_NAME = "investment"
+MVT_EXTENT = 4096
+# Geometries are clipped with a margin so polygon edges do not show at tile borders
+MVT_BUFFER_PX = 64
+# Simplification tolerance in tile pixels
+MVT_SIMPLIFY_PX = 1.0
+MAX_ZOOM = 22
+
+WEB_MERCATOR_HALF = 20037508.342789244
+
+
+class VectorTileService:
+    @staticmethod
+    def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+        """Web Mercator bounds of XYZ tile as (minx, miny, maxx, maxy)."""
+
+        size = 2 * WEB_MERCATOR_HALF / 2**z
+        minx = -WEB_MERCATOR_HALF + x * size
+        maxy = WEB_MERCATOR_HALF - y * size
+        return minx, maxy - size, minx + size, maxy
+
+    @staticmethod
+    def validate_tile(z: int, x: int, y: int) -> None:
+        if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2**z or not 0 <= y < 2**z:
+            raise http_exception(
+                400,
+                "Invalid tile coordinates",
+                _input={"z": z, "x": x, "y": y},
+                _detail={"max_zoom": MAX_ZOOM},
+            )
+
+    @staticmethod
+    def prepare_tile_source(gdf_out: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+        """
+        Per-zone metrics in Web Mercator with tile properties and a built spatial index.
+        """
+
+        source = gdf_out.to_crs(3857)
+        source = source.rename(columns={"ip_type": "land_use_type_name"})
+        source["land_use_type_id"] = (
+            source["land_use_type_name"].map(zone_mapping).astype("Int64")
+        )
+        property_columns = [
+            col
+            for col in source.columns
+            if col != source.geometry.name
+            and (
+                pd.api.types.is_numeric_dtype(source[col])
+                or col == "land_use_type_name"
+            )
+        ]
+        source = source[property_columns + [source.geometry.name]].reset_index(
+            drop=True
+        )
+        source.sindex
+        return source
+
+    @staticmethod
+    def encode_tile(source: gpd.GeoDataFrame, z: int, x: int, y: int) -> bytes | None:
+        """Clips, simplifies and encodes zones intersecting the tile, None if empty."""
+
+        minx, miny, maxx, maxy = VectorTileService.tile_bounds(z, x, y)
+        pixel = (maxx - minx) / MVT_EXTENT
+        margin = pixel * MVT_BUFFER_PX
+        clip_bounds = (minx - margin, miny - margin, maxx + margin, maxy + margin)
+
+        idx = source.sindex.query(shapely.box(*clip_bounds), predicate="intersects")
+        if len(idx) == 0:
+            return None
+
+        geometries = shapely.clip_by_rect(source.geometry.values[idx], *clip_bounds)
+        geometries = shapely.simplify(
+            geometries, pixel * MVT_SIMPLIFY_PX, preserve_topology=True
+        )
+        keep = ~shapely.is_empty(geometries)
+        if not keep.any():
+            return None
+
+        rows = source.drop(columns=source.geometry.name).iloc[idx[keep]]
+        records = rows.astype(object).where(rows.notna(), None).to_dict("records")
+        features = [
+            {
+                "geometry": geometry,
+                "properties": {k: v for k, v in record.items() if v is not None},
+            }
+            for geometry, record in zip(geometries[keep], records)
+        ]
+        return mapbox_vector_tile.encode(
+            [{"name": MVT_LAYER_NAME, "features": features}],
+            default_options={
+                "quantize_bounds": (minx, miny, maxx, maxy),
+                "extents": MVT_EXTENT,
+            },
+        )
+
+    @staticmethod
+    async def get_tile_source(
+        scenario_id: int,
+        source: str | None = None,
+        year: int | None = None,
+        token: str | None = None,
+        upstream: str | None = None,
+    ) -> gpd.GeoDataFrame:
+        """
+        Tile source built from the cached default benchmarks functional zones result.
+        `upstream` is the fingerprint of the scenario data, computed if not given.
+        """
+
+        if upstream is None:
+            upstream = await InvestmentPotentialService.upstream_fingerprint(
+                scenario_id, token, with_zones=True, source=source, year=year
+            )
+
+        async def _compute_source() -> gpd.GeoDataFrame:
+            gdf_out, _ = await ResultCache.get_or_compute_object(
+                ResultCache.build_key(
+                    "fzones_frames",
+                    scenario_id,
+                    benchmarks=DEFAULT_BENCHMARKS.digest,
+                    source=source,
+                    year=year,
+                    upstream=upstream,
+                ),
+                lambda: InvestmentPotentialService.compute_investment_fzones(
+                    scenario_id,
+                    DEFAULT_BENCHMARKS,
+                    source=source,
+                    token=token,
+                    year=year,
+                ),
+            )
+            return await run_in_threadpool(
+                VectorTileService.prepare_tile_source, gdf_out
+            )
+
+        return await ResultCache.get_or_compute_object(
+            ResultCache.build_key(
+                "tile_source",
+                scenario_id,
+                benchmarks=DEFAULT_BENCHMARKS.digest,
+                source=source,
+                year=year,
+                upstream=upstream,
+            ),
+            _compute_source,
+        )
+
+    @staticmethod
+    async def get_tile(
+        scenario_id: int,
+        z: int,
+        x: int,
+        y: int,
+        source: str | None = None,
+        year: int | None = None,
+        token: str | None = None,
+    ) -> EncodedPayload | None:
+        """
+        Returns encoded MVT tile of scenario investment metrics, None for empty tiles.
+        Tiles are cached together with their compressed variants.
+        """
+
+        VectorTileService.validate_tile(z, x, y)
+        # memoised by the gateway cache, a cache lookup for most tiles
+        upstream = await InvestmentPotentialService.upstream_fingerprint(
+            scenario_id, token, with_zones=True, source=source, year=year
+        )
+        key = f"result:{scenario_id}:tile:{source}:{year}:{upstream}:{z}/{x}/{y}"
+        payload = await tile_cache.get(key)
+        if payload is not None:
+            return payload or None
+
+        tile_source = await VectorTileService.get_tile_source(
+            scenario_id, source, year, token, upstream
+        )
+        tile = await run_in_threadpool(
+            VectorTileService.encode_tile, tile_source, z, x, y
+        )
+        # empty tiles are cached as False to be distinguishable from misses
+        payload = EncodedPayload(tile, media_type=MVT_MEDIA_TYPE) if tile else False
+        await tile_cache.set(key, payload)
+        logger.info(f"Tile {z}/{x}/{y} of scenario {scenario_id} encoded")
+        return payload or None
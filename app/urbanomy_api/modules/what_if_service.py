@@ -0,0 +1,255 @@
+from typing import Any, Dict, List
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely.geometry as geom
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from app.common.exceptions.http_exception_wrapper import http_exception
+from app.urbanomy_api.dto.investment_attractivness_what_if_dto import \
+    ZoneChange
+from app.urbanomy_api.modules.aggregation_service import ADDITIVE_METRICS
+from app.urbanomy_api.modules.compiled_benchmarks import CompiledBenchmarks
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.result_cache import ResultCache
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+
+# Summary metrics which are totals over zones, all other summary metrics are zone means
+SUMMARY_TOTALS = frozenset({"area", *ADDITIVE_METRICS})
+
+
+class WhatIfService:
+    @staticmethod
+    def check_baseline(
+        scenario_id: int,
+        baseline: str | None,
+        benchmarks: CompiledBenchmarks,
+        source: str | None,
+        upstream: str,
+    ) -> None:
+        """
+        Fails with 412 when `baseline` is not the ETag of the current functional zones
+        result, i.e. zones or benchmarks changed since the client got it.
+        """
+
+        if baseline is None:
+            return
+        etags = [
+            ResultCache.etag(
+                ResultCache.build_key(
+                    "fzones",
+                    scenario_id,
+                    as_geojson=as_geojson,
+                    benchmarks=benchmarks.digest,
+                    source=source,
+                    upstream=upstream,
+                )
+            )
+            for as_geojson in (False, True)
+        ]
+        if baseline.removeprefix("W/") not in etags:
+            raise http_exception(
+                412,
+                "Baseline result is outdated",
+                _input={"baseline": baseline},
+                _detail={"etags": etags},
+            )
+
+    @staticmethod
+    def apply_changes(
+        zones: gpd.GeoDataFrame, changes: List[ZoneChange]
+    ) -> gpd.GeoDataFrame:
+        """Edited and added zones in CRS of the layer, removed zones are left out."""
+
+        ids = [
+            c.functional_zone_id for c in changes if c.functional_zone_id is not None
+        ]
+        if len(set(ids)) != len(ids):
+            raise http_exception(422, "Each zone can be changed only once", ids)
+        known = (
+            pd.Index(zones["functional_zone_id"])
+            if "functional_zone_id" in zones.columns
+            else pd.Index([])
+        )
+        missing = sorted(set(ids) - set(known))
+        if missing:
+            raise http_exception(404, "Functional zones not found", missing)
+
+        edited = [
+            c for c in changes if c.functional_zone_id is not None and not c.delete
+        ]
+        patched = zones.iloc[known.get_indexer([c.functional_zone_id for c in edited])]
+        patched = patched.reset_index(drop=True)
+        geometry = patched.geometry.to_numpy().copy()
+        zone_type_id = patched["zone_type_id"].to_numpy(dtype=object, na_value=None)
+        for i, change in enumerate(edited):
+            if change.geometry is not None:
+                geometry[i] = geom.shape(change.geometry.as_dict())
+            if change.zone_type_id is not None:
+                zone_type_id[i] = change.zone_type_id
+        patched = patched.set_geometry(gpd.GeoSeries(geometry, crs=zones.crs))
+        patched["zone_type_id"] = pd.array(zone_type_id, dtype="Int16")
+
+        added = [c for c in changes if c.functional_zone_id is None]
+        if added:
+            added_gdf = gpd.GeoDataFrame(
+                {
+                    "zone_type_id": pd.array(
+                        [c.zone_type_id for c in added], dtype="Int16"
+                    ),
+                    "functional_zone_id": pd.array([None] * len(added), dtype="Int64"),
+                },
+                geometry=[geom.shape(c.geometry.as_dict()) for c in added],
+                crs="EPSG:4326",
+            ).to_crs(zones.crs)
+            patched = pd.concat([patched, added_gdf], ignore_index=True)
+        return patched
+
+    @staticmethod
+    def update_summary(
+        summary: pd.DataFrame,
+        baseline_out: pd.DataFrame,
+        old_out: pd.DataFrame,
+        new_out: pd.DataFrame,
+    ) -> pd.DataFrame:
+        """
+        Summary with contributions of `old_out` zones replaced by `new_out` zones.
+
+        Totals are updated with per-type sums of the changed zones, means are turned
+        into sums with baseline zone counts first. Summary columns which are not
+        per-zone metrics are kept as they were.
+        """
+
+        columns = [col for col in summary.columns if col in baseline_out.columns]
+        means = [col for col in columns if col not in SUMMARY_TOTALS]
+
+        def per_type(df: pd.DataFrame):
+            return df.reindex(columns=columns).groupby(df["ip_type"].astype(str))
+
+        counts = per_type(baseline_out).count()
+        zone_counts = baseline_out["ip_type"].astype(str).value_counts()
+        sums = summary[columns].copy()
+        sums[means] = sums[means] * counts[means].reindex(sums.index)
+
+        new_groups, old_groups = per_type(new_out), per_type(old_out)
+        sums = sums.add(new_groups.sum(), fill_value=0).sub(
+            old_groups.sum(), fill_value=0
+        )
+        counts = counts.add(new_groups.count(), fill_value=0).sub(
+            old_groups.count(), fill_value=0
+        )
+        zone_counts = zone_counts.add(
+            new_out["ip_type"].astype(str).value_counts(), fill_value=0
+        ).sub(old_out["ip_type"].astype(str).value_counts(), fill_value=0)
+
+        result = sums.copy()
+        mean_counts = counts[means].reindex(result.index)
+        result[means] = sums[means] / mean_counts.where(mean_counts > 0)
+        result = result.join(summary.drop(columns=columns))[summary.columns]
+        result = result[zone_counts.reindex(result.index).fillna(0) > 0]
+        result.index.name = summary.index.name
+        return result
+
+    @staticmethod
+    def recompute(
+        gdf_out: gpd.GeoDataFrame,
+        summary: pd.DataFrame,
+        score_gdf: gpd.GeoDataFrame,
+        zones: gpd.GeoDataFrame,
+        benchmarks: CompiledBenchmarks,
+        changes: List[ZoneChange],
+        as_geojson: bool,
+    ) -> Dict[str, Any]:
+        """Metrics of changed zones and summary updated from the baseline result."""
+
+        patched = WhatIfService.apply_changes(zones, changes)
+        mapped = InvestmentPotentialService.map_zones(
+            score_gdf, patched, crs=gdf_out.crs
+        )
+        if mapped["ip_type"].isin(benchmarks.keys).any():
+            new_out, _ = InvestmentPotentialService.calculate_investment_attractiveness(
+                mapped, benchmarks
+            )
+        else:
+            new_out = mapped.iloc[:0].copy()
+        new_out["change"] = np.where(
+            new_out["functional_zone_id"].isna(), "added", "modified"
+        )
+
+        changed_ids = [
+            c.functional_zone_id for c in changes if c.functional_zone_id is not None
+        ]
+        old_out = gdf_out[gdf_out["functional_zone_id"].isin(changed_ids)]
+        removed = sorted(
+            set(old_out["functional_zone_id"].dropna().astype(int))
+            - set(new_out["functional_zone_id"].dropna().astype(int))
+        )
+        summary = WhatIfService.update_summary(summary, gdf_out, old_out, new_out)
+        return {
+            "summary": InvestmentPotentialService.generate_response(
+                gdf_out, summary, as_geojson=False
+            ),
+            "zones": (
+                InvestmentPotentialService.generate_response(
+                    new_out, summary, as_geojson=True
+                )
+                if as_geojson
+                else InvestmentPotentialService.zone_records(new_out)
+            ),
+            "removed": removed,
+        }
+
+    @staticmethod
+    async def run_what_if(
+        scenario_id: int,
+        as_geojson: bool,
+        benchmarks: CompiledBenchmarks,
+        changes: List[ZoneChange],
+        upstream: str,
+        source: str = None,
+        token: str = None,
+    ) -> Dict[str, Any]:
+        """
+        Applies zone changes to the functional zones result. Only changed zones go
+        through mapping and the analyzer, the baseline comes from the frame cache and
+        is keyed by the `upstream` fingerprint the changes are checked against.
+        """
+
+        logger.info(
+            f"Running what-if calculation "
+            f"for scenario {scenario_id}, "
+            f"changes={len(changes)}, "
+            f"benchmarks={benchmarks}"
+        )
+        gdf_out, summary = await ResultCache.get_or_compute_object(
+            ResultCache.build_key(
+                "fzones_frames",
+                scenario_id,
+                benchmarks=benchmarks.digest,
+                source=source,
+                year=None,
+                upstream=upstream,
+            ),
+            lambda: InvestmentPotentialService.compute_investment_fzones(
+                scenario_id, benchmarks, source=source, token=token
+            ),
+        )
+        score_gdf, _ = await InvestmentPotentialService.territory_values_stage(
+            scenario_id, benchmarks, as_long=True, token=token
+        )
+        zones = await UrbanAPIGateway.get_functional_zones(
+            scenario_id, source=source, token=token
+        )
+        return await run_in_threadpool(
+            WhatIfService.recompute,
+            gdf_out,
+            summary,
+            score_gdf,
+            zones,
+            benchmarks,
+            changes,
+            as_geojson,
+        )
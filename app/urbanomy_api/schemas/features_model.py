@@ -97,6 +97,13 @@ class PolygonalGeometry(BaseModel):
     def as_dict(self) -> dict:
         return {"type": self.type, "coordinates": self.coordinates}
 
+    def vertex_count(self) -> int:
+        """
+        Number of coordinate pairs of all rings
+        """
+        polygons = [self.coordinates] if self.type == "Polygon" else self.coordinates
+        return sum(len(ring) for polygon in polygons for ring in polygon)
+
 
 class Feature(BaseModel):
     type: Literal["Feature"] = Field(..., examples=["Feature"])
@@ -143,3 +150,6 @@ class FeatureCollection(BaseModel):
             "type": "FeatureCollection",
             "features": [f.as_dict() for f in self.features],
         }
+
+    def vertex_count(self) -> int:
+        return sum(f.geometry.vertex_count() for f in self.features)
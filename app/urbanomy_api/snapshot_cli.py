@@ -0,0 +1,139 @@
+"""
+Capture and replay of upstream scenario bundles.
+
+    python -m app.urbanomy_api.snapshot_cli capture 198 199 --token TOKEN
+    python -m app.urbanomy_api.snapshot_cli replay 198 --repeat 5 --trace-memory
+    python -m app.urbanomy_api.snapshot_cli list
+
+Snapshots are stored in SNAPSHOT_DIR. Replay runs the calculations with default
+benchmarks against snapshots only, without Urban API access.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+
+from app.dependencies import (frame_cache, gateway_cache, result_cache,
+                              snapshot_store, stage_cache)
+from app.urbanomy_api.modules.compiled_benchmarks import DEFAULT_BENCHMARKS
+from app.urbanomy_api.modules.invest_potential_service import \
+    InvestmentPotentialService
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+
+
+async def capture(scenario_ids: list[int], token: str) -> None:
+    UrbanAPIGateway.snapshot_mode = "record"
+    for scenario_id in scenario_ids:
+        await UrbanAPIGateway.get_territory(scenario_id, token=token)
+        await UrbanAPIGateway.get_indicator_values(scenario_id, token=token)
+        await UrbanAPIGateway.get_functional_zones(scenario_id, token=token)
+        sources = snapshot_store.load(
+            f"scenario_{scenario_id}", "functional_zone_sources"
+        )
+        for source in sorted({s["source"] for s in sources or []}):
+            await UrbanAPIGateway.get_functional_zones(
+                scenario_id, source=source, token=token
+            )
+        print(f"Scenario {scenario_id} captured")
+
+
+async def replay(
+    scenario_ids: list[int], repeat: int, as_geojson: bool, warm: bool, trace: bool
+) -> None:
+    UrbanAPIGateway.snapshot_mode = "replay"
+    calculations = {
+        "territory": lambda scenario_id: InvestmentPotentialService.run_investment_calculation(
+            scenario_id, as_geojson, DEFAULT_BENCHMARKS
+        ),
+        "fzones": lambda scenario_id: InvestmentPotentialService.run_investment_calculation_fzones(
+            scenario_id, as_geojson, DEFAULT_BENCHMARKS
+        ),
+    }
+    for scenario_id in scenario_ids:
+        for kind, calculation in calculations.items():
+            durations, peaks = [], []
+            for _ in range(repeat):
+                if not warm:
+                    for cache in (
+                        gateway_cache,
+                        result_cache,
+                        frame_cache,
+                        stage_cache,
+                    ):
+                        await cache.clear()
+                if trace:
+                    tracemalloc.start()
+                started = time.perf_counter()
+                await calculation(scenario_id)
+                durations.append(time.perf_counter() - started)
+                if trace:
+                    peaks.append(tracemalloc.get_traced_memory()[1] / 2**20)
+                    tracemalloc.stop()
+            line = (
+                f"scenario {scenario_id} {kind}: "
+                f"min {min(durations):.3f}s, "
+                f"median {statistics.median(durations):.3f}s, "
+                f"max {max(durations):.3f}s"
+            )
+            if peaks:
+                line += f", peak {max(peaks):.1f} MiB"
+            print(line)
+
+
+def list_snapshots() -> None:
+    for scope, manifest in snapshot_store.list().items():
+        print(scope)
+        for name, entry in manifest.items():
+            captured_at = datetime.fromtimestamp(entry["captured_at"])
+            print(
+                f"  {name}: {entry['file']}, captured {captured_at:%Y-%m-%d %H:%M:%S}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Capture and replay Urban API scenario snapshots"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    capture_parser = commands.add_parser("capture", help="Fetch and store scenarios")
+    capture_parser.add_argument("scenario_ids", type=int, nargs="+")
+    capture_parser.add_argument("--token", required=True, help="Urban API token")
+
+    replay_parser = commands.add_parser(
+        "replay", help="Run calculations against stored scenarios"
+    )
+    replay_parser.add_argument("scenario_ids", type=int, nargs="+")
+    replay_parser.add_argument("--repeat", type=int, default=3)
+    replay_parser.add_argument("--as-geojson", action="store_true")
+    replay_parser.add_argument(
+        "--warm", action="store_true", help="Keep caches between runs"
+    )
+    replay_parser.add_argument(
+        "--trace-memory", action="store_true", help="Report tracemalloc peak"
+    )
+
+    commands.add_parser("list", help="List stored snapshots")
+
+    args = parser.parse_args()
+    if args.command == "capture":
+        asyncio.run(capture(args.scenario_ids, args.token))
+    elif args.command == "replay":
+        asyncio.run(
+            replay(
+                args.scenario_ids,
+                args.repeat,
+                args.as_geojson,
+                args.warm,
+                args.trace_memory,
+            )
+        )
+    else:
+        list_snapshots()
+
+
+if __name__ == "__main__":
+    main()
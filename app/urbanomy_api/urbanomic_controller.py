@@ -1,68 +1,637 @@
-from typing import Annotated, Any, Dict
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, FastAPI
+from fastapi import (APIRouter, BackgroundTasks, Depends, FastAPI, Form, Query,
+                     Request, Response)
+from loguru import logger
 
-from app.common.auth.auth import verify_token
-from app.urbanomy_api.dto.benchmarks_dto import (non_residential_demo,
-                                                 residential_demo)
+from app.common.auth.auth import verify_token, verify_webhook_token
+from app.common.compression.compression import EncodedPayload, serialize_json
+from app.common.sse.sse import event_response
+from app.dependencies import calculation_admission
+from app.urbanomy_api.dto.investment_attractivness_aggregation_dto import \
+    InvestmentAttractivenessAggregationRequestDTO
+from app.urbanomy_api.dto.investment_attractivness_allocation_dto import \
+    InvestmentAttractivenessAllocationRequestDTO
+from app.urbanomy_api.dto.investment_attractivness_comparison_dto import \
+    InvestmentAttractivenessComparisonRequestDTO
 from app.urbanomy_api.dto.investment_attractivness_dto import \
     InvestmentAttractivenessRequestDTO
-from app.urbanomy_api.dto.InvestmentAttractivnessFzonesRequestDto import \
-    InvestmentAttractivenessFunctionalZonesRequestDTO
+from app.urbanomy_api.dto.investment_attractivness_sensitivity_dto import \
+    InvestmentAttractivenessSensitivityRequestDTO
+from app.urbanomy_api.dto.investment_attractivness_what_if_dto import \
+    InvestmentAttractivenessWhatIfRequestDTO
+from app.urbanomy_api.dto.InvestmentAttractivnessFzonesRequestDto import (
+    InvestmentAttractivenessFunctionalZonesRequestDTO, Source)
 from app.urbanomy_api.dto.investments_attractivness_coords_dto import \
     InvestmentAttractivenessCoordsDto
+from app.urbanomy_api.dto.investments_attractivness_layer_dto import \
+    InvestmentAttractivenessLayerDto
+from app.urbanomy_api.dto.result_page_dto import ResultPageDto
+from app.urbanomy_api.dto.scenario_change_notification_dto import \
+    ScenarioChangeNotificationDTO
+from app.urbanomy_api.modules.aggregation_service import AggregationService
+from app.urbanomy_api.modules.allocation_service import AllocationService
+from app.urbanomy_api.modules.cache_invalidation_service import \
+    CacheInvalidationService
+from app.urbanomy_api.modules.calculation_stream_service import \
+    CalculationStreamService
+from app.urbanomy_api.modules.comparison_service import ComparisonService
+from app.urbanomy_api.modules.compiled_benchmarks import (
+    DEFAULT_BENCHMARKS_CONTENT, CompiledBenchmarks)
 from app.urbanomy_api.modules.invest_potential_service import \
     InvestmentPotentialService
+from app.urbanomy_api.modules.layer_upload_service import LayerUploadService
+from app.urbanomy_api.modules.memory_estimator import MemoryEstimator
+from app.urbanomy_api.modules.result_cache import ResultCache
+from app.urbanomy_api.modules.sensitivity_service import SensitivityService
+from app.urbanomy_api.modules.stored_result_service import StoredResultService
+from app.urbanomy_api.modules.urban_api_gateway import UrbanAPIGateway
+from app.urbanomy_api.modules.vector_tile_service import VectorTileService
+from app.urbanomy_api.modules.what_if_service import WhatIfService
 
 app = FastAPI()
 urbanomic_router = APIRouter()
 
+# Defaults change only with a deploy, so they are serialised once at startup
+DEFAULT_BENCHMARKS_PAYLOAD = EncodedPayload(serialize_json(DEFAULT_BENCHMARKS_CONTENT))
+DEFAULT_BENCHMARKS_CACHE_CONTROL = "public, max-age=3600"
+
 
 @urbanomic_router.post("/calculate_investment_attractiveness")
 async def calculate_investment_attractiveness(
+    request: Request,
     params: Annotated[
         InvestmentAttractivenessRequestDTO, Depends(InvestmentAttractivenessRequestDTO)
     ],
+    page: Annotated[ResultPageDto, Depends(ResultPageDto)],
     token: str = Depends(verify_token),
 ):
-    benchmarks_dict: Dict[str, Dict[str, Any]] = params.benchmarks.model_dump()
-    result = await InvestmentPotentialService.run_investment_calculation(
-        params.scenario_id, params.as_geojson, benchmarks_dict, token
+    page.check_geojson(params.as_geojson)
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks)
+    key = ResultCache.build_key(
+        "territory",
+        params.scenario_id,
+        as_geojson=params.as_geojson,
+        benchmarks=benchmarks.digest,
+        upstream=await InvestmentPotentialService.upstream_fingerprint(
+            params.scenario_id, token
+        ),
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: MemoryEstimator.guard(
+            lambda: MemoryEstimator.scenario(params.scenario_id, token),
+            lambda: calculation_admission.run(
+                token,
+                lambda: InvestmentPotentialService.run_investment_calculation(
+                    params.scenario_id, params.as_geojson, benchmarks, token
+                ),
+            ),
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+        page_size=page.page_size,
     )
-    return result
 
 
 @urbanomic_router.post("/calculate_investment_attractiveness_functional_zones")
 async def calculate_investment_attractiveness_functional_zones(
+    request: Request,
     params: Annotated[
         InvestmentAttractivenessFunctionalZonesRequestDTO,
         Depends(InvestmentAttractivenessFunctionalZonesRequestDTO),
     ],
+    page: Annotated[ResultPageDto, Depends(ResultPageDto)],
     token: str = Depends(verify_token),
 ):
-    benchmarks_dict: Dict[str, Dict[str, Any]] = params.benchmarks.model_dump()
-    result = await InvestmentPotentialService.run_investment_calculation_fzones(
-        params.scenario_id, params.as_geojson, benchmarks_dict, params.source, token
+    page.check_geojson(params.as_geojson)
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks)
+    key = ResultCache.build_key(
+        "fzones",
+        params.scenario_id,
+        as_geojson=params.as_geojson,
+        benchmarks=benchmarks.digest,
+        source=params.source,
+        upstream=await InvestmentPotentialService.upstream_fingerprint(
+            params.scenario_id, token, with_zones=True, source=params.source
+        ),
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: MemoryEstimator.guard(
+            lambda: MemoryEstimator.scenario(
+                params.scenario_id, token, with_zones=True, source=params.source
+            ),
+            lambda: calculation_admission.run(
+                token,
+                lambda: InvestmentPotentialService.run_investment_calculation_fzones(
+                    params.scenario_id,
+                    params.as_geojson,
+                    benchmarks,
+                    params.source,
+                    token,
+                ),
+            ),
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+        page_size=page.page_size,
     )
 
-    return result
+
+@urbanomic_router.post("/calculate_investment_attractiveness_functional_zones/events")
+async def calculate_investment_attractiveness_functional_zones_events(
+    request: Request,
+    params: Annotated[
+        InvestmentAttractivenessFunctionalZonesRequestDTO,
+        Depends(InvestmentAttractivenessFunctionalZonesRequestDTO),
+    ],
+    token: str = Depends(verify_token),
+):
+    """
+    Functional zones calculation as server-sent events with stage progress and
+    per-zone results of each chunk of zones as soon as it is calculated
+    """
+
+    await UrbanAPIGateway.check_scenario_access(params.scenario_id, token)
+    return await event_response(
+        request,
+        CalculationStreamService.stream_fzones(
+            params.scenario_id,
+            params.as_geojson,
+            CompiledBenchmarks.from_dto(params.benchmarks),
+            source=params.source,
+            token=token,
+        ),
+    )
+
+
+@urbanomic_router.post("/calculate_investment_attractiveness_functional_zones/compare")
+async def compare_investment_attractiveness_functional_zones(
+    request: Request,
+    params: Annotated[
+        InvestmentAttractivenessComparisonRequestDTO,
+        Depends(InvestmentAttractivenessComparisonRequestDTO),
+    ],
+    token: str = Depends(verify_token),
+):
+    """
+    Side-by-side land-use summaries of functional zones of several sources and years,
+    calculated concurrently over one territory calculation
+    """
+
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks)
+    combinations = await ComparisonService.combinations(
+        params.scenario_id,
+        [source.value for source in params.sources],
+        params.years,
+        token,
+    )
+    key = ResultCache.build_key(
+        "fzones_compare",
+        params.scenario_id,
+        benchmarks=benchmarks.digest,
+        combinations=combinations,
+        upstream=await ComparisonService.upstream_fingerprint(
+            params.scenario_id, combinations, token
+        ),
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: MemoryEstimator.guard(
+            lambda: ComparisonService.estimate(params.scenario_id, combinations, token),
+            lambda: calculation_admission.run(
+                token,
+                lambda: ComparisonService.run_comparison(
+                    params.scenario_id, benchmarks, combinations, token
+                ),
+            ),
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+    )
+
+
+@urbanomic_router.post("/calculate_investment_attractiveness_what_if")
+async def calculate_investment_attractiveness_what_if(
+    request: Request,
+    params: Annotated[
+        InvestmentAttractivenessWhatIfRequestDTO,
+        Depends(InvestmentAttractivenessWhatIfRequestDTO),
+    ],
+    token: str = Depends(verify_token),
+):
+    """
+    Metrics of edited, added and removed functional zones and the summary updated
+    from the functional zones result of the scenario
+    """
+
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks)
+    upstream = await InvestmentPotentialService.upstream_fingerprint(
+        params.scenario_id, token, with_zones=True, source=params.source
+    )
+    WhatIfService.check_baseline(
+        params.scenario_id, params.baseline, benchmarks, params.source, upstream
+    )
+    key = ResultCache.build_key(
+        "what_if",
+        params.scenario_id,
+        as_geojson=params.as_geojson,
+        benchmarks=benchmarks.digest,
+        source=params.source,
+        changes=[change.model_dump() for change in params.changes],
+        upstream=upstream,
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: MemoryEstimator.guard(
+            lambda: MemoryEstimator.scenario(
+                params.scenario_id, token, with_zones=True, source=params.source
+            ),
+            lambda: calculation_admission.run(
+                token,
+                lambda: WhatIfService.run_what_if(
+                    params.scenario_id,
+                    params.as_geojson,
+                    benchmarks,
+                    params.changes,
+                    upstream,
+                    source=params.source,
+                    token=token,
+                ),
+            ),
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+    )
+
+
+@urbanomic_router.post("/calculate_investment_attractiveness_sensitivity")
+async def calculate_investment_attractiveness_sensitivity(
+    request: Request,
+    params: Annotated[
+        InvestmentAttractivenessSensitivityRequestDTO,
+        Depends(InvestmentAttractivenessSensitivityRequestDTO),
+    ],
+    token: str = Depends(verify_token),
+):
+    """
+    Percentile bands of functional zone and land-use type metrics over samples of
+    benchmark fields drawn from the given distributions
+    """
+
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks)
+    key = ResultCache.build_key(
+        "sensitivity",
+        params.scenario_id,
+        benchmarks=benchmarks.digest,
+        source=params.source,
+        samples=params.samples,
+        seed=params.seed,
+        percentiles=params.percentiles,
+        distributions=[d.model_dump() for d in params.distributions],
+        upstream=await InvestmentPotentialService.upstream_fingerprint(
+            params.scenario_id, token, with_zones=True, source=params.source
+        ),
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: MemoryEstimator.guard(
+            lambda: MemoryEstimator.scenario(
+                params.scenario_id, token, with_zones=True, source=params.source
+            ),
+            lambda: calculation_admission.run(
+                token,
+                lambda: SensitivityService.run_sensitivity(
+                    params.scenario_id,
+                    benchmarks,
+                    params.distributions,
+                    params.samples,
+                    params.seed,
+                    params.percentiles,
+                    source=params.source,
+                    token=token,
+                ),
+            ),
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+    )
+
+
+@urbanomic_router.post("/calculate_investment_attractiveness_allocation")
+async def calculate_investment_attractiveness_allocation(
+    request: Request,
+    params: Annotated[
+        InvestmentAttractivenessAllocationRequestDTO,
+        Depends(InvestmentAttractivenessAllocationRequestDTO),
+    ],
+    token: str = Depends(verify_token),
+):
+    """
+    Best land-use type of every scenario functional zone by the given metric, with
+    the zones x land-use types metric matrix and optional area constraints
+    """
+
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks)
+    key = ResultCache.build_key(
+        "allocation",
+        params.scenario_id,
+        as_geojson=params.as_geojson,
+        metric=params.metric,
+        constraints=[c.model_dump() for c in params.constraints],
+        benchmarks=benchmarks.digest,
+        source=params.source,
+        upstream=await InvestmentPotentialService.upstream_fingerprint(
+            params.scenario_id, token, with_zones=True, source=params.source
+        ),
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: MemoryEstimator.guard(
+            lambda: MemoryEstimator.scenario(
+                params.scenario_id,
+                token,
+                with_zones=True,
+                source=params.source,
+                rows_factor=len(benchmarks.keys),
+            ),
+            lambda: calculation_admission.run(
+                token,
+                lambda: AllocationService.run_allocation(
+                    params.scenario_id,
+                    params.as_geojson,
+                    benchmarks,
+                    params.metric,
+                    params.constraints,
+                    source=params.source,
+                    token=token,
+                ),
+            ),
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+    )
+
+
+@urbanomic_router.post("/calculate_investment_attractiveness_aggregated")
+async def calculate_investment_attractiveness_aggregated(
+    request: Request,
+    params: Annotated[
+        InvestmentAttractivenessAggregationRequestDTO,
+        Depends(InvestmentAttractivenessAggregationRequestDTO),
+    ],
+    page: Annotated[ResultPageDto, Depends(ResultPageDto)],
+    token: str = Depends(verify_token),
+):
+    """
+    Per-zone metrics of scenario functional zones rolled up to a hexagonal or square
+    grid or dissolved by land-use type
+    """
+
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks)
+    key = ResultCache.build_key(
+        "aggregated",
+        params.scenario_id,
+        aggregation=params.aggregation,
+        cell_size=params.cell_size,
+        benchmarks=benchmarks.digest,
+        source=params.source,
+        year=params.year,
+        upstream=await InvestmentPotentialService.upstream_fingerprint(
+            params.scenario_id,
+            token,
+            with_zones=True,
+            source=params.source,
+            year=params.year,
+        ),
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: MemoryEstimator.guard(
+            lambda: MemoryEstimator.scenario(
+                params.scenario_id,
+                token,
+                with_zones=True,
+                source=params.source,
+                year=params.year,
+            ),
+            lambda: calculation_admission.run(
+                token,
+                lambda: AggregationService.run_aggregation(
+                    params.scenario_id,
+                    benchmarks,
+                    params.aggregation,
+                    params.cell_size,
+                    source=params.source,
+                    token=token,
+                    year=params.year,
+                ),
+            ),
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+        page_size=page.page_size,
+    )
 
 
 @urbanomic_router.post("/calculate_investment_attractiveness_coords")
 async def calculate_investment_attractiveness_by_coords(
+    request: Request,
     params: Annotated[
         InvestmentAttractivenessCoordsDto, Depends(InvestmentAttractivenessCoordsDto)
     ],
     token: str = Depends(verify_token),
 ):
-    benchmarks_dict: Dict[str, Dict[str, Any]] = params.benchmarks.model_dump()
-    result = await InvestmentPotentialService.run_investment_calculation_coords(
-        params.scenario_id, params.as_geojson, benchmarks_dict, params.geometry, token
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks)
+    key = ResultCache.build_key(
+        "coords",
+        params.scenario_id,
+        as_geojson=params.as_geojson,
+        benchmarks=benchmarks.digest,
+        geometry=params.geometry.as_geo_dict(),
+        upstream=await InvestmentPotentialService.upstream_fingerprint(
+            params.scenario_id, token
+        ),
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: MemoryEstimator.guard(
+            lambda: MemoryEstimator.coords(params.scenario_id, params.geometry, token),
+            lambda: calculation_admission.run(
+                token,
+                lambda: InvestmentPotentialService.run_investment_calculation_coords(
+                    params.scenario_id,
+                    params.as_geojson,
+                    benchmarks,
+                    params.geometry,
+                    token,
+                ),
+            ),
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+    )
+
+
+@urbanomic_router.post("/calculate_investment_attractiveness_coords/upload")
+async def calculate_investment_attractiveness_by_layer(
+    request: Request,
+    params: Annotated[InvestmentAttractivenessLayerDto, Form()],
+    token: str = Depends(verify_token),
+):
+    benchmarks = CompiledBenchmarks.from_dto(params.benchmarks_dto())
+    data = await LayerUploadService.read_upload(params.layer)
+    key = ResultCache.build_key(
+        "layer",
+        params.scenario_id,
+        as_geojson=params.as_geojson,
+        benchmarks=benchmarks.digest,
+        layer=LayerUploadService.digest(data),
+        geometry_column=params.geometry_column,
+        crs=params.crs,
+        upstream=await InvestmentPotentialService.upstream_fingerprint(
+            params.scenario_id, token
+        ),
+    )
+    return await ResultCache.respond(
+        request,
+        key,
+        lambda: LayerUploadService.run_upload(
+            params.scenario_id,
+            params.as_geojson,
+            benchmarks,
+            data,
+            params.geometry_column,
+            params.crs,
+            token,
+        ),
+        lambda: UrbanAPIGateway.check_scenario_access(params.scenario_id, token),
+    )
+
+
+@urbanomic_router.get("/stored_results/{scenario_id}")
+async def get_stored_results(
+    scenario_id: int,
+    kind: Optional[str] = None,
+    token: str = Depends(verify_token),
+):
+    """
+    Per-zone result sets of the scenario kept in the result store, newest first, with
+    their keys, feature counts, numeric metrics and bounding boxes
+    """
+
+    await UrbanAPIGateway.check_scenario_access(scenario_id, token)
+    return await StoredResultService.list_sets(scenario_id, kind)
+
+
+@urbanomic_router.get("/stored_results/{scenario_id}/zones")
+async def query_stored_result_zones(
+    request: Request,
+    scenario_id: int,
+    result: Optional[str] = Query(
+        None, description="Result set key, the newest set of the scenario by default"
+    ),
+    kind: Optional[str] = Query(None, description="Calculation kind of the newest set"),
+    bbox: Optional[str] = Query(
+        None,
+        description="minx,miny,maxx,maxy in EPSG:4326",
+        examples=["30.2,59.9,30.4,60.0"],
+    ),
+    zone_type_id: Optional[list[int]] = Query(None),
+    metric: Optional[str] = Query(None, examples=["ECON_NPV"]),
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+    limit: int = 1000,
+    cursor: Optional[str] = Query(
+        None, description="next_cursor of the previous page, filters must be repeated"
+    ),
+    token: str = Depends(verify_token),
+):
+    """
+    Page of stored zones of a calculated result as GeoJSON, filtered by bbox, zone type
+    and metric range through the result store spatial index, without recalculation
+    """
+
+    await UrbanAPIGateway.check_scenario_access(scenario_id, token)
+    payload = await StoredResultService.query_zones(
+        scenario_id,
+        result_key=result,
+        kind=kind,
+        bbox=bbox,
+        zone_type_ids=zone_type_id,
+        metric=metric,
+        min_value=min_value,
+        max_value=max_value,
+        limit=limit,
+        cursor=cursor,
+    )
+    return await payload.to_response(request)
+
+
+@urbanomic_router.get("/investment_tiles/{scenario_id}/{z}/{x}/{y}")
+async def get_investment_tile(
+    request: Request,
+    scenario_id: int,
+    z: int,
+    x: int,
+    y: int,
+    source: Optional[Source] = None,
+    year: Optional[int] = None,
+    token: str = Depends(verify_token),
+):
+    """
+    Mapbox Vector Tile with per-zone investment metrics of scenario functional zones
+    calculated with default benchmarks
+    """
+
+    await UrbanAPIGateway.check_scenario_access(scenario_id, token)
+    payload = await VectorTileService.get_tile(
+        scenario_id,
+        z,
+        x,
+        y,
+        source=source.value if source else None,
+        year=year,
+        token=token,
+    )
+    if payload is None:
+        return Response(status_code=204)
+    return await payload.to_response(
+        request, headers={"Cache-Control": "private, max-age=300"}
     )
-    return result
 
 
 @urbanomic_router.get("/get_benchmarks_defaults")
-async def get_benchmarks_defaults():
-    benchmarks_dict = {**residential_demo, **non_residential_demo}
-    return benchmarks_dict
+async def get_benchmarks_defaults(request: Request):
+    return await DEFAULT_BENCHMARKS_PAYLOAD.to_response(
+        request,
+        headers={"Cache-Control": DEFAULT_BENCHMARKS_CACHE_CONTROL},
+        conditional=True,
+    )
+
+
+@urbanomic_router.post("/notifications/scenario_change")
+async def notify_scenario_change(
+    notification: ScenarioChangeNotificationDTO,
+    background_tasks: BackgroundTasks,
+    _: str = Depends(verify_webhook_token),
+):
+    result = await CacheInvalidationService.invalidate(notification)
+    prewarm_scheduled = []
+    if notification.prewarm:
+        service_token = CacheInvalidationService.get_service_token()
+        if service_token:
+            for scenario_id in result["scenario_ids"]:
+                background_tasks.add_task(
+                    CacheInvalidationService.prewarm_scenario,
+                    scenario_id,
+                    service_token,
+                )
+            prewarm_scheduled = result["scenario_ids"]
+        else:
+            logger.warning(
+                "Pre-warming requested, but URBAN_API_SERVICE_TOKEN is not set"
+            )
+    result["prewarm_scheduled"] = prewarm_scheduled
+    return result